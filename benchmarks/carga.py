@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routers.vigia as vigia  # noqa: E402
+import services.openai_assistant as openai_assistant  # noqa: E402
+import services.motor_evaluacion as motor_evaluacion  # noqa: E402
+from benchmarks.memoria_mongo import MemoriaDatabase  # noqa: E402
+from benchmarks.mock_openai import MockOpenAIConfig, crear_mock_openai  # noqa: E402
+from services.eventos import EVENTO_COMPLETADO  # noqa: E402
+from services.http_client import init_http_client, close_http_client  # noqa: E402
+from services.logs import configurar_logs  # noqa: E402
+
+# Benchmark de carga de extremo a extremo: POST /vigia/solicitud -> cola de jobs -> tres asistentes
+# contra el servidor mock de OpenAI, con MongoDB en memoria. Reporta p50/p95/p99 del tiempo total
+# por solicitud, peticiones por segundo y RSS máximo del proceso.
+
+DIMENSIONES = ["Ambiental", "Social", "Económica y Gobernanza"]
+ENCABEZADOS = [
+    "Dimensión", "Criterio", "Pregunta principal", "Opciones de respuesta", "Puntaje respuesta",
+    "Peso criterio", "Calificación", "Soportes aplicables", "Justificación", "Puntaje del criterio",
+    "Peso dimensión", "Observaciones",
+]
+
+
+def libro_cuestionario(preguntas: int, variante: int = 0) -> bytes:
+    """
+    Excel con la hoja Cuestionario (encabezado en la fila 4) repartiendo las preguntas entre dimensiones.
+    """
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Cuestionario"
+    ws["A1"] = "Cuestionario de sostenibilidad"
+    for col, encabezado in enumerate(ENCABEZADOS, start=1):
+        ws.cell(row=4, column=col, value=encabezado)
+    for n in range(preguntas):
+        fila = [
+            DIMENSIONES[n % len(DIMENSIONES)], f"Criterio {n}", f"¿Pregunta {n} del proveedor {variante}?",
+            "Sí / No / Parcial", 5, 0.1, n % 5, "Certificados", f"Justificación {n}", 0.5, 0.33, ""
+        ]
+        for col, valor in enumerate(fila, start=1):
+            ws.cell(row=5 + n, column=col, value=valor)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _percentiles(valores: List[float]) -> Dict[str, Optional[float]]:
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(max(valores), 3)}
+
+
+def _rss_pico_mb() -> float:
+    # ru_maxrss está en KB en Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def _esperar_completado(solicitud_id: str, timeout: float) -> bool:
+    cola = vigia.event_bus.subscribe(solicitud_id)
+    try:
+        doc = await vigia.db.Solicitud.find_one({"SolicitudID": solicitud_id}, {"EstadoGeneral": 1})
+        if doc and doc.get("EstadoGeneral") == "completado":
+            return True
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + timeout
+        while True:
+            evento = await asyncio.wait_for(cola.get(), timeout=max(limite - loop.time(), 0))
+            if evento["tipo"] == EVENTO_COMPLETADO:
+                return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        vigia.event_bus.unsubscribe(solicitud_id, cola)
+
+
+async def ejecutar_carga(
+    solicitudes: int = 20,
+    concurrencia: int = 10,
+    anexos: int = 2,
+    preguntas: int = 30,
+    workers: int = 6,
+    streaming: bool = True,
+    rpm: float = 1_000_000,
+    timeout: float = 300,
+    config_mock: Optional[MockOpenAIConfig] = None,
+    motor: Optional[str] = None,
+    anexos_texto: bool = False
+) -> Dict[str, Any]:
+    """
+    Ejecuta `solicitudes` solicitudes de extremo a extremo, `concurrencia` a la vez, y retorna las métricas.
+    Los anexos son PDF, o archivos de texto pequeños con `anexos_texto`; `motor` fija el motor de evaluación.
+    """
+    from main import app
+
+    mock_app = crear_mock_openai(config_mock)
+    database = MemoriaDatabase()
+    anteriores = (vigia.db, vigia.job_queue.workers, vigia.job_queue.poll_interval,
+                  openai_assistant.rate_limiter, openai_assistant.RUN_STREAMING, motor_evaluacion.MOTOR_EVALUACION)
+    for variable, valor in (
+        ("OPENAI_API_KEY", "sk-mock"),
+        ("OPENAI_ASSISTANT_ID_AMBIENTAL", "asst_ambiental"),
+        ("OPENAI_ASSISTANT_ID_SOCIAL", "asst_social"),
+        ("OPENAI_ASSISTANT_ID_ECONOMICA", "asst_economica"),
+    ):
+        os.environ.setdefault(variable, valor)
+
+    await close_http_client()
+    init_http_client(transport=httpx.ASGITransport(app=mock_app))
+    vigia.configurar_base_datos(database)
+    vigia.job_queue.workers = workers
+    vigia.job_queue.poll_interval = 0.05
+    # Las primitivas de asyncio del módulo quedan ligadas al loop de una ejecución anterior
+    vigia.upload_semaphore = asyncio.Semaphore(vigia.UPLOAD_CONCURRENCY)
+    openai_assistant.rate_limiter = openai_assistant.RateLimiter(rpm=rpm, tpm=rpm * 1000)
+    openai_assistant.RUN_STREAMING = streaming
+    motor_evaluacion.MOTOR_EVALUACION = motor or motor_evaluacion.MOTOR_EVALUACION
+
+    libros = [libro_cuestionario(preguntas, variante=n) for n in range(solicitudes)]
+    tiempos_post: List[float] = []
+    tiempos_total: List[float] = []
+    errores: List[str] = []
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def solicitud(cliente: httpx.AsyncClient, n: int):
+        async with semaforo:
+            inicio = time.perf_counter()
+            files = [("excel_file", (f"cuestionario_{n}.xlsx", libros[n], "application/octet-stream"))]
+            if anexos_texto:
+                files += [
+                    ("anexos", (f"anexo_{n}_{a}.txt", f"Soporte {a} de la solicitud {n}. ".encode() * 64, "text/plain"))
+                    for a in range(anexos)
+                ]
+            else:
+                files += [
+                    ("anexos", (f"anexo_{n}_{a}.pdf", f"%PDF anexo {a} de la solicitud {n}".encode() * 256, "application/pdf"))
+                    for a in range(anexos)
+                ]
+            respuesta = await cliente.post("/vigia/solicitud", data={
+                "CodigoProyecto": "BENCH", "ProveedorNombre": f"Proveedor {n}", "ProveedorNIT": str(900000000 + n),
+                "EstadoGeneral": "Nueva", "UsuarioSolicitante": f"usuario{n % 5}"
+            }, files=files)
+            tiempos_post.append(time.perf_counter() - inicio)
+            if respuesta.status_code != 200:
+                errores.append(f"POST {respuesta.status_code}: {respuesta.text[:200]}")
+                return
+            if await _esperar_completado(respuesta.json()["SolicitudID"], timeout):
+                tiempos_total.append(time.perf_counter() - inicio)
+            else:
+                errores.append(f"Timeout esperando la solicitud {n}")
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://vigia", timeout=timeout) as cliente:
+                inicio = time.perf_counter()
+                await asyncio.gather(*(solicitud(cliente, n) for n in range(solicitudes)))
+                duracion = time.perf_counter() - inicio
+            # La limpieza de archivos corre después del evento de completado: esperar a que termine
+            while (await vigia.job_queue.resumen())["en_proceso_local"]:
+                await asyncio.sleep(0.01)
+    finally:
+        await close_http_client()
+        (vigia.db, vigia.job_queue.workers, vigia.job_queue.poll_interval,
+         openai_assistant.rate_limiter, openai_assistant.RUN_STREAMING, motor_evaluacion.MOTOR_EVALUACION) = anteriores
+        vigia.configurar_base_datos(anteriores[0])
+
+    mock = mock_app.state.mock.resumen()
+    return {
+        "solicitudes": solicitudes,
+        "completadas": len(tiempos_total),
+        "errores": errores,
+        "duracion_s": round(duracion, 3),
+        "solicitudes_por_s": round(len(tiempos_total) / duracion, 3) if duracion else None,
+        "peticiones_openai_por_s": round(mock["peticiones"] / duracion, 1) if duracion else None,
+        "post_s": _percentiles(tiempos_post),
+        "total_s": _percentiles(tiempos_total),
+        "rss_pico_mb": _rss_pico_mb(),
+        "openai": mock,
+        "mongo_operaciones": database.operaciones(),
+    }
+
+
+def _imprimir(resultado: Dict[str, Any]):
+    print(f"Solicitudes completadas: {resultado['completadas']}/{resultado['solicitudes']} en {resultado['duracion_s']}s")
+    print(f"Throughput: {resultado['solicitudes_por_s']} solicitudes/s, {resultado['peticiones_openai_por_s']} peticiones OpenAI/s")
+    for nombre, clave in (("POST /vigia/solicitud", "post_s"), ("Extremo a extremo", "total_s")):
+        p = resultado[clave]
+        print(f"{nombre:<22} p50={p['p50']}s p95={p['p95']}s p99={p['p99']}s max={p['max']}s")
+    print(f"RSS máximo: {resultado['rss_pico_mb']} MB")
+    print(f"OpenAI mock: {resultado['openai']['peticiones']} peticiones, {resultado['openai']['respuestas_429']} 429, "
+          f"{resultado['openai']['fallos_inyectados']} fallos")
+    for error in resultado["errores"][:10]:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de VigIA contra un OpenAI simulado")
+    parser.add_argument("--solicitudes", type=int, default=20)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--anexos", type=int, default=2)
+    parser.add_argument("--preguntas", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=6, help="Workers de la cola de evaluaciones")
+    parser.add_argument("--sin-streaming", action="store_true", help="Usa consulta periódica de runs en vez de SSE")
+    parser.add_argument("--rpm", type=float, default=1_000_000, help="Límite inicial del rate limiter del cliente")
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--run-ms", type=float, default=200, help="Duración simulada de cada fase de un run")
+    parser.add_argument("--indexacion-ms", type=float, default=100)
+    parser.add_argument("--tasa-fallos", type=float, default=0.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--motor", choices=motor_evaluacion.MOTORES, help="Motor de evaluación (por defecto VIGIA_MOTOR_EVALUACION)")
+    parser.add_argument("--anexos-texto", action="store_true", help="Envía anexos .txt pequeños en vez de PDF")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="Ruta donde guardar el resultado en JSON")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs de la aplicación durante la carga")
+    args = parser.parse_args()
+
+    config = MockOpenAIConfig(
+        latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, duracion_run_ms=args.run_ms,
+        indexacion_ms=args.indexacion_ms, tasa_fallos=args.tasa_fallos, tasa_429=args.tasa_429, semilla=args.semilla
+    )
+    # main configura los logs al importarse: el nivel del benchmark se fija después
+    import main  # noqa: F401
+    configurar_logs(nivel="INFO" if args.verbose else "WARNING")
+    resultado = asyncio.run(ejecutar_carga(
+        solicitudes=args.solicitudes, concurrencia=args.concurrencia, anexos=args.anexos, preguntas=args.preguntas,
+        workers=args.workers, streaming=not args.sin_streaming, rpm=args.rpm, timeout=args.timeout, config_mock=config,
+        motor=args.motor, anexos_texto=args.anexos_texto
+    ))
+    _imprimir(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import asyncio
+import copy
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+# Stand-in en memoria de las colecciones de motor para benchmarks y pruebas de extremo a extremo.
+# Implementa solo lo que usan routers/vigia.py y services/*: filtros con igualdad, rutas punteadas,
+# $in/$nin/$ne/$lt/$lte/$gt/$gte/$exists/$or/$and, actualizaciones con $set/$inc/$setOnInsert y
+# proyecciones con expresiones ($cond, $isArray, $filter, $in, $ifNull, $eq).
+
+_FALTANTE = object()
+
+
+def _obtener(doc: Any, ruta: str) -> Any:
+    for parte in ruta.split("."):
+        if not isinstance(doc, dict) or parte not in doc:
+            return _FALTANTE
+        doc = doc[parte]
+    return doc
+
+
+def _asignar(doc: Dict[str, Any], ruta: str, valor: Any):
+    *padres, campo = ruta.split(".")
+    for parte in padres:
+        doc = doc.setdefault(parte, {})
+    doc[campo] = valor
+
+
+def _comparable(a: Any, b: Any) -> bool:
+    # Como en MongoDB, las comparaciones de rango solo aplican entre valores del mismo tipo
+    if a is _FALTANTE or a is None or b is None:
+        return False
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return True
+    return type(a) is type(b)
+
+
+def _cumple_operador(valor: Any, operador: str, esperado: Any) -> bool:
+    if operador == "$in":
+        return valor in esperado or (valor is _FALTANTE and None in esperado)
+    if operador == "$nin":
+        return not _cumple_operador(valor, "$in", esperado)
+    if operador == "$ne":
+        return not _coincide_valor(valor, esperado)
+    if operador == "$exists":
+        return (valor is not _FALTANTE) == bool(esperado)
+    if operador in ("$lt", "$lte", "$gt", "$gte"):
+        if not _comparable(valor, esperado):
+            return False
+        return {
+            "$lt": valor < esperado,
+            "$lte": valor <= esperado,
+            "$gt": valor > esperado,
+            "$gte": valor >= esperado,
+        }[operador]
+    raise NotImplementedError(f"Operador no soportado en memoria: {operador}")
+
+
+def _coincide_valor(valor: Any, esperado: Any) -> bool:
+    if valor is _FALTANTE:
+        return esperado is None
+    return valor == esperado
+
+
+def coincide(doc: Dict[str, Any], filtro: Dict[str, Any]) -> bool:
+    for clave, esperado in filtro.items():
+        if clave == "$or":
+            if not any(coincide(doc, f) for f in esperado):
+                return False
+            continue
+        if clave == "$and":
+            if not all(coincide(doc, f) for f in esperado):
+                return False
+            continue
+        valor = _obtener(doc, clave)
+        if isinstance(esperado, dict) and esperado and all(k.startswith("$") for k in esperado):
+            if not all(_cumple_operador(valor, op, arg) for op, arg in esperado.items()):
+                return False
+        elif not _coincide_valor(valor, esperado):
+            return False
+    return True
+
+
+def evaluar(doc: Dict[str, Any], expresion: Any, variables: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Evalúa una expresión de agregación: rutas "$campo", variables "$$nombre" y los operadores
+    que usan las proyecciones de la aplicación.
+    """
+    variables = variables or {}
+    if isinstance(expresion, str) and expresion.startswith("$$"):
+        nombre, _, ruta = expresion[2:].partition(".")
+        valor = variables.get(nombre, _FALTANTE)
+        valor = _obtener(valor, ruta) if ruta and valor is not _FALTANTE else valor
+        return None if valor is _FALTANTE else valor
+    if isinstance(expresion, str) and expresion.startswith("$"):
+        valor = _obtener(doc, expresion[1:])
+        return None if valor is _FALTANTE else valor
+    if isinstance(expresion, list):
+        return [evaluar(doc, e, variables) for e in expresion]
+    if not isinstance(expresion, dict):
+        return expresion
+    if len(expresion) == 1 and next(iter(expresion)).startswith("$"):
+        (operador, argumento), = expresion.items()
+        if operador == "$filter":
+            entrada = evaluar(doc, argumento["input"], variables)
+            nombre = argumento.get("as", "this")
+            if entrada is None:
+                return None
+            return [e for e in entrada if evaluar(doc, argumento["cond"], {**variables, nombre: e})]
+        if operador == "$cond":
+            condicion, si, no = argumento if isinstance(argumento, list) else (argumento["if"], argumento["then"], argumento["else"])
+            return evaluar(doc, si if evaluar(doc, condicion, variables) else no, variables)
+        valores = evaluar(doc, argumento, variables)
+        if operador == "$isArray":
+            return isinstance(valores[0] if isinstance(argumento, list) else valores, list)
+        if operador == "$in":
+            return valores[0] in valores[1]
+        if operador == "$eq":
+            return valores[0] == valores[1]
+        if operador == "$ifNull":
+            return next((v for v in valores if v is not None), None)
+        raise NotImplementedError(f"Expresión no soportada en memoria: {operador}")
+    return {k: evaluar(doc, v, variables) for k, v in expresion.items()}
+
+
+def _proyectar(doc: Dict[str, Any], proyeccion: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not proyeccion:
+        return doc
+    incluir = {k for k, v in proyeccion.items() if v and k != "_id"}
+    if not incluir:
+        return {k: v for k, v in doc.items() if k not in proyeccion or proyeccion[k]}
+    resultado = {"_id": doc["_id"]} if proyeccion.get("_id", 1) and "_id" in doc else {}
+    for ruta in incluir:
+        if isinstance(proyeccion[ruta], (dict, str)):
+            _asignar(resultado, ruta, evaluar(doc, proyeccion[ruta]))
+            continue
+        valor = _obtener(doc, ruta)
+        if valor is not _FALTANTE:
+            _asignar(resultado, ruta, valor)
+    return resultado
+
+
+def _clave_orden(valor: Any) -> Tuple[int, Any]:
+    if valor is _FALTANTE or valor is None:
+        return (0, 0)
+    if isinstance(valor, (int, float)):
+        return (1, valor)
+    if isinstance(valor, str):
+        return (2, valor)
+    if isinstance(valor, ObjectId):
+        return (3, valor)
+    if isinstance(valor, datetime):
+        return (4, valor)
+    return (5, str(valor))
+
+
+def _ordenar(docs: List[Dict[str, Any]], orden) -> List[Dict[str, Any]]:
+    if isinstance(orden, str):
+        orden = [(orden, 1)]
+    for campo, direccion in reversed(list(orden or [])):
+        docs = sorted(docs, key=lambda d: _clave_orden(_obtener(d, campo)), reverse=direccion < 0)
+    return docs
+
+
+def _aplicar_update(doc: Dict[str, Any], update: Dict[str, Any], insercion: bool):
+    for operador, campos in update.items():
+        if operador == "$setOnInsert" and not insercion:
+            continue
+        for ruta, valor in campos.items():
+            if operador in ("$set", "$setOnInsert"):
+                _asignar(doc, ruta, copy.deepcopy(valor))
+            elif operador == "$inc":
+                actual = _obtener(doc, ruta)
+                _asignar(doc, ruta, (0 if actual is _FALTANTE else actual) + valor)
+            else:
+                raise NotImplementedError(f"Actualización no soportada en memoria: {operador}")
+
+
+class _Resultado:
+    def __init__(self, **valores):
+        self.__dict__.update(valores)
+
+
+class MemoriaCursor:
+    def __init__(self, docs: List[Dict[str, Any]], proyeccion: Optional[Dict[str, Any]]):
+        self._docs = docs
+        self._proyeccion = proyeccion
+        self._limite = 0
+
+    def sort(self, orden, direccion: Optional[int] = None):
+        self._docs = _ordenar(self._docs, [(orden, direccion or 1)] if isinstance(orden, str) else orden)
+        return self
+
+    def limit(self, n: int):
+        self._limite = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def _resultado(self) -> List[Dict[str, Any]]:
+        docs = self._docs[:self._limite] if self._limite else self._docs
+        return [_proyectar(d, self._proyeccion) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs = self._resultado()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        self._iter = iter(self._resultado())
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoriaAggregateCursor(MemoriaCursor):
+    def __init__(self, docs: List[Dict[str, Any]]):
+        super().__init__(docs, None)
+
+
+class MemoriaCollection:
+    """
+    Colección en memoria con la interfaz asíncrona de motor que usa la aplicación.
+    Cada operación cede el event loop una vez, como lo haría una llamada de red.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+        self.operaciones = 0
+
+    async def _turno(self):
+        self.operaciones += 1
+        await asyncio.sleep(0)
+
+    def _buscar(self, filtro: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [d for d in self.docs.values() if coincide(d, filtro or {})]
+
+    async def create_index(self, *args, **kwargs) -> str:
+        return "memoria"
+
+    async def insert_one(self, doc: Dict[str, Any]):
+        await self._turno()
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self.docs:
+            raise ValueError(f"_id duplicado: {doc['_id']}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return _Resultado(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        await self._turno()
+        ids = []
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = copy.deepcopy(doc)
+            ids.append(doc["_id"])
+        return _Resultado(inserted_ids=ids)
+
+    async def find_one(self, filtro: Optional[Dict[str, Any]] = None, proyeccion: Optional[Dict[str, Any]] = None, **kwargs):
+        await self._turno()
+        docs = _ordenar(self._buscar(filtro), kwargs.get("sort"))
+        return _proyectar(docs[0], proyeccion or kwargs.get("projection")) if docs else None
+
+    def find(self, filtro: Optional[Dict[str, Any]] = None, proyeccion: Optional[Dict[str, Any]] = None, **kwargs) -> MemoriaCursor:
+        self.operaciones += 1
+        return MemoriaCursor(self._buscar(filtro), proyeccion or kwargs.get("projection"))
+
+    def _upsert(self, filtro: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+        doc = {k: v for k, v in filtro.items() if not k.startswith("$") and not isinstance(v, dict)}
+        _aplicar_update(doc, update, insercion=True)
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = doc
+        return doc
+
+    async def find_one_and_update(
+        self,
+        filtro: Dict[str, Any],
+        update: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort=None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE
+    ):
+        await self._turno()
+        docs = _ordenar(self._buscar(filtro), sort)
+        if not docs:
+            if not upsert:
+                return None
+            doc = self._upsert(filtro, update)
+            return _proyectar(doc, projection) if return_document == ReturnDocument.AFTER else None
+        doc = docs[0]
+        antes = _proyectar(doc, projection)
+        _aplicar_update(doc, update, insercion=False)
+        return _proyectar(doc, projection) if return_document == ReturnDocument.AFTER else antes
+
+    async def find_one_and_delete(self, filtro: Dict[str, Any], **kwargs):
+        await self._turno()
+        docs = self._buscar(filtro)
+        if not docs:
+            return None
+        return self.docs.pop(docs[0]["_id"])
+
+    async def update_one(self, filtro: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        await self._turno()
+        docs = self._buscar(filtro)
+        if docs:
+            _aplicar_update(docs[0], update, insercion=False)
+            return _Resultado(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            return _Resultado(matched_count=0, modified_count=0, upserted_id=self._upsert(filtro, update)["_id"])
+        return _Resultado(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, filtro: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        await self._turno()
+        docs = self._buscar(filtro)
+        for doc in docs:
+            _aplicar_update(doc, update, insercion=False)
+        return _Resultado(matched_count=len(docs), modified_count=len(docs))
+
+    async def replace_one(self, filtro: Dict[str, Any], reemplazo: Dict[str, Any], upsert: bool = False):
+        await self._turno()
+        docs = self._buscar(filtro)
+        if not docs and not upsert:
+            return _Resultado(matched_count=0, modified_count=0)
+        nuevo = copy.deepcopy(reemplazo)
+        nuevo["_id"] = docs[0]["_id"] if docs else filtro.get("_id", ObjectId())
+        self.docs[nuevo["_id"]] = nuevo
+        return _Resultado(matched_count=1, modified_count=1)
+
+    async def delete_one(self, filtro: Dict[str, Any]):
+        await self._turno()
+        docs = self._buscar(filtro)
+        if docs:
+            del self.docs[docs[0]["_id"]]
+        return _Resultado(deleted_count=len(docs[:1]))
+
+    async def delete_many(self, filtro: Dict[str, Any]):
+        await self._turno()
+        docs = self._buscar(filtro)
+        for doc in docs:
+            del self.docs[doc["_id"]]
+        return _Resultado(deleted_count=len(docs))
+
+    async def distinct(self, campo: str, filtro: Optional[Dict[str, Any]] = None) -> List[Any]:
+        await self._turno()
+        valores = []
+        for doc in self._buscar(filtro):
+            valor = _obtener(doc, campo)
+            if valor is not _FALTANTE and valor not in valores:
+                valores.append(valor)
+        return valores
+
+    async def bulk_write(self, operaciones: List[UpdateOne], ordered: bool = True):
+        await self._turno()
+        upserted = 0
+        for operacion in operaciones:
+            doc = operacion._doc
+            filtro = operacion._filter
+            docs = self._buscar(filtro)
+            if docs:
+                _aplicar_update(docs[0], doc, insercion=False)
+            elif operacion._upsert:
+                self._upsert(filtro, doc)
+                upserted += 1
+        return _Resultado(upserted_count=upserted)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> MemoriaAggregateCursor:
+        """
+        Soporta $match y $group con acumuladores $sum (las agregaciones de los endpoints de diagnóstico).
+        """
+        self.operaciones += 1
+        docs = list(self.docs.values())
+        for etapa in pipeline:
+            if "$match" in etapa:
+                docs = [d for d in docs if coincide(d, etapa["$match"])]
+            elif "$group" in etapa:
+                docs = self._agrupar(docs, etapa["$group"])
+            else:
+                raise NotImplementedError(f"Etapa no soportada en memoria: {list(etapa)}")
+        return MemoriaAggregateCursor(docs)
+
+    def _agrupar(self, docs: List[Dict[str, Any]], grupo: Dict[str, Any]) -> List[Dict[str, Any]]:
+        grupos: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            clave = evaluar(doc, grupo["_id"])
+            fila = grupos.setdefault(repr(clave), {"_id": clave})
+            for campo, acumulador in grupo.items():
+                if campo == "_id":
+                    continue
+                (operador, argumento), = acumulador.items()
+                if operador != "$sum":
+                    raise NotImplementedError(f"Acumulador no soportado en memoria: {operador}")
+                fila[campo] = fila.get(campo, 0) + evaluar(doc, argumento)
+        return list(grupos.values())
+
+
+class MemoriaDatabase:
+    """
+    Base de datos en memoria: las colecciones se crean al primer acceso, como en motor.
+    """
+
+    def __init__(self):
+        self._colecciones: Dict[str, MemoriaCollection] = {}
+
+    def __getattr__(self, nombre: str) -> MemoriaCollection:
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return self[nombre]
+
+    def __getitem__(self, nombre: str) -> MemoriaCollection:
+        if nombre not in self._colecciones:
+            self._colecciones[nombre] = MemoriaCollection(nombre)
+        return self._colecciones[nombre]
+
+    def operaciones(self) -> Dict[str, int]:
+        return {nombre: c.operaciones for nombre, c in self._colecciones.items()}
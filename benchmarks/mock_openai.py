@@ -0,0 +1,306 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Servidor local que imita los endpoints de OpenAI que usa OpenAIAssistant (assistants, threads,
+# messages, runs con y sin streaming, submit_tool_outputs, chat/completions, files y vector_stores),
+# con latencia, fallos y respuestas 429 configurables. Se monta con httpx.ASGITransport, sin red ni costo de API.
+
+
+class MockOpenAIConfig:
+    def __init__(
+        self,
+        latencia_ms: float = 50,
+        jitter_ms: float = 20,
+        duracion_run_ms: float = 200,
+        indexacion_ms: float = 100,
+        tasa_fallos: float = 0.0,
+        tasa_429: float = 0.0,
+        retry_after_ms: float = 200,
+        limite_requests: int = 1_000_000,
+        limite_tokens: int = 1_000_000_000,
+        semilla: Optional[int] = None
+    ):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.duracion_run_ms = duracion_run_ms
+        self.indexacion_ms = indexacion_ms
+        self.tasa_fallos = tasa_fallos
+        self.tasa_429 = tasa_429
+        self.retry_after_ms = retry_after_ms
+        self.limite_requests = limite_requests
+        self.limite_tokens = limite_tokens
+        self.random = random.Random(semilla)
+
+
+class MockOpenAIEstado:
+    def __init__(self):
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.vector_stores: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.peticiones = 0
+        self.respuestas_429 = 0
+        self.fallos = 0
+        self.por_ruta: Dict[str, int] = {}
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "peticiones": self.peticiones,
+            "respuestas_429": self.respuestas_429,
+            "fallos_inyectados": self.fallos,
+            "por_ruta": dict(sorted(self.por_ruta.items())),
+            "archivos_vivos": len(self.files),
+            "vector_stores_vivos": len(self.vector_stores),
+        }
+
+
+def _id(prefijo: str) -> str:
+    return f"{prefijo}_{ObjectId()}"
+
+
+def _ruta(request: Request) -> str:
+    # Agrupa los ids de la ruta para contar por endpoint
+    partes = [p if not ("_" in p and len(p) > 20) else "{id}" for p in request.url.path.split("/")]
+    return f"{request.method} {'/'.join(partes)}"
+
+
+def crear_mock_openai(config: Optional[MockOpenAIConfig] = None) -> FastAPI:
+    config = config or MockOpenAIConfig()
+    estado = MockOpenAIEstado()
+    app = FastAPI()
+    app.state.mock = estado
+    duracion_run = config.duracion_run_ms / 1000
+
+    @app.middleware("http")
+    async def inyectar(request: Request, call_next):
+        estado.peticiones += 1
+        ruta = _ruta(request)
+        estado.por_ruta[ruta] = estado.por_ruta.get(ruta, 0) + 1
+        latencia = max(config.latencia_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms), 0) / 1000
+        await asyncio.sleep(latencia)
+        sorteo = config.random.random()
+        if sorteo < config.tasa_429:
+            estado.respuestas_429 += 1
+            return JSONResponse(
+                {"error": {"type": "rate_limit_exceeded", "message": "Rate limit reached (mock)"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(config.retry_after_ms))}
+            )
+        if sorteo < config.tasa_429 + config.tasa_fallos:
+            estado.fallos += 1
+            return JSONResponse({"error": {"type": "server_error", "message": "Falla inyectada (mock)"}}, status_code=500)
+        response = await call_next(request)
+        response.headers["x-ratelimit-limit-requests"] = str(config.limite_requests)
+        response.headers["x-ratelimit-remaining-requests"] = str(config.limite_requests - 1)
+        response.headers["x-ratelimit-limit-tokens"] = str(config.limite_tokens)
+        response.headers["x-ratelimit-remaining-tokens"] = str(config.limite_tokens - 1)
+        return response
+
+    # --- Files ---
+    @app.post("/v1/files")
+    async def subir_archivo(file: UploadFile = File(...), purpose: str = Form(...)):
+        contenido = await file.read()
+        archivo = {
+            "id": _id("file"), "object": "file", "bytes": len(contenido), "filename": file.filename,
+            "purpose": purpose, "created_at": int(time.time())
+        }
+        estado.files[archivo["id"]] = archivo
+        return archivo
+
+    @app.get("/v1/files")
+    async def listar_archivos(limit: int = 10000, after: Optional[str] = None, purpose: Optional[str] = None):
+        archivos = [a for a in estado.files.values() if not purpose or a["purpose"] == purpose]
+        if after:
+            ids = [a["id"] for a in archivos]
+            archivos = archivos[ids.index(after) + 1:] if after in ids else []
+        pagina = archivos[:limit]
+        return {
+            "object": "list", "data": pagina, "has_more": len(archivos) > limit,
+            "first_id": pagina[0]["id"] if pagina else None, "last_id": pagina[-1]["id"] if pagina else None
+        }
+
+    @app.get("/v1/files/{file_id}")
+    async def obtener_archivo(file_id: str):
+        if file_id not in estado.files:
+            return JSONResponse({"error": {"message": "No such File object"}}, status_code=404)
+        return estado.files[file_id]
+
+    @app.delete("/v1/files/{file_id}")
+    async def eliminar_archivo(file_id: str):
+        if estado.files.pop(file_id, None) is None:
+            return JSONResponse({"error": {"message": "No such File object"}}, status_code=404)
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    # --- Vector stores ---
+    def _vector_store(vector_store_id: str) -> Optional[Dict[str, Any]]:
+        vector_store = estado.vector_stores.get(vector_store_id)
+        if vector_store is None:
+            return None
+        listo = time.monotonic() - vector_store["_creado"] >= config.indexacion_ms / 1000
+        total = len(vector_store["file_ids"])
+        return {
+            "id": vector_store_id, "object": "vector_store", "name": vector_store["name"],
+            "status": "completed" if listo else "in_progress",
+            "file_counts": {"in_progress": 0 if listo else total, "completed": total if listo else 0,
+                            "failed": 0, "cancelled": 0, "total": total}
+        }
+
+    @app.post("/v1/vector_stores")
+    async def crear_vector_store(request: Request):
+        cuerpo = await request.json()
+        vector_store_id = _id("vs")
+        estado.vector_stores[vector_store_id] = {
+            "name": cuerpo.get("name"), "file_ids": cuerpo.get("file_ids", []), "_creado": time.monotonic()
+        }
+        return _vector_store(vector_store_id)
+
+    @app.get("/v1/vector_stores/{vector_store_id}")
+    async def consultar_vector_store(vector_store_id: str):
+        vector_store = _vector_store(vector_store_id)
+        if vector_store is None:
+            return JSONResponse({"error": {"message": "No such vector store"}}, status_code=404)
+        return vector_store
+
+    @app.delete("/v1/vector_stores/{vector_store_id}")
+    async def eliminar_vector_store(vector_store_id: str):
+        if estado.vector_stores.pop(vector_store_id, None) is None:
+            return JSONResponse({"error": {"message": "No such vector store"}}, status_code=404)
+        return {"id": vector_store_id, "object": "vector_store.deleted", "deleted": True}
+
+    # --- Threads y mensajes ---
+    @app.post("/v1/threads")
+    async def crear_thread():
+        thread_id = _id("thread")
+        estado.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time())}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def crear_mensaje(thread_id: str, request: Request):
+        cuerpo = await request.json()
+        mensaje = {"id": _id("msg"), "object": "thread.message", "role": cuerpo.get("role", "user"), "content": cuerpo.get("content")}
+        estado.threads.setdefault(thread_id, []).append(mensaje)
+        return mensaje
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def listar_mensajes(thread_id: str):
+        return {"object": "list", "data": list(reversed(estado.threads.get(thread_id, [])))}
+
+    # --- Runs ---
+    def _run(run_id: str) -> Dict[str, Any]:
+        """
+        Estado del run según el tiempo transcurrido: in_progress -> requires_action, y tras
+        submit_tool_outputs in_progress -> completed (agregando la respuesta del asistente).
+        """
+        run = estado.runs[run_id]
+        en_curso = time.monotonic() - run["_desde"] < duracion_run
+        cuerpo = {"id": run_id, "object": "thread.run", "thread_id": run["thread_id"], "assistant_id": run["assistant_id"]}
+        if en_curso:
+            return {**cuerpo, "status": "in_progress"}
+        if run["_fase"] == "accion":
+            return {**cuerpo, "status": "requires_action", "required_action": {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": [{
+                    "id": run["_tool_call_id"], "type": "function",
+                    "function": {"name": "registrar_evaluacion", "arguments": json.dumps(run["_argumentos"], ensure_ascii=False)}
+                }]}
+            }}
+        if not run["_respondido"]:
+            run["_respondido"] = True
+            estado.threads.setdefault(run["thread_id"], []).append({
+                "id": _id("msg"), "object": "thread.message", "role": "assistant",
+                "content": [{"type": "text", "text": {"value": f"Evaluación registrada ({run['assistant_id']}).", "annotations": []}}]
+            })
+        return {**cuerpo, "status": "completed"}
+
+    def _evento(nombre: str, datos: Any) -> str:
+        return f"event: {nombre}\ndata: {json.dumps(datos) if not isinstance(datos, str) else datos}\n\n"
+
+    async def _stream(run_id: str, creado: bool):
+        if creado:
+            yield _evento("thread.run.created", {**_run(run_id), "status": "queued"})
+        await asyncio.sleep(duracion_run)
+        run = _run(run_id)
+        yield _evento(f"thread.run.{run['status']}", run)
+        yield _evento("done", "[DONE]")
+
+    def _argumentos(assistant_id: str) -> Dict[str, Any]:
+        puntaje = round(config.random.uniform(0, 100), 2)
+        return {
+            "assistant_id": assistant_id,
+            "puntaje": puntaje,
+            "nivel_riesgo": "alto" if puntaje < 40 else "medio" if puntaje < 70 else "bajo",
+            "observaciones": "Evaluación generada por el servidor mock."
+        }
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def crear_run(thread_id: str, request: Request):
+        cuerpo = await request.json()
+        run_id = _id("run")
+        estado.runs[run_id] = {
+            "thread_id": thread_id, "assistant_id": cuerpo.get("assistant_id"), "_fase": "accion",
+            "_desde": time.monotonic(), "_respondido": False, "_tool_call_id": _id("call"),
+            "_argumentos": _argumentos(cuerpo.get("assistant_id"))
+        }
+        if cuerpo.get("stream"):
+            return StreamingResponse(_stream(run_id, creado=True), media_type="text/event-stream")
+        return {**_run(run_id), "status": "queued"}
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def consultar_run(thread_id: str, run_id: str):
+        if run_id not in estado.runs:
+            return JSONResponse({"error": {"message": "No such run"}}, status_code=404)
+        return _run(run_id)
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def enviar_tool_outputs(thread_id: str, run_id: str, request: Request):
+        cuerpo = await request.json()
+        run = estado.runs.get(run_id)
+        if run is None or _run(run_id)["status"] != "requires_action":
+            return JSONResponse({"error": {"message": "Run is not in requires_action"}}, status_code=400)
+        run["_fase"] = "final"
+        run["_desde"] = time.monotonic()
+        if cuerpo.get("stream"):
+            return StreamingResponse(_stream(run_id, creado=False), media_type="text/event-stream")
+        return _run(run_id)
+
+    # --- Assistants y chat completions ---
+    @app.get("/v1/assistants/{assistant_id}")
+    async def consultar_assistant(assistant_id: str):
+        return {
+            "id": assistant_id, "object": "assistant", "model": f"mock-{assistant_id}",
+            "instructions": "Evalúa la dimensión del proveedor con el cuestionario y los anexos.",
+            "tools": [{"type": "function", "function": {"name": "registrar_evaluacion", "parameters": {
+                "type": "object",
+                "properties": {
+                    "puntaje": {"type": "number"}, "nivel_riesgo": {"type": "string"}, "observaciones": {"type": "string"}
+                },
+                "required": ["puntaje", "nivel_riesgo", "observaciones"]
+            }}}]
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completar(request: Request):
+        cuerpo = await request.json()
+        # Una sola generación: el equivalente a la fase de acción de un run
+        await asyncio.sleep(duracion_run)
+        assistant_id = cuerpo.get("model", "").removeprefix("mock-")
+        contenido = {"argumentos": _argumentos(assistant_id), "respuesta": f"Evaluación registrada ({assistant_id})."}
+        return {
+            "id": _id("chatcmpl"), "object": "chat.completion", "model": cuerpo.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": json.dumps(contenido, ensure_ascii=False), "refusal": None
+            }}]
+        }
+
+    @app.get("/mock/estado")
+    async def resumen():
+        return estado.resumen()
+
+    return app
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routers.vigia as vigia  # noqa: E402
+from benchmarks.memoria_mongo import MemoriaDatabase  # noqa: E402
+from services.compresion import comprimir, brotli  # noqa: E402
+from services.serializacion import json_dumps_bytes  # noqa: E402
+
+# Benchmark de serialización y compresión de una SolicitudModel completa (cuestionario y las tres
+# evaluaciones): CPU por operación de cada codificador y bytes en el cable con y sin compresión,
+# directamente y a través de GET /vigia/solicitud/{id}.
+
+
+def solicitud_pesada(preguntas: int = 150, llamadas: int = 5) -> vigia.SolicitudModel:
+    grupos = [
+        {
+            "dimension": dimension,
+            "items": [
+                {"criterio": f"Criterio {n}", "pregunta": f"¿El proveedor cumple el requisito {n} de {dimension}?",
+                 "opciones_de_respuesta": "Sí / No / Parcial", "calificacion": n % 5, "justificacion": "Certificado vigente " * 5}
+                for n in range(preguntas // 3)
+            ],
+            "tipos": vigia.tipos_dimension(dimension),
+        }
+        for dimension in ("Ambiental", "Social", "Económica y Gobernanza")
+    ]
+
+    def evaluacion(dimension: str) -> List[Dict[str, Any]]:
+        argumentos = {
+            "dimension": dimension,
+            "hallazgos": [{"criterio": f"Criterio {n}", "cumple": n % 2 == 0, "observacion": "Se revisó el soporte anexo. " * 8}
+                          for n in range(preguntas // 3)],
+        }
+        return [{
+            "required_action": {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+                {"id": f"call_{n}", "type": "function", "function": {"name": "registrar_evaluacion", "arguments": json.dumps(argumentos, ensure_ascii=False)}}
+                for n in range(llamadas)
+            ]}},
+            "assistant_response": "Evaluación registrada. " * 40,
+        }]
+
+    return vigia.SolicitudModel(
+        CodigoProyecto="BENCH", ProveedorNombre="Proveedor de prueba", ProveedorNIT="900123456",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="completado", UsuarioSolicitante="benchmark",
+        Anexos=[{"id": f"file_{n}", "filename": f"anexo_{n}.pdf", "sha256": "0" * 64} for n in range(5)],
+        Estado={"ambiental": "done", "social": "done", "economica": "done"},
+        Cuestionario=grupos,
+        EvaluacionAmbiental=evaluacion("Ambiental"), EvaluacionSocial=evaluacion("Social"),
+        EvaluacionEconomica=evaluacion("Económica"),
+        RespuestaAmbiental="Evaluación registrada.", RespuestaSocial="Evaluación registrada.",
+        RespuestaEconomica="Evaluación registrada.",
+    )
+
+
+def _medir(funcion: Callable[[], bytes], repeticiones: int) -> Dict[str, Any]:
+    resultado = funcion()
+    inicio = time.process_time()
+    for _ in range(repeticiones):
+        funcion()
+    cpu_ms = (time.process_time() - inicio) * 1000 / repeticiones
+    return {"bytes": len(resultado), "cpu_ms": round(cpu_ms, 3)}
+
+
+def medir_codificadores(solicitud: vigia.SolicitudModel, repeticiones: int) -> Dict[str, Dict[str, Any]]:
+    cuerpo = solicitud.model_dump_json().encode("utf-8")
+    resultados = {
+        # Ruta anterior: dict compatible con JSON y json.dumps de la biblioteca estándar
+        "json (jsonable_encoder + json.dumps)": _medir(
+            lambda: json.dumps(jsonable_encoder(solicitud), ensure_ascii=False).encode("utf-8"), repeticiones),
+        # Ruta de FastAPI con response_model: núcleo de Pydantic directo a bytes
+        "pydantic (model_dump_json)": _medir(lambda: solicitud.model_dump_json().encode("utf-8"), repeticiones),
+        "orjson (model_dump + orjson)": _medir(lambda: json_dumps_bytes(solicitud.model_dump()), repeticiones),
+        "gzip": _medir(lambda: comprimir(cuerpo, "gzip"), repeticiones),
+    }
+    if brotli is not None:
+        resultados["brotli"] = _medir(lambda: comprimir(cuerpo, "br"), repeticiones)
+    return resultados
+
+
+async def medir_endpoint(solicitud: vigia.SolicitudModel, repeticiones: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Bytes en el cable y tiempo de GET /vigia/solicitud/{id} por Accept-Encoding.
+    """
+    from main import app
+
+    database = MemoriaDatabase()
+    anterior = vigia.db
+    vigia.configurar_base_datos(database)
+    await database.Solicitud.insert_one(solicitud.model_dump())
+    codificaciones = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+    resultados = {}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://vigia") as cliente:
+            for codificacion in codificaciones:
+                tamano = 0
+                inicio = time.perf_counter()
+                for _ in range(repeticiones):
+                    async with cliente.stream("GET", f"/vigia/solicitud/{solicitud.SolicitudID}",
+                                              headers={"Accept-Encoding": codificacion}) as respuesta:
+                        tamano = len(b"".join([bloque async for bloque in respuesta.aiter_raw()]))
+                resultados[codificacion] = {
+                    "bytes": tamano, "ms_por_peticion": round((time.perf_counter() - inicio) * 1000 / repeticiones, 3)
+                }
+    finally:
+        vigia.configurar_base_datos(anterior)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización y compresión de SolicitudModel")
+    parser.add_argument("--preguntas", type=int, default=150)
+    parser.add_argument("--llamadas", type=int, default=5, help="Tool calls por evaluación")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--json", help="Ruta donde guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    solicitud = solicitud_pesada(args.preguntas, args.llamadas)
+    resultado = {
+        "codificadores": medir_codificadores(solicitud, args.repeticiones),
+        "endpoint": asyncio.run(medir_endpoint(solicitud, max(args.repeticiones // 10, 1))),
+    }
+    print(f"{'Codificador':<38} {'bytes':>10} {'CPU ms/op':>10}")
+    for nombre, fila in resultado["codificadores"].items():
+        print(f"{nombre:<38} {fila['bytes']:>10} {fila['cpu_ms']:>10}")
+    print(f"\n{'GET /vigia/solicitud/{id}':<38} {'bytes':>10} {'ms/pet.':>10}")
+    for nombre, fila in resultado["endpoint"].items():
+        print(f"{'Accept-Encoding: ' + nombre:<38} {fila['bytes']:>10} {fila['ms_por_peticion']:>10}")
+    if brotli is None:
+        print("\nbrotli no está instalado: solo se mide gzip")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,50 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from models import MsgPayload
-from routers.vigia import router as vigia_router
+from routers.vigia import (
+    router as vigia_router, iniciar_workers_evaluacion, detener_workers_evaluacion, asegurar_indices,
+    iniciar_eventos, detener_eventos
+)
+from services.http_client import init_http_client, close_http_client
+from services.executor import init_executor, shutdown_executor
+from services.logs import configurar_logs
+from services.compresion import CompresionMiddleware, COMPRESION_HABILITADA
+from services.metricas import registro, CONTENT_TYPE
 from dotenv import load_dotenv
 load_dotenv()
-app = FastAPI()
+# Logs de la aplicación (VIGIA_LOG_LEVEL, VIGIA_LOG_POLL_LEVEL, VIGIA_LOG_FORMATO)
+configurar_logs()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool HTTP compartido por todas las instancias de OpenAIAssistant
+    init_http_client()
+    # Executor para el parseo de Excel/CSV fuera del event loop
+    init_executor()
+    # Índices de MongoDB en segundo plano para no bloquear el arranque
+    indices_task = None
+    if os.getenv("VIGIA_CREAR_INDICES", "true").lower() in ("1", "true", "yes"):
+        indices_task = asyncio.create_task(asegurar_indices())
+    # Workers de evaluación de este proceso (VIGIA_WORKERS, 0 para solo encolar)
+    iniciar_workers_evaluacion()
+    # Change stream de Solicitud para los eventos de progreso (VIGIA_EVENTOS_CHANGE_STREAM)
+    iniciar_eventos()
+    yield
+    if indices_task is not None:
+        indices_task.cancel()
+        await asyncio.gather(indices_task, return_exceptions=True)
+    await detener_eventos()
+    await detener_workers_evaluacion()
+    await close_http_client()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Habilitar CORS para todos los orígenes (puedes personalizar los parámetros)
 app.add_middleware(
@@ -14,6 +54,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compresión gzip/brotli de respuestas grandes (VIGIA_COMPRESION, VIGIA_COMPRESION_MINIMO)
+if COMPRESION_HABILITADA:
+    app.add_middleware(CompresionMiddleware)
 app.include_router(vigia_router)
 messages_list: dict[int, MsgPayload] = {}
 
@@ -23,6 +66,12 @@ def root() -> dict[str, str]:
     return {"message": "Hello"}
 
 
+# Métricas en formato de texto de Prometheus
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registro.exponer(), media_type=CONTENT_TYPE)
+
+
 # About page route
 @app.get("/about")
 def about() -> dict[str, str]:
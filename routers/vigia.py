@@ -1,18 +1,50 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from flask import json
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+import logging
 import os
 import asyncio
+import base64
+import time
+import zipfile
 import pandas as pd
 from io import BytesIO, StringIO
 from models import TipoAsistenteEnum
-from services.openai_assistant import OpenAIAssistant
+from services.openai_assistant import OpenAIAssistant, SHARED_VECTOR_STORE, RUN_TERMINAL_STATUSES, rate_limiter
+from services.http_client import http_pool_stats
+from services.job_queue import EvaluationJobQueue, CARRIL_BATCH, CARRIL_INTERACTIVO
+from services.eventos import EventBus, EVENTO_DIMENSION, EVENTO_COMPLETADO
+from services.janitor import FileJanitor
+from services.lotes import leer_manifiesto, abrir_miembro, copiar_a_temporal, ManifiestoError
+from services.upload_cache import UploadCache
+from services.evaluation_cache import EvaluationCache, clave_evaluacion, EVALUATION_CACHE_ENABLED
+from services.evaluation_store import EvaluationStore
+from services.puntaje import puntuar_solicitud, PROYECCION_PUNTAJE
+from services.motor_evaluacion import (
+    elegir_motor, motor_configurado, anexos_en_linea, MOTOR_ASSISTANTS, MOTOR_COMPLETIONS, FAST_PATH_MAX_BYTES
+)
+from services.anexo_textos import AnexoTextStore
+from services.cuestionario_parser import (
+    parsear_cuestionario_bytes, tipos_dimension, cuestionario_dimension, CAMPO_TIPOS, CAMPOS_EXCLUIR, CAMPOS_RENOMBRAR
+)
+from services.prompt_cuestionario import (
+    codificar_cuestionario, verificar_presupuesto, PROMPT_TOKEN_BUDGET, PresupuestoTokensExcedido
+)
+from services.executor import run_cpu
+from services.serializacion import json_dumps, json_loads, RespuestaJSON
+from services.metricas import medir, registro, FASE_SEGUNDOS, EVALUACION_SEGUNDOS, REINTENTOS, PROMPT_TOKENS
+from services.mongo_indexes import ensure_solicitud_indexes, explicar_consultas, ORDEN_LISTADO
 from dotenv import load_dotenv
 
+logger = logging.getLogger("vigia.router")
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -21,6 +53,40 @@ MONGO_URL = os.getenv("MONGO_URL")
 client = AsyncIOMotorClient(MONGO_URL)
 db = client["VigIAHackathon"]
 
+# Subidas de anexos concurrentes permitidas en el proceso
+UPLOAD_CONCURRENCY = int(os.getenv("VIGIA_UPLOAD_CONCURRENCY", "4"))
+upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+# Cola durable de evaluaciones (un job por solicitud y dimensión)
+job_queue = EvaluationJobQueue(db.EvaluacionJob)
+
+# Caché de anexos subidos, direccionada por SHA-256 del contenido
+upload_cache = UploadCache(db.ArchivoCache)
+
+# Limpieza periódica de archivos huérfanos en OpenAI
+file_janitor = FileJanitor()
+
+# Pub/sub de cambios de estado para el endpoint de eventos (SSE)
+event_bus = EventBus()
+
+# Caché de resultados de evaluación por asistente, dimensión y contenido
+evaluation_cache = EvaluationCache(db.EvaluacionCache)
+
+# Evaluaciones grandes guardadas fuera del documento de Solicitud
+evaluation_store = EvaluationStore(db.EvaluacionDetalle)
+
+# Texto de anexos pequeños para el motor completions, fuera del documento de Solicitud
+anexo_textos = AnexoTextStore(db.AnexoTexto)
+
+# Valores instantáneos expuestos en /metrics
+registro.gauge("vigia_jobs_en_proceso", "Jobs de evaluación en proceso en este proceso", lambda: job_queue.en_proceso)
+registro.gauge("vigia_eventos_suscriptores", "Clientes suscritos a eventos de progreso", lambda: event_bus.estado()["suscriptores"])
+registro.gauge("vigia_jobs_en_espera", "Jobs de evaluación pendientes por carril", lambda: job_queue.en_espera, etiqueta="carril")
+registro.gauge(
+    "vigia_jobs_espera_mas_antigua_seconds", "Segundos que lleva disponible el job pendiente más antiguo, por carril",
+    lambda: job_queue.espera_mas_antigua, etiqueta="carril"
+)
+
 # --- Modelos Pydantic ---
 class SolicitudModel(BaseModel):
     SolicitudID: Optional[str] = Field(default_factory=lambda: str(ObjectId()))
@@ -33,24 +99,121 @@ class SolicitudModel(BaseModel):
     FuenteExcelPath: Optional[str] = None
     Anexos: List[dict] = Field(default_factory=list)
     StorageFolderPath: Optional[str] = None
+    VectorStoreID: Optional[str] = None
+    LoteID: Optional[str] = None
     PuntajeConsolidado: Optional[float] = None
     NivelGlobal: Optional[str] = None
+    # Puntaje 0-100 de cada dimensión (services/puntaje.py)
+    PuntajeDimension: dict = Field(default_factory=dict)
     FechaFinalizacion: Optional[datetime] = None
     Estado: dict = Field(default_factory=lambda: {"economica": "", "social": "", "ambiental": ""})
+    EvaluacionDesdeCache: dict = Field(default_factory=dict)
+    # Motor (assistants | completions) con que se evaluó cada dimensión
+    MotorEvaluacion: dict = Field(default_factory=dict)
+    # Hilo, run y fase de la evaluación en curso de cada dimensión, para reanudarla
+    Checkpoint: dict = Field(default_factory=dict)
+    EvaluacionExterna: dict = Field(default_factory=dict)
     EvaluacionAmbiental: Optional[List[dict]] = None
     EvaluacionSocial: Optional[List[dict]] = None
     EvaluacionEconomica: Optional[List[dict]] = None
     RespuestaAmbiental: Optional[str] = None
     RespuestaSocial: Optional[str] = None
     RespuestaEconomica: Optional[str] = None
-    Cuestionario: Optional[str] = None
-    CuestionarioAmbiental: Optional[str] = None
-    CuestionarioSocial: Optional[str] = None
-    CuestionarioEconomica: Optional[str] = None
+    # Grupos {"dimension", "items", "tipos"} del cuestionario; las vistas por dimensión se derivan de "tipos"
+    Cuestionario: Optional[List[dict]] = None
     Analisis: Optional[str] = None
     class Config:
         from_attributes = True  # Pydantic v2
 
+    @field_validator("Cuestionario", mode="before")
+    @classmethod
+    def cuestionario_legado(cls, valor):
+        # Solicitudes anteriores guardaban el cuestionario como texto JSON
+        return json_loads(valor) if isinstance(valor, str) else valor
+
+class SolicitudResumenModel(BaseModel):
+    """
+    Vista liviana de una solicitud para listados: omite cuestionarios, evaluaciones y respuestas.
+    Los campos adicionales pedidos con `campos` se agregan tal cual vienen de MongoDB.
+    """
+    SolicitudID: str
+    CodigoProyecto: str
+    ProveedorNombre: str
+    ProveedorNIT: str
+    FechaCreacion: datetime
+    EstadoGeneral: str
+    UsuarioSolicitante: str
+    Estado: dict = Field(default_factory=dict)
+    EvaluacionDesdeCache: dict = Field(default_factory=dict)
+    PuntajeConsolidado: Optional[float] = None
+    NivelGlobal: Optional[str] = None
+    FechaFinalizacion: Optional[datetime] = None
+    class Config:
+        extra = "allow"
+
+class SolicitudPaginaModel(BaseModel):
+    items: List[SolicitudResumenModel]
+    siguiente_cursor: Optional[str] = None
+
+# Campos (Evaluacion*, Respuesta*) que escribe cada dimensión
+CAMPOS_POR_DIMENSION = {
+    TipoAsistenteEnum.ambiental: ("EvaluacionAmbiental", "RespuestaAmbiental"),
+    TipoAsistenteEnum.social: ("EvaluacionSocial", "RespuestaSocial"),
+    TipoAsistenteEnum.economica: ("EvaluacionEconomica", "RespuestaEconomica"),
+}
+
+def proyeccion_evaluacion(tipo_asistente: TipoAsistenteEnum) -> dict:
+    """
+    Proyección para evaluar una dimensión: deja fuera evaluaciones y respuestas y filtra en
+    MongoDB los grupos del cuestionario de esa dimensión. Un cuestionario legado (texto) se
+    entrega completo y se filtra al construir el mensaje.
+    """
+    excluidos = {campo for campos in CAMPOS_POR_DIMENSION.values() for campo in campos} | {"Analisis", "Cuestionario"}
+    proyeccion = {campo: 1 for campo in SolicitudModel.model_fields if campo not in excluidos}
+    proyeccion["Cuestionario"] = {"$cond": [
+        {"$isArray": "$Cuestionario"},
+        {"$filter": {
+            "input": "$Cuestionario",
+            "as": "grupo",
+            "cond": {"$in": [tipo_asistente.value, {"$ifNull": [f"$$grupo.{CAMPO_TIPOS}", []]}]}
+        }},
+        "$Cuestionario"
+    ]}
+    return proyeccion
+
+class LoteResultadoModel(BaseModel):
+    LoteID: str
+    total: int
+    EstadoLote: str
+    creadas: List[str] = Field(default_factory=list)
+    errores: List[dict] = Field(default_factory=list)
+
+class LoteProgresoModel(BaseModel):
+    LoteID: str
+    EstadoLote: Optional[str] = None
+    total: int
+    completadas: int
+    porcentaje: float
+    estados: dict
+    dimensiones: dict
+    errores: List[dict] = Field(default_factory=list)
+
+# Estados del documento Lote mientras se preparan sus entradas
+LOTE_PREPARANDO = "preparando"
+LOTE_LISTO = "listo"
+LOTE_ERROR = "error"
+
+# Entradas de un lote que se preparan a la vez (parseo del Excel y subida de anexos)
+BATCH_CONCURRENCY = int(os.getenv("VIGIA_BATCH_CONCURRENCY", "8"))
+
+# Comentario keep-alive del stream de eventos mientras no hay cambios
+EVENTOS_KEEPALIVE = float(os.getenv("VIGIA_EVENTOS_KEEPALIVE", "15"))
+
+# Paginación del listado de solicitudes
+LISTADO_LIMITE_DEFECTO = int(os.getenv("VIGIA_LISTADO_LIMITE", "50"))
+LISTADO_LIMITE_MAXIMO = int(os.getenv("VIGIA_LISTADO_LIMITE_MAXIMO", "500"))
+EXPORTACION_BATCH_SIZE = int(os.getenv("VIGIA_EXPORTACION_BATCH_SIZE", "200"))
+
 # ...existing code...
 def extraer_cuestionario_csv(excel_file: UploadFile) -> Optional[str]:
     """
@@ -71,47 +234,27 @@ def extraer_cuestionario_csv(excel_file: UploadFile) -> Optional[str]:
         df.to_csv(output, index=False, lineterminator='\n')
         return output.getvalue()
     except Exception as e:
-        print(f"[Vigia] Error extrayendo hoja 'Cuestionario' como CSV: {e}")
+        logger.info(f"Error extrayendo hoja 'Cuestionario' como CSV: {e}")
         return None
 # ...existing code...
 # ...existing code...
 
 # ...existing code...
 
-def extraer_cuestionario_json_str(excel_file: UploadFile) -> Optional[list]:
+async def extraer_cuestionario_json_str(excel_file: UploadFile) -> Optional[list]:
     """
     Extrae el contenido de la hoja 'Cuestionario' de un archivo Excel recibido como UploadFile,
     omite y escapa saltos de línea en los nombres de los campos y en los valores de las celdas,
-    y retorna un string JSON agrupando las filas que pertenecen al mismo grupo (por ejemplo, misma dimensión).
-    Retorna None si no existe la hoja.
+    y retorna la lista de preguntas agrupadas por dimensión, ya depuradas.
+    El parseo corre en el executor de trabajo CPU para no bloquear el event loop.
+    Retorna None si no existe la hoja o si el parseo excede el tiempo permitido.
     """
     try:
-        contents = excel_file.file.read()
-        df = pd.read_excel(BytesIO(contents), sheet_name="Cuestionario", skiprows=3)
-        df = df.iloc[:, 0:16]
-        # Normaliza y escapa saltos de línea en los nombres de las columnas
-        df.columns = [
-            str(col).replace('\n', ' ').replace('\r', ' ').strip().lower().replace(" ", "_")
-            for col in df.columns
-        ]
-        # Escapa saltos de línea en los valores de las celdas
-        df = df.applymap(lambda x: str(x).replace('\n', ' ').replace('\r', ' ') if pd.notnull(x) else "")
-        # Agrupar por 'dimensión' (columna A normalizada)
-        agrupado = {}
-        for _, row in df.iterrows():
-            dimension = row.get('dimensión', 'Sin dimensión')
-            if dimension not in agrupado:
-                agrupado[dimension] = []
-            fila = {k: v for k, v in row.items() if k != 'dimensión'}
-            agrupado[dimension].append(fila)
-        resultado = [
-            {"dimension": dimension, "items": items}
-            for dimension, items in agrupado.items()
-        ]
-        # return json.dumps(resultado, ensure_ascii=False)
-        return depurarPreguntas(resultado)
+        contents = await excel_file.read()
+        with medir(FASE_SEGUNDOS, logger, fase="parseo_cuestionario"):
+            return await run_cpu(parsear_cuestionario_bytes, contents, True)
     except Exception as e:
-        print(f"[Vigia] Error extrayendo hoja 'Cuestionario' como JSON agrupado: {e}")
+        logger.info(f"Error extrayendo hoja 'Cuestionario' como JSON agrupado: {e}")
         return None
 # ...existing code...
 # ...existing code...
@@ -121,40 +264,15 @@ def depurarPreguntas(data: list) -> list:
     Elimina de cada item los campos indicados y renombra los campos de calificación, soportes y justificación.
     Retorna la lista depurada.
     """
-    campos_excluir = {
-        "opciones_de_respuesta",
-        "puntaje_respuesta",
-        "peso_criterio",
-        "puntaje_del_criterio",
-        "puntaje_de_la_dimensión",
-        "peso_dimensión",
-        "puntaje_final"
-    }
-    campo_renombrar = "calificación_asigne_en_la_columna_el_puntaje_de_la_respuesta_que_más_se_ajusta_a_la_realidad_de_tu_empresa."
-    nuevo_nombre = "calificacion_por_proveedor"
-
-    campo_renombrar1 = "soportes_aplicables_para_justificar_respuesta_estos_son_algunos_ejemplos_de_los_soportes_que_puedes_anexar_para_comprobar_la_respuesta_seleccionada."
-    nuevo_nombre1 = "soportes"
-
-    campo_renombrar2 = "justificación_explica_brevemente_lo_que_la_empresa_realiza_acorde_a_la_respuesta_seleccionada."
-    nuevo_nombre2 = "justificacion_por_proveedor"
-
     resultado = []
     for bloque in data:
         nueva_items = []
         for item in bloque.get("items", []):
             nuevo_item = {}
             for k, v in item.items():
-                if k in campos_excluir:
+                if k in CAMPOS_EXCLUIR:
                     continue
-                if k == campo_renombrar:
-                    nuevo_item[nuevo_nombre] = v
-                elif k == campo_renombrar1:
-                    nuevo_item[nuevo_nombre1] = v
-                elif k == campo_renombrar2:
-                    nuevo_item[nuevo_nombre2] = v
-                else:
-                    nuevo_item[k] = v
+                nuevo_item[CAMPOS_RENOMBRAR.get(k, k)] = v
             nueva_items.append(nuevo_item)
         resultado.append({
             "dimension": bloque.get("dimension", ""),
@@ -163,13 +281,30 @@ def depurarPreguntas(data: list) -> list:
     return resultado
 # ...existing code...
 
+# Estados finales de una dimensión
+ESTADOS_TERMINALES = ("done", "failed")
+
+
+class EvaluacionFallida(RuntimeError):
+    """
+    La dimensión terminó sin resultado; la cola de jobs reintenta el job con su backoff.
+    """
+
+
 async def procesar_solicitud_con_assistant(
     solicitud: SolicitudModel,
     anexos_ids: list,
     assistant: OpenAIAssistant,
-    tipo_asistente: TipoAsistenteEnum
+    tipo_asistente: TipoAsistenteEnum,
+    ultimo_intento: bool = True
 ):
-    cuestionario=solicitud.CuestionarioAmbiental if tipo_asistente == TipoAsistenteEnum.ambiental else solicitud.CuestionarioSocial if tipo_asistente == TipoAsistenteEnum.social else solicitud.CuestionarioEconomica
+    """
+    Evalúa una dimensión y guarda el resultado. Si no se obtiene la llamada a la función, antes del
+    último intento del job se lanza EvaluacionFallida sin tocar el Estado (queda para el reintento de
+    la cola, que retoma el checkpoint); en el último intento la dimensión queda "failed" y también se
+    lanza, para que el job termine como fallido.
+    """
+    cuestionario = codificar_cuestionario(cuestionario_dimension(solicitud.Cuestionario, tipo_asistente))
     
     # Formatear anexos para el mensaje
     if anexos_ids:
@@ -183,20 +318,77 @@ async def procesar_solicitud_con_assistant(
         f"Por favor, realiza la evaluación {tipo_asistente.value} correspondiente y responde con las observaciones y recomendaciones."
         f"Datos del formulario: {cuestionario if cuestionario else 'No hay datos de formulario.'}\n"  
     )
-    print(f"[Vigia] Mensaje Assistant: {mensaje}")
+    logger.debug(f"Mensaje Assistant: {mensaje}")
+    inicio = time.perf_counter()
     max_retries = 3
     retries = 0
     required_actions = []
     current_message = mensaje
     # Solo IDs para assistant
     current_file_ids = [a["id"] for a in anexos_ids]
+    # Los reintentos y un worker que retoma el job continúan el hilo y el run del checkpoint
+    checkpoint = dict(solicitud.Checkpoint.get(tipo_asistente.value) or {})
+    if checkpoint.get("thread_id"):
+        logger.info(f"Evaluación {tipo_asistente.value} de {solicitud.SolicitudID} reanudada en fase {checkpoint.get('fase')}")
 
-    while retries < max_retries:
-        required_action = await assistant.run_assistant_flow(
-            current_message,
-            file_ids=current_file_ids,
-            tipo_asistente=tipo_asistente
+    async def guardar_checkpoint(estado: dict):
+        await db.Solicitud.update_one(
+            {"SolicitudID": solicitud.SolicitudID},
+            {"$set": {f"Checkpoint.{tipo_asistente.value}": {**estado, "actualizado": datetime.utcnow()}}}
         )
+
+    # Una solicitud idéntica (mismo asistente, cuestionario y anexos) reutiliza la evaluación previa
+    clave_cache = clave_evaluacion(assistant.assistant_id, tipo_asistente.value, cuestionario, anexos_ids) if EVALUATION_CACHE_ENABLED else None
+    desde_cache = False
+    if clave_cache:
+        try:
+            cached = await evaluation_cache.buscar(clave_cache)
+        except Exception as e:
+            logger.error(f"Consulta de caché de evaluaciones: {str(e)}")
+            cached = None
+        if cached:
+            logger.info(f"Evaluación {tipo_asistente.value} de {solicitud.SolicitudID} tomada de caché")
+            required_actions = cached
+            desde_cache = True
+            retries = max_retries
+
+    # El mensaje se estima antes de crear el run: si excede el presupuesto la dimensión falla sin consumir tokens
+    respuesta_presupuesto = ""
+    if not desde_cache:
+        try:
+            tokens = verificar_presupuesto(mensaje, PROMPT_TOKEN_BUDGET)
+        except PresupuestoTokensExcedido as e:
+            tokens = e.tokens
+            respuesta_presupuesto = (
+                f"Evaluación {tipo_asistente.value} no ejecutada: {str(e)}. "
+                "Reduzca el cuestionario de la dimensión o ajuste VIGIA_PROMPT_TOKEN_BUDGET."
+            )
+            logger.warning(f"Solicitud {solicitud.SolicitudID}: {respuesta_presupuesto}")
+            retries = max_retries
+        PROMPT_TOKENS.observar(tokens, dimension=tipo_asistente.value)
+
+    # Sin anexos o con pocos anexos de texto basta una llamada a completions
+    if motor_configurado(tipo_asistente) != MOTOR_ASSISTANTS:
+        anexos_ids = await anexo_textos.hidratar(anexos_ids)
+    motor = await motor_dimension(tipo_asistente, anexos_ids, assistant)
+    while retries < max_retries:
+        if motor == MOTOR_COMPLETIONS:
+            required_action = await assistant.run_completions_flow(current_message, tipo_asistente, anexos=anexos_ids)
+            if not required_action:
+                # El reintento se hace con el flujo de Assistants, que no depende del formato de salida
+                logger.warning(f"Motor completions sin resultado para {solicitud.SolicitudID} ({tipo_asistente.value}); se usa {MOTOR_ASSISTANTS}")
+                REINTENTOS.inc(tipo="motor_respaldo", dimension=tipo_asistente.value)
+                motor = MOTOR_ASSISTANTS
+                continue
+        else:
+            required_action = await assistant.run_assistant_flow(
+                current_message,
+                file_ids=current_file_ids,
+                tipo_asistente=tipo_asistente,
+                vector_store_id=solicitud.VectorStoreID,
+                checkpoint=checkpoint,
+                guardar_checkpoint=guardar_checkpoint
+            )
         if required_action:
             required_actions.append(required_action)
             break
@@ -204,46 +396,331 @@ async def procesar_solicitud_con_assistant(
             f"{mensaje}\n\nPor favor, responde ejecutando la función configurada en el assistant. Intento {retries+2}."
         )
         retries += 1
+        if retries < max_retries:
+            REINTENTOS.inc(tipo="evaluacion", dimension=tipo_asistente.value)
 
-    # Actualiza los campos según el tipo de asistente
-    if tipo_asistente == TipoAsistenteEnum.ambiental:
-        solicitud.EvaluacionAmbiental = required_actions
-        solicitud.RespuestaAmbiental = next(
-            (ra["assistant_response"] for ra in required_actions if isinstance(ra, dict) and ra.get("assistant_response")), ""
+    # Un mensaje fuera del presupuesto fallaría igual en cada intento: se marca "failed" de inmediato
+    sin_resultado = not required_actions and not respuesta_presupuesto
+    if sin_resultado and not ultimo_intento:
+        raise EvaluacionFallida(f"Evaluación {tipo_asistente.value} de {solicitud.SolicitudID} sin resultado")
+
+    # Solo se guardan runs que llegaron a la función; uno que terminó failed/expired/incomplete no se repite
+    resultados = [ra for ra in required_actions if isinstance(ra, dict)]
+    if clave_cache and not desde_cache and any(ra.get("required_action") for ra in resultados) and not any(
+        ra.get("assistant_response") in RUN_TERMINAL_STATUSES for ra in resultados
+    ):
+        try:
+            await evaluation_cache.guardar(clave_cache, assistant.assistant_id, tipo_asistente.value, required_actions)
+        except Exception as e:
+            logger.error(f"Registro en caché de evaluaciones: {str(e)}")
+
+    # Escribe solo los campos de esta dimensión; las otras evaluaciones pueden estar corriendo en paralelo
+    evaluacion_campo, respuesta_campo = CAMPOS_POR_DIMENSION[tipo_asistente]
+    respuesta = next(
+        (ra["assistant_response"] for ra in required_actions if isinstance(ra, dict) and ra.get("assistant_response")),
+        respuesta_presupuesto
+    )
+    with medir(FASE_SEGUNDOS, logger, fase="mongo_evaluacion", dimension=tipo_asistente.value):
+        campos, externa = await evaluation_store.separar(
+            solicitud.SolicitudID, tipo_asistente.value, {evaluacion_campo: required_actions, respuesta_campo: respuesta}
         )
-        solicitud.Estado["ambiental"] = "done" if required_actions else "failed"
-    elif tipo_asistente == TipoAsistenteEnum.social:
-        solicitud.EvaluacionSocial = required_actions
-        solicitud.RespuestaSocial = next(
-            (ra["assistant_response"] for ra in required_actions if isinstance(ra, dict) and ra.get("assistant_response")), ""
+        doc = await db.Solicitud.find_one_and_update(
+            {"SolicitudID": solicitud.SolicitudID},
+            {"$set": {
+                **campos,
+                f"EvaluacionExterna.{tipo_asistente.value}": externa,
+                f"Estado.{tipo_asistente.value}": "done" if required_actions else "failed",
+                f"EvaluacionDesdeCache.{tipo_asistente.value}": desde_cache,
+                **({} if desde_cache else {f"MotorEvaluacion.{tipo_asistente.value}": motor}),
+                # Una evaluación fallida conserva su checkpoint para retomarla
+                **({f"Checkpoint.{tipo_asistente.value}": None} if required_actions else {})
+            }},
+            projection={"Estado": 1, "EstadoGeneral": 1},
+            return_document=ReturnDocument.AFTER
         )
-        solicitud.Estado["social"] = "done" if required_actions else "failed"
-    elif tipo_asistente == TipoAsistenteEnum.economica:
-        solicitud.EvaluacionEconomica = required_actions
-        solicitud.RespuestaEconomica = next(
-            (ra["assistant_response"] for ra in required_actions if isinstance(ra, dict) and ra.get("assistant_response")), ""
+    EVALUACION_SEGUNDOS.observar(
+        time.perf_counter() - inicio,
+        dimension=tipo_asistente.value,
+        resultado="done" if required_actions else "failed",
+        desde_cache=str(desde_cache).lower(),
+        motor="cache" if desde_cache else motor
+    )
+    logger.info(f"Solicitud {solicitud.SolicitudID} actualizada tras evaluación {tipo_asistente.value}")
+    event_bus.publish(solicitud.SolicitudID, {
+        "tipo": EVENTO_DIMENSION,
+        "dimension": tipo_asistente.value,
+        "estado": "done" if required_actions else "failed",
+        "desde_cache": desde_cache
+    })
+
+    estados = (doc or {}).get("Estado", {})
+    if doc and all(estados.get(t.value) == "done" for t in TipoAsistenteEnum):
+        await finalizar_solicitud(solicitud.SolicitudID, assistant)
+    elif doc and all(estados.get(t.value) in ESTADOS_TERMINALES for t in TipoAsistenteEnum):
+        await cerrar_solicitud_fallida(solicitud.SolicitudID, assistant)
+    if sin_resultado:
+        raise EvaluacionFallida(f"Evaluación {tipo_asistente.value} de {solicitud.SolicitudID} sin resultado tras el último intento")
+
+async def finalizar_solicitud(solicitud_id: str, assistant: OpenAIAssistant):
+    """
+    Marca la solicitud como completada si sus tres dimensiones terminaron. La condición va en el
+    filtro, así que solo la evaluación que gana la actualización libera los recursos de OpenAI.
+    """
+    fecha_finalizacion = datetime.utcnow()
+    pendiente = {
+        "SolicitudID": solicitud_id,
+        **{f"Estado.{t.value}": "done" for t in TipoAsistenteEnum},
+        "EstadoGeneral": {"$ne": "completado"}
+    }
+    # Puntajes calculados localmente con los pesos del cuestionario y las calificaciones de las evaluaciones.
+    # Se calculan antes de completarla para que la misma actualización (y su evento de change stream) los lleve.
+    puntaje = {}
+    try:
+        with medir(FASE_SEGUNDOS, logger, fase="puntaje"):
+            actual = await db.Solicitud.find_one(pendiente, PROYECCION_PUNTAJE)
+            if actual is None:
+                return
+            puntaje = puntuar_solicitud(await evaluation_store.hidratar(actual))
+    except Exception as e:
+        logger.error(f"No se pudo calcular el puntaje de la solicitud {solicitud_id}: {str(e)}")
+    with medir(FASE_SEGUNDOS, logger, fase="mongo_finalizar"):
+        doc = await db.Solicitud.find_one_and_update(
+            pendiente,
+            {"$set": {
+                "EstadoGeneral": "completado", "FechaFinalizacion": fecha_finalizacion, "RecursosLiberados": True, **puntaje
+            }},
+            projection={"VectorStoreID": 1, "Anexos": 1}
         )
-        solicitud.Estado["economica"] = "done" if required_actions else "failed"
-
-    await db.Solicitud.update_one({"SolicitudID": solicitud.SolicitudID}, {"$set": solicitud.dict()})
-    doc = await db.Solicitud.find_one({"SolicitudID": solicitud.SolicitudID})
-    solicitud = SolicitudModel(**doc) 
-    if (
-        solicitud.RespuestaAmbiental
-        and solicitud.RespuestaSocial
-        and solicitud.RespuestaEconomica
+    if not doc:
+        return
+    logger.info(f"Solicitud {solicitud_id} completada")
+    event_bus.publish(solicitud_id, {
+        "tipo": EVENTO_COMPLETADO,
+        "EstadoGeneral": "completado",
+        "FechaFinalizacion": fecha_finalizacion.isoformat(),
+        "PuntajeConsolidado": puntaje.get("PuntajeConsolidado"),
+        "NivelGlobal": puntaje.get("NivelGlobal")
+    })
+    await liberar_recursos_solicitud(doc, assistant)
+    # analisis =await assistant.analizar_solicitud_completions(solicitud)
+
+async def liberar_recursos_solicitud(doc: dict, assistant: OpenAIAssistant):
+    """
+    Elimina el vector store de la solicitud y libera sus anexos en la caché de subidas; los archivos
+    que ninguna otra solicitud referencia se eliminan en OpenAI.
+    """
+    with medir(FASE_SEGUNDOS, logger, fase="limpieza_openai"):
+        if doc.get("VectorStoreID"):
+            await assistant.delete_vector_store(doc["VectorStoreID"])
+        anexos_ids = [a["id"] for a in doc.get("Anexos", [])]
+        await upload_cache.liberar(anexos_ids)
+        await assistant.depureFiles(anexos_ids)
+
+async def cerrar_solicitud_fallida(solicitud_id: str, assistant: OpenAIAssistant):
+    """
+    Con sus tres dimensiones terminadas y alguna "failed" la solicitud ya no se completará: libera
+    sus recursos. RecursosLiberados en el filtro garantiza que se liberen una sola vez.
+    """
+    doc = await db.Solicitud.find_one_and_update(
+        {
+            "SolicitudID": solicitud_id,
+            **{f"Estado.{t.value}": {"$in": list(ESTADOS_TERMINALES)} for t in TipoAsistenteEnum},
+            "RecursosLiberados": {"$ne": True}
+        },
+        {"$set": {"RecursosLiberados": True}},
+        projection={"VectorStoreID": 1, "Anexos": 1}
+    )
+    if doc:
+        logger.info(f"Solicitud {solicitud_id} terminó con dimensiones fallidas; se liberan sus anexos")
+        await liberar_recursos_solicitud(doc, assistant)
+
+async def subir_anexos(assistant: OpenAIAssistant, anexos: List[UploadFile]) -> list:
+    """
+    Sube los anexos en paralelo, limitado por VIGIA_UPLOAD_CONCURRENCY en todo el proceso.
+    Conserva el orden de los anexos recibidos y omite los que no se pudieron subir. El "texto" de
+    los anexos de texto pequeños es transitorio: preparar_solicitud lo guarda en AnexoTexto.
+    """
+    async def subir(anexo: UploadFile):
+        async with upload_semaphore:
+            return await assistant.upload_file_from_formdata_v2(anexo, anexo.filename, texto_max_bytes=FAST_PATH_MAX_BYTES)
+
+    with medir(FASE_SEGUNDOS, logger, fase="subida_anexos"):
+        resultados = await asyncio.gather(*(subir(anexo) for anexo in anexos))
+    return [
+        {
+            "id": anexo_upload["id"], "filename": anexo.filename, "sha256": anexo_upload.get("sha256"),
+            "bytes": anexo_upload.get("bytes"),
+            # Solo los anexos de texto pequeños; permiten evaluar con el motor completions
+            **({"texto": anexo_upload["texto"]} if anexo_upload.get("texto") is not None else {})
+        }
+        for anexo, anexo_upload in zip(anexos, resultados)
+        if anexo_upload
+    ]
+
+async def motor_dimension(
+    tipo_asistente: TipoAsistenteEnum, anexos: list, assistant: Optional[OpenAIAssistant] = None
+) -> str:
+    """
+    elegir_motor con la definición del asistente, que se consulta (una vez por proceso) solo si
+    la dimensión admite completions y los anexos caben en el mensaje.
+    """
+    definicion = None
+    if motor_configurado(tipo_asistente) != MOTOR_ASSISTANTS and anexos_en_linea(anexos):
+        try:
+            definicion = await (assistant or crear_assistant(tipo_asistente)).obtener_definicion()
+        except Exception as e:
+            logger.warning(f"No se pudo consultar la definición del asistente {tipo_asistente.value}: {str(e)}")
+    return elegir_motor(tipo_asistente, anexos, definicion)
+
+def crear_assistant(tipo_asistente: TipoAsistenteEnum) -> OpenAIAssistant:
+    """
+    Construye el OpenAIAssistant configurado para la dimensión indicada.
+    """
+    assistant_ids = {
+        TipoAsistenteEnum.ambiental: os.getenv("OPENAI_ASSISTANT_ID_AMBIENTAL"),
+        TipoAsistenteEnum.social: os.getenv("OPENAI_ASSISTANT_ID_SOCIAL"),
+        TipoAsistenteEnum.economica: os.getenv("OPENAI_ASSISTANT_ID_ECONOMICA"),
+    }
+    return OpenAIAssistant(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        assistant_id=assistant_ids[tipo_asistente],
+        upload_cache=upload_cache
+    )
+
+async def ejecutar_job_evaluacion(job: dict):
+    """
+    Handler de la cola: carga la solicitud y ejecuta la evaluación de la dimensión del job.
+    """
+    tipo_asistente = TipoAsistenteEnum(job["dimension"])
+    doc = await db.Solicitud.find_one({"SolicitudID": job["SolicitudID"]}, proyeccion_evaluacion(tipo_asistente))
+    if not doc:
+        logger.info(f"Job {job['_id']} descartado: la solicitud ya no existe")
+        return
+    solicitud = SolicitudModel(**doc)
+    if solicitud.Estado.get(tipo_asistente.value) == "done":
+        # Un worker anterior terminó la evaluación pero no alcanzó a cerrar el job
+        return
+    await procesar_solicitud_con_assistant(
+        solicitud, solicitud.Anexos, crear_assistant(tipo_asistente), tipo_asistente,
+        ultimo_intento=job.get("intentos", 1) >= job_queue.max_attempts
+    )
+
+async def registrar_fallo_job(job: dict, error: str):
+    """
+    Fallo definitivo de un job (la cola agotó sus intentos): si la dimensión sigue sin estado
+    terminal la marca "failed", publica su evento y, con las tres dimensiones terminadas, cierra
+    la solicitud para liberar sus recursos.
+    """
+    tipo_asistente = TipoAsistenteEnum(job["dimension"])
+    doc = await db.Solicitud.find_one_and_update(
+        {"SolicitudID": job["SolicitudID"], f"Estado.{tipo_asistente.value}": {"$nin": list(ESTADOS_TERMINALES)}},
+        {"$set": {f"Estado.{tipo_asistente.value}": "failed"}},
+        projection={"Estado": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not doc:
+        return
+    logger.info(f"Evaluación {tipo_asistente.value} de {job['SolicitudID']} marcada failed: {error}")
+    event_bus.publish(job["SolicitudID"], {
+        "tipo": EVENTO_DIMENSION, "dimension": tipo_asistente.value, "estado": "failed", "desde_cache": False
+    })
+    estados = doc.get("Estado", {})
+    if all(estados.get(t.value) in ESTADOS_TERMINALES for t in TipoAsistenteEnum):
+        await cerrar_solicitud_fallida(job["SolicitudID"], crear_assistant(TipoAsistenteEnum.ambiental))
+
+async def asegurar_indices():
+    """
+    Crea los índices de Solicitud y de las colecciones de soporte. Se ejecuta en segundo plano al iniciar.
+    """
+    for nombre, crear in (
+        ("Solicitud", lambda: ensure_solicitud_indexes(db.Solicitud)),
+        ("ArchivoCache", upload_cache.ensure_indexes),
+        ("EvaluacionCache", evaluation_cache.ensure_indexes),
+        ("EvaluacionDetalle", evaluation_store.ensure_indexes),
+        ("AnexoTexto", anexo_textos.ensure_indexes),
     ):
-        await assistant.depureFiles()
-        # analisis =await assistant.analizar_solicitud_completions(solicitud)
-        # solicitud.Analisis=analisis
-        solicitud.FechaFinalizacion = datetime.utcnow()
-        solicitud.EstadoGeneral = "completado"
-        await db.Solicitud.update_one({"SolicitudID": solicitud.SolicitudID}, {"$set": solicitud.dict()})
-    
-    print(f"[Vigia] Solicitud {solicitud.SolicitudID} actualizada tras evaluación {tipo_asistente.value}")
+        try:
+            await crear()
+        except Exception as e:
+            # p. ej. SolicitudID duplicados impiden crear el índice único
+            logger.error(f"No se pudieron crear los índices de {nombre}: {str(e)}")
+
+def configurar_base_datos(database):
+    """
+    Reemplaza la base de datos del router y de sus servicios, por ejemplo por el stand-in en
+    memoria de benchmarks/ en pruebas de extremo a extremo y benchmarks de carga.
+    """
+    global db
+    db = database
+    job_queue.collection = database.EvaluacionJob
+    upload_cache.collection = database.ArchivoCache
+    evaluation_cache.collection = database.EvaluacionCache
+    evaluation_store.collection = database.EvaluacionDetalle
+    anexo_textos.collection = database.AnexoTexto
+
+def iniciar_workers_evaluacion():
+    job_queue.start(ejecutar_job_evaluacion, al_fallar=registrar_fallo_job)
+    file_janitor.start(lambda: crear_assistant(TipoAsistenteEnum.ambiental))
+
+async def detener_workers_evaluacion():
+    await file_janitor.stop()
+    await job_queue.stop()
+
+def iniciar_eventos():
+    event_bus.start(db.Solicitud)
+
+async def detener_eventos():
+    await event_bus.stop()
 
 # --- Router FastAPI ---
-router = APIRouter(prefix="/vigia", tags=["Vigia"])
+router = APIRouter(prefix="/vigia", tags=["Vigia"], default_response_class=RespuestaJSON)
+
+async def preparar_solicitud(cuestionario: list, anexos: List[UploadFile], **datos) -> SolicitudModel:
+    """
+    Construye la solicitud a partir del cuestionario ya parseado: separa las preguntas por
+    dimensión, sube los anexos y crea el vector store compartido. No la guarda en la base de datos.
+    """
+    # Cada grupo se guarda una sola vez, marcado con las dimensiones que lo evalúan
+    cuestionario = [{**grupo, CAMPO_TIPOS: tipos_dimension(grupo.get("dimension", ""))} for grupo in cuestionario]
+
+    assistant_ambiental = crear_assistant(TipoAsistenteEnum.ambiental)
+
+    # Subir anexos y obtener sus IDs y nombres
+    anexos_ids = await subir_anexos(assistant_ambiental, anexos)
+    # El texto se guarda aparte y solo si todos los anexos juntos caben en el mensaje de completions
+    sin_texto = [{k: v for k, v in a.items() if k != "texto"} for a in anexos_ids]
+    en_linea = False
+    if anexos_en_linea(anexos_ids) and any(a.get("texto") is not None for a in anexos_ids):
+        try:
+            en_linea = bool(await anexo_textos.guardar(anexos_ids))
+        except Exception as e:
+            logger.error(f"No se pudo guardar el texto de los anexos: {str(e)}")
+    # Para decidir si hace falta el vector store solo cuentan los textos que quedaron guardados
+    anexos_motor = anexos_ids if en_linea else sin_texto
+    anexos_ids = sin_texto
+
+    solicitud = SolicitudModel(
+        **datos,
+        FechaCreacion=datetime.utcnow(),
+        EstadoGeneral="En progreso",
+        Anexos=anexos_ids,
+        Estado={"economica": "pending", "social": "pending", "ambiental": "pending"},
+        Cuestionario=cuestionario
+    )
+
+    # Un solo vector store por solicitud: se indexa una vez y lo comparten las tres dimensiones.
+    # No hace falta si todas las dimensiones se evalúan con completions
+    if SHARED_VECTOR_STORE and anexos_ids and any(
+        [await motor_dimension(tipo, anexos_motor) == MOTOR_ASSISTANTS for tipo in TipoAsistenteEnum]
+    ):
+        try:
+            with medir(FASE_SEGUNDOS, logger, fase="crear_vector_store"):
+                solicitud.VectorStoreID = await assistant_ambiental.create_vector_store(
+                    [a["id"] for a in anexos_ids], name=f"solicitud-{solicitud.SolicitudID}"
+                )
+        except Exception as e:
+            logger.error(f"No se pudo crear el vector store de la solicitud: {str(e)}")
+    return solicitud
 
 @router.post("/solicitud", response_model=SolicitudModel)
 async def create_solicitud(
@@ -256,82 +733,500 @@ async def create_solicitud(
     anexos: List[UploadFile] = File(None)
 ):
     # Extraer cuestionario del Excel
-    cuestionario_csv = extraer_cuestionario_json_str(excel_file)
-    # ...existing code...
-    cuestionario_ambiental = [item for item in cuestionario_csv if "ambiental" in item.get("dimension", "").lower()]
-    cuestionario_social = [item for item in cuestionario_csv if "social" in item.get("dimension", "").lower()]
-    cuestionario_economica = [item for item in cuestionario_csv if "económica" in item.get("dimension", "").lower() or "gobernanza" in item.get("dimension", "").lower()]
-    # ...existing code... 
-
-    # Configuración del assistant
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    OPENAI_ASSISTANT_ID_AMBIENTAL = os.getenv("OPENAI_ASSISTANT_ID_AMBIENTAL")
-    OPENAI_ASSISTANT_ID_SOCIAL = os.getenv("OPENAI_ASSISTANT_ID_SOCIAL")
-    OPENAI_ASSISTANT_ID_ECONOMICA = os.getenv("OPENAI_ASSISTANT_ID_ECONOMICA")
-
-    assistant_ambiental = OpenAIAssistant(api_key=OPENAI_API_KEY, assistant_id=OPENAI_ASSISTANT_ID_AMBIENTAL)
-    assistant_social = OpenAIAssistant(api_key=OPENAI_API_KEY, assistant_id=OPENAI_ASSISTANT_ID_SOCIAL)
-    assistant_economica = OpenAIAssistant(api_key=OPENAI_API_KEY, assistant_id=OPENAI_ASSISTANT_ID_ECONOMICA)
-
-    # Subir anexos y obtener sus IDs y nombres
-    anexos_ids = []
-    if anexos:
-        for anexo in anexos:
-            anexo_upload = await assistant_ambiental.upload_file_from_formdata_v2(anexo, anexo.filename)
-            if anexo_upload:
-                anexos_ids.append({"id": anexo_upload["id"], "filename": anexo.filename})
-
-    # Guardar la solicitud en la base de datos
-    solicitud = SolicitudModel(
+    cuestionario_csv = await extraer_cuestionario_json_str(excel_file)
+    if cuestionario_csv is None:
+        raise HTTPException(status_code=422, detail="No fue posible leer la hoja 'Cuestionario' del Excel")
+    solicitud = await preparar_solicitud(
+        cuestionario_csv,
         CodigoProyecto=CodigoProyecto,
         ProveedorNombre=ProveedorNombre,
         ProveedorNIT=ProveedorNIT,
-        FechaCreacion=datetime.utcnow(),
-        EstadoGeneral="En progreso",
         UsuarioSolicitante=UsuarioSolicitante,
         FuenteExcelPath=excel_file.filename,
-        Anexos=anexos_ids,
-        Estado={"economica": "pending", "social": "pending", "ambiental": "pending"},
-        Cuestionario=json.dumps(cuestionario_csv, ensure_ascii=False),
-        CuestionarioAmbiental=json.dumps(cuestionario_ambiental, ensure_ascii=False),
-        CuestionarioSocial=json.dumps(cuestionario_social, ensure_ascii=False),
-        CuestionarioEconomica=json.dumps(cuestionario_economica, ensure_ascii=False)
+        anexos=anexos or []
     )
 
-    await db.Solicitud.insert_one(solicitud.dict())
-    print(f"[Vigia] Solicitud creada con ID: {solicitud.SolicitudID}")
+    with medir(FASE_SEGUNDOS, logger, fase="mongo_insertar"):
+        await db.Solicitud.insert_one(solicitud.dict())
+    logger.info(f"Solicitud creada con ID: {solicitud.SolicitudID}")
 
-    # Procesar los asistentes de forma asíncrona
-    asyncio.create_task(procesar_solicitud_con_assistant(solicitud, anexos_ids, assistant_ambiental, TipoAsistenteEnum.ambiental))
-    asyncio.create_task(procesar_solicitud_con_assistant(solicitud, anexos_ids, assistant_social, TipoAsistenteEnum.social))
-    asyncio.create_task(procesar_solicitud_con_assistant(solicitud, anexos_ids, assistant_economica, TipoAsistenteEnum.economica))
+    # Encolar una evaluación por dimensión en un solo bulk_write; los workers las procesan con concurrencia acotada
+    await job_queue.enqueue_many(
+        [
+            {"SolicitudID": solicitud.SolicitudID, "dimension": tipo_asistente.value, "usuario": solicitud.UsuarioSolicitante}
+            for tipo_asistente in TipoAsistenteEnum
+        ],
+        carril=CARRIL_INTERACTIVO
+    )
 
     return solicitud
 
+# Preparaciones de lotes en curso; la referencia evita que el recolector descarte la tarea
+tareas_lote = set()
+
+@router.post("/solicitudes/batch", response_model=LoteResultadoModel, status_code=202)
+async def create_solicitudes_batch(
+    archivo: UploadFile = File(...),
+    UsuarioSolicitante: str = Form(...)
+):
+    """
+    Crea muchas solicitudes desde un zip con manifest.json y los Excel/anexos de cada proveedor.
+    Responde de inmediato con el LoteID: las entradas se preparan en segundo plano y el avance
+    se consulta en GET /solicitudes/batch/{lote_id}.
+    """
+    ruta = await run_in_threadpool(copiar_a_temporal, archivo.file)
+    zf = None
+    # Una vez creada la tarea, ella cierra el zip y elimina el temporal
+    en_preparacion = False
+    try:
+        zf = await run_in_threadpool(zipfile.ZipFile, ruta)
+        entradas, errores = await run_in_threadpool(leer_manifiesto, zf)
+        lote_id = str(ObjectId())
+        total = len(entradas) + len(errores)
+        await db.Lote.insert_one({
+            "_id": lote_id, "EstadoLote": LOTE_PREPARANDO, "total": total, "errores": errores,
+            "UsuarioSolicitante": UsuarioSolicitante, "FechaCreacion": datetime.utcnow()
+        })
+        tarea = asyncio.create_task(preparar_lote(lote_id, zf, ruta, entradas, errores, UsuarioSolicitante))
+        en_preparacion = True
+    except (zipfile.BadZipFile, ManifiestoError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        if not en_preparacion:
+            if zf is not None:
+                zf.close()
+            os.remove(ruta)
+    tareas_lote.add(tarea)
+    tarea.add_done_callback(tareas_lote.discard)
+    return LoteResultadoModel(
+        LoteID=lote_id, total=total, EstadoLote=LOTE_PREPARANDO, errores=sorted(errores, key=lambda e: e["indice"])
+    )
+
+async def preparar_lote(
+    lote_id: str, zf: zipfile.ZipFile, ruta: str, entradas: List[dict], errores: List[dict], UsuarioSolicitante: str
+):
+    """
+    Prepara las entradas del lote con concurrencia acotada (VIGIA_BATCH_CONCURRENCY), las inserta
+    con un solo insert_many y encola sus evaluaciones en el carril batch. La lectura del zip se
+    hace en el threadpool para no bloquear el event loop. Al terminar elimina el zip temporal y
+    guarda en el Lote su estado y los errores por entrada (los del manifiesto incluidos).
+    """
+    errores = list(errores)
+    semaforo = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def preparar(entrada: dict):
+        async with semaforo:
+            abiertos = []
+            try:
+                excel = await run_in_threadpool(abrir_miembro, zf, entrada["excel"])
+                abiertos.append(excel)
+                anexos = []
+                for ruta_anexo in entrada["anexos"]:
+                    anexos.append(await run_in_threadpool(abrir_miembro, zf, ruta_anexo))
+                    abiertos.append(anexos[-1])
+                cuestionario = await extraer_cuestionario_json_str(excel)
+                if cuestionario is None:
+                    raise ValueError("No fue posible leer la hoja 'Cuestionario' del Excel")
+                return await preparar_solicitud(
+                    cuestionario,
+                    CodigoProyecto=str(entrada["CodigoProyecto"]),
+                    ProveedorNombre=str(entrada["ProveedorNombre"]),
+                    ProveedorNIT=str(entrada["ProveedorNIT"]),
+                    UsuarioSolicitante=entrada.get("UsuarioSolicitante") or UsuarioSolicitante,
+                    FuenteExcelPath=entrada["excel"],
+                    LoteID=lote_id,
+                    anexos=anexos
+                )
+            finally:
+                for archivo_temporal in abiertos:
+                    await archivo_temporal.close()
+
+    try:
+        resultados = await asyncio.gather(*(preparar(entrada) for entrada in entradas), return_exceptions=True)
+        preparadas = []
+        for entrada, resultado in zip(entradas, resultados):
+            if isinstance(resultado, Exception):
+                errores.append({"indice": entrada["indice"], "error": str(resultado)})
+            else:
+                preparadas.append((entrada, resultado))
+        solicitudes = await insertar_solicitudes_lote(preparadas, errores)
+        if solicitudes:
+            await job_queue.enqueue_many(
+                [
+                    {
+                        "SolicitudID": solicitud.SolicitudID, "dimension": tipo_asistente.value,
+                        "usuario": solicitud.UsuarioSolicitante, "LoteID": lote_id
+                    }
+                    for solicitud in solicitudes
+                    for tipo_asistente in TipoAsistenteEnum
+                ],
+                carril=CARRIL_BATCH
+            )
+        estado = LOTE_LISTO
+        logger.info(f"Lote {lote_id}: {len(solicitudes)} solicitudes creadas, {len(errores)} con error")
+    except Exception as e:
+        estado = LOTE_ERROR
+        logger.error(f"No se pudo preparar el lote {lote_id}: {str(e)}")
+    finally:
+        zf.close()
+        os.remove(ruta)
+    await db.Lote.update_one(
+        {"_id": lote_id}, {"$set": {"EstadoLote": estado, "errores": errores}}
+    )
+
+async def insertar_solicitudes_lote(preparadas: List[tuple], errores: List[dict]) -> List[SolicitudModel]:
+    """
+    Inserta las solicitudes preparadas con un solo insert_many y retorna las que quedaron guardadas.
+    Las que no se guardaron se registran en errores y se liberan sus anexos y su vector store.
+    """
+    if not preparadas:
+        return []
+    try:
+        await db.Solicitud.insert_many([solicitud.dict() for _, solicitud in preparadas], ordered=False)
+        return [solicitud for _, solicitud in preparadas]
+    except BulkWriteError as e:
+        fallidas = {error["index"] for error in e.details.get("writeErrors", [])}
+        motivo = "No se pudo guardar la solicitud"
+    except Exception as e:
+        # Sin detalle por documento: se consulta cuáles alcanzaron a guardarse
+        guardadas = set(await db.Solicitud.distinct(
+            "SolicitudID", {"SolicitudID": {"$in": [solicitud.SolicitudID for _, solicitud in preparadas]}}
+        ))
+        fallidas = {i for i, (_, solicitud) in enumerate(preparadas) if solicitud.SolicitudID not in guardadas}
+        motivo = f"No se pudo guardar la solicitud: {str(e)}"
+
+    assistant = crear_assistant(TipoAsistenteEnum.ambiental)
+    for i in sorted(fallidas):
+        entrada, solicitud = preparadas[i]
+        errores.append({"indice": entrada["indice"], "error": motivo})
+        try:
+            await liberar_recursos_solicitud(solicitud.dict(), assistant)
+        except Exception as e:
+            logger.error(f"No se pudieron liberar los anexos de la solicitud {solicitud.SolicitudID}: {str(e)}")
+    return [solicitud for i, (_, solicitud) in enumerate(preparadas) if i not in fallidas]
+
+@router.get("/solicitudes/batch/{lote_id}", response_model=LoteProgresoModel)
+async def get_lote_progreso(lote_id: str):
+    """
+    Progreso agregado de un lote: solicitudes por EstadoGeneral y evaluaciones por dimensión y estado,
+    junto con el estado de su preparación (EstadoLote) y los errores por entrada.
+    """
+    # Una fila por combinación de estados presente en el lote; los conteos se suman aquí
+    combinaciones = await db.Solicitud.aggregate([
+        {"$match": {"LoteID": lote_id}},
+        {"$group": {
+            "_id": {
+                "general": "$EstadoGeneral",
+                **{t.value: f"$Estado.{t.value}" for t in TipoAsistenteEnum}
+            },
+            "total": {"$sum": 1}
+        }}
+    ]).to_list(length=None)
+    lote = await db.Lote.find_one({"_id": lote_id}, {"EstadoLote": 1, "errores": 1})
+    if not combinaciones and not lote:
+        raise HTTPException(status_code=404, detail="Lote not found")
+
+    estados = {}
+    dimensiones = {t.value: {} for t in TipoAsistenteEnum}
+    for fila in combinaciones:
+        general = fila["_id"].get("general") or "sin_estado"
+        estados[general] = estados.get(general, 0) + fila["total"]
+        for t in TipoAsistenteEnum:
+            estado = fila["_id"].get(t.value) or "sin_estado"
+            dimensiones[t.value][estado] = dimensiones[t.value].get(estado, 0) + fila["total"]
+    total = sum(estados.values())
+    completadas = estados.get("completado", 0)
+    return LoteProgresoModel(
+        LoteID=lote_id,
+        EstadoLote=(lote or {}).get("EstadoLote"),
+        total=total,
+        completadas=completadas,
+        porcentaje=round(100 * completadas / total, 2) if total else 0.0,
+        estados=estados,
+        dimensiones=dimensiones,
+        errores=sorted((lote or {}).get("errores", []), key=lambda e: e["indice"])
+    )
+
 @router.get("/solicitud/{solicitud_id}", response_model=SolicitudModel)
 async def get_solicitud(solicitud_id: str):
     doc = await db.Solicitud.find_one({"SolicitudID": solicitud_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Solicitud not found")
-    return SolicitudModel(**doc)
+    return SolicitudModel(**await evaluation_store.hidratar(doc))
+
+@router.get("/solicitud/{solicitud_id}/cuestionario/{dimension}", response_model=List[dict])
+async def get_cuestionario_dimension(solicitud_id: str, dimension: TipoAsistenteEnum):
+    """
+    Grupos del cuestionario de una dimensión, filtrados en MongoDB.
+    """
+    doc = await db.Solicitud.find_one(
+        {"SolicitudID": solicitud_id}, {"_id": 0, "Cuestionario": proyeccion_evaluacion(dimension)["Cuestionario"]}
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Solicitud not found")
+    return cuestionario_dimension(SolicitudModel.cuestionario_legado(doc.get("Cuestionario")), dimension)
+
+def codificar_cursor(doc: dict) -> str:
+    """
+    Cursor opaco con la última posición (FechaCreacion, _id) entregada.
+    """
+    valor = f"{doc['FechaCreacion'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(valor.encode("utf-8")).decode("ascii")
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        fecha, oid = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(fecha), ObjectId(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def proyeccion_listado(campos: Optional[str]) -> dict:
+    """
+    Proyección del listado: campos del resumen más los campos extra solicitados (separados por coma).
+    """
+    extra = [c.strip() for c in (campos or "").split(",") if c.strip()]
+    desconocidos = [c for c in extra if c not in SolicitudModel.model_fields]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(desconocidos)}")
+    return {c: 1 for c in [*SolicitudResumenModel.model_fields, *extra]}
+
+def filtro_listado(
+    estado: Optional[str] = None,
+    proveedor_nit: Optional[str] = None,
+    usuario: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> dict:
+    filtro = {}
+    if estado:
+        filtro["EstadoGeneral"] = estado
+    if proveedor_nit:
+        filtro["ProveedorNIT"] = proveedor_nit
+    if usuario:
+        filtro["UsuarioSolicitante"] = usuario
+    if desde or hasta:
+        filtro["FechaCreacion"] = {}
+        if desde:
+            filtro["FechaCreacion"]["$gte"] = desde
+        if hasta:
+            filtro["FechaCreacion"]["$lt"] = hasta
+    if cursor:
+        # Keyset sobre el orden (FechaCreacion desc, _id desc)
+        fecha, oid = decodificar_cursor(cursor)
+        filtro = {"$and": [filtro, {"$or": [
+            {"FechaCreacion": {"$lt": fecha}},
+            {"FechaCreacion": fecha, "_id": {"$lt": oid}}
+        ]}]}
+    return filtro
+
+def resumen_desde_doc(doc: dict) -> SolicitudResumenModel:
+    return SolicitudResumenModel(**{k: v for k, v in doc.items() if k != "_id"})
 
 @router.get("/solicitudes", response_model=List[SolicitudModel])
 async def list_solicitudes():
-    solicitudes = []
-    async for doc in db.Solicitud.find():
-        solicitudes.append(SolicitudModel(**doc))
-    return solicitudes
+    """
+    Lista todas las solicitudes completas. Para listados grandes use GET /solicitudes/pagina,
+    que pagina y proyecta solo los campos del resumen.
+    """
+    docs = await db.Solicitud.find().to_list(length=None)
+    return [SolicitudModel(**doc) for doc in await evaluation_store.hidratar_varios(docs)]
+
+@router.get("/solicitudes/pagina", response_model=SolicitudPaginaModel)
+async def list_solicitudes_pagina(
+    limite: int = Query(LISTADO_LIMITE_DEFECTO, ge=1, le=LISTADO_LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    campos: Optional[str] = None,
+    estado: Optional[str] = None,
+    proveedor_nit: Optional[str] = None,
+    usuario: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+):
+    """
+    Lista solicitudes de la más reciente a la más antigua, por páginas.
+    Para la página siguiente se envía `cursor` con el valor de `siguiente_cursor`.
+    """
+    filtro = filtro_listado(estado, proveedor_nit, usuario, desde, hasta, cursor)
+    docs = await db.Solicitud.find(filtro, proyeccion_listado(campos)).sort(ORDEN_LISTADO).limit(limite + 1).to_list(length=limite + 1)
+    siguiente = codificar_cursor(docs[limite - 1]) if len(docs) > limite else None
+    return SolicitudPaginaModel(items=[resumen_desde_doc(doc) for doc in docs[:limite]], siguiente_cursor=siguiente)
+
+@router.get("/solicitudes/export")
+async def export_solicitudes(
+    campos: Optional[str] = None,
+    estado: Optional[str] = None,
+    proveedor_nit: Optional[str] = None,
+    usuario: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+):
+    """
+    Exporta el historial completo como NDJSON (una solicitud por línea) leyendo el cursor
+    de MongoDB por lotes, sin cargar toda la colección en memoria.
+    """
+    filtro = filtro_listado(estado, proveedor_nit, usuario, desde, hasta)
+    proyeccion = proyeccion_listado(campos)
+
+    async def generar():
+        cursor = db.Solicitud.find(filtro, proyeccion).sort(ORDEN_LISTADO).batch_size(EXPORTACION_BATCH_SIZE)
+        async for doc in cursor:
+            yield resumen_desde_doc(doc).model_dump_json() + "\n"
+
+    return StreamingResponse(
+        generar(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="solicitudes.ndjson"'}
+    )
+
+def evento_sse(nombre: str, datos: dict) -> str:
+    return f"event: {nombre}\ndata: {json_dumps(datos)}\n\n"
+
+def termino_con_fallas(estados: dict) -> bool:
+    """
+    True si las tres dimensiones terminaron y alguna falló: la solicitud ya no llegará a completado.
+    """
+    return (
+        all(estados.get(t.value) in ESTADOS_TERMINALES for t in TipoAsistenteEnum)
+        and any(estados.get(t.value) == "failed" for t in TipoAsistenteEnum)
+    )
+
+@router.get("/solicitud/{solicitud_id}/eventos")
+async def stream_solicitud_eventos(solicitud_id: str):
+    """
+    Server-sent events con el progreso de la solicitud: primero un evento `estado` con el estado
+    actual y luego un evento `dimension` por cada evaluación que termina y `completado` al final,
+    momento en que se cierra el stream. Si las tres dimensiones terminan y alguna quedó "failed"
+    la solicitud no se completará y el stream se cierra tras ese evento `dimension`.
+    Reemplaza la consulta periódica de GET /solicitud/{id}.
+    """
+    # Suscribirse antes de leer el estado para no perder cambios entre ambas operaciones
+    cola = event_bus.subscribe(solicitud_id)
+    doc = await db.Solicitud.find_one(
+        {"SolicitudID": solicitud_id},
+        {"Estado": 1, "EstadoGeneral": 1, "EvaluacionDesdeCache": 1, "FechaFinalizacion": 1}
+    )
+    if not doc:
+        event_bus.unsubscribe(solicitud_id, cola)
+        raise HTTPException(status_code=404, detail="Solicitud not found")
+
+    async def generar():
+        try:
+            yield evento_sse("estado", {
+                "SolicitudID": solicitud_id,
+                "EstadoGeneral": doc.get("EstadoGeneral"),
+                "Estado": doc.get("Estado", {}),
+                "EvaluacionDesdeCache": doc.get("EvaluacionDesdeCache", {}),
+                "FechaFinalizacion": doc["FechaFinalizacion"].isoformat() if doc.get("FechaFinalizacion") else None
+            })
+            estados = dict(doc.get("Estado", {}))
+            if doc.get("EstadoGeneral") == "completado" or termino_con_fallas(estados):
+                return
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=EVENTOS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield evento_sse(evento["tipo"], {"SolicitudID": solicitud_id, **evento})
+                if evento["tipo"] == EVENTO_COMPLETADO:
+                    return
+                if evento["tipo"] == EVENTO_DIMENSION:
+                    estados[evento["dimension"]] = evento["estado"]
+                    if termino_con_fallas(estados):
+                        return
+        finally:
+            event_bus.unsubscribe(solicitud_id, cola)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.put("/solicitud/{solicitud_id}", response_model=SolicitudModel)
 async def update_solicitud(solicitud_id: str, solicitud: SolicitudModel):
-    result = await db.Solicitud.replace_one({"SolicitudID": solicitud_id}, solicitud.dict())
+    """
+    Actualiza los campos del modelo con $set; los campos internos que no están en el modelo se
+    conservan. Las evaluaciones pasan por evaluation_store.separar, igual que al evaluar.
+    """
+    if not await db.Solicitud.find_one({"SolicitudID": solicitud_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Solicitud not found")
+    solicitud.SolicitudID = solicitud_id
+    datos = solicitud.dict(exclude={"EvaluacionExterna", *(c for campos in CAMPOS_POR_DIMENSION.values() for c in campos)})
+    for tipo_asistente, campos in CAMPOS_POR_DIMENSION.items():
+        evaluacion, externa = await evaluation_store.separar(
+            solicitud_id, tipo_asistente.value, {campo: getattr(solicitud, campo) for campo in campos}
+        )
+        datos.update(evaluacion)
+        datos[f"EvaluacionExterna.{tipo_asistente.value}"] = externa
+    result = await db.Solicitud.update_one({"SolicitudID": solicitud_id}, {"$set": datos})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Solicitud not found")
     return solicitud
 
 @router.delete("/solicitud/{solicitud_id}")
 async def delete_solicitud(solicitud_id: str):
-    result = await db.Solicitud.delete_one({"SolicitudID": solicitud_id})
-    if result.deleted_count == 0:
+    doc = await db.Solicitud.find_one_and_delete(
+        {"SolicitudID": solicitud_id}, projection={"VectorStoreID": 1, "Anexos": 1, "RecursosLiberados": 1}
+    )
+    if doc is None:
         raise HTTPException(status_code=404, detail="Solicitud not found")
-    return {"detail": "Solicitud deleted"}
\ No newline at end of file
+    await evaluation_store.eliminar(solicitud_id)
+    if not doc.get("RecursosLiberados"):
+        # Una solicitud borrada antes de terminar no vuelve a pasar por finalizar_solicitud
+        try:
+            await liberar_recursos_solicitud(doc, crear_assistant(TipoAsistenteEnum.ambiental))
+        except Exception as e:
+            logger.error(f"No se pudieron liberar los anexos de la solicitud {solicitud_id}: {str(e)}")
+    return {"detail": "Solicitud deleted"}
+@router.get("/diagnostico/http")
+async def get_http_pool_stats():
+    return http_pool_stats()
+
+@router.delete("/cache/evaluaciones")
+async def invalidar_cache_evaluaciones(
+    assistant_id: Optional[str] = None,
+    dimension: Optional[TipoAsistenteEnum] = None
+):
+    """
+    Invalida los resultados en caché, por ejemplo tras cambiar las instrucciones de un asistente.
+    Sin parámetros elimina toda la caché.
+    """
+    eliminados = await evaluation_cache.invalidar(assistant_id, dimension.value if dimension else None)
+    return {"detail": "Caché de evaluaciones invalidada", "eliminados": eliminados}
+
+@router.get("/diagnostico/openai")
+async def get_rate_limiter_stats():
+    """
+    Estado del limitador de peticiones hacia OpenAI (cuotas vistas en x-ratelimit-*, esperas y 429).
+    """
+    return rate_limiter.estado()
+
+@router.get("/diagnostico/eventos")
+async def get_event_bus_stats():
+    return event_bus.estado()
+
+@router.get("/diagnostico/archivos")
+async def get_file_janitor_stats():
+    return file_janitor.estado()
+
+@router.post("/diagnostico/archivos/depurar")
+async def run_file_janitor():
+    """
+    Ejecuta de inmediato la limpieza de archivos huérfanos: los de la caché de subidas que llevan
+    más de VIGIA_JANITOR_TTL_HORAS sin referencias.
+    """
+    eliminados = await file_janitor.ejecutar(crear_assistant(TipoAsistenteEnum.ambiental))
+    return {"eliminados": eliminados}
+
+@router.get("/diagnostico/jobs")
+async def get_job_queue_stats():
+    return await job_queue.resumen()
+
+@router.get("/diagnostico/indices")
+async def get_query_plans():
+    """
+    Planes de ejecución de las consultas frecuentes sobre Solicitud; `collscan` indica recorrido completo.
+    """
+    return await explicar_consultas(db.Solicitud)
@@ -0,0 +1,62 @@
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo import UpdateOne
+
+from services.motor_evaluacion import FAST_PATH_MAX_ANEXOS, es_anexo_texto
+
+logger = logging.getLogger("vigia.anexos")
+
+# --- Configuración de los textos de anexos para el motor completions ---
+# Días sin uso tras los que MongoDB elimina el texto de un anexo (índice TTL)
+ANEXO_TEXTO_TTL_DIAS = float(os.getenv("VIGIA_ANEXO_TEXTO_TTL_DIAS", "30"))
+
+
+class AnexoTextStore:
+    """
+    Texto de los anexos pequeños que el motor completions envía en el mensaje, fuera del documento
+    de Solicitud: un documento por contenido (_id = sha256), compartido entre solicitudes.
+    La Solicitud conserva solo id, nombre, sha256 y tamaño de cada anexo.
+    """
+
+    def __init__(self, collection, ttl_dias: float = ANEXO_TEXTO_TTL_DIAS):
+        self.collection = collection
+        self.ttl_dias = ttl_dias
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("ultimo_uso", expireAfterSeconds=int(self.ttl_dias * 86400))
+
+    async def guardar(self, anexos: List[Dict[str, Any]]) -> int:
+        """
+        Guarda el texto de los anexos que lo traen, en un solo bulk_write idempotente.
+        """
+        now = datetime.utcnow()
+        operaciones = [
+            UpdateOne(
+                {"_id": a["sha256"]},
+                {"$setOnInsert": {"texto": a["texto"], "creado": now}, "$set": {"ultimo_uso": now}},
+                upsert=True
+            )
+            for a in anexos
+            if a.get("sha256") and a.get("texto") is not None
+        ]
+        if not operaciones:
+            return 0
+        await self.collection.bulk_write(operaciones, ordered=False)
+        return len(operaciones)
+
+    async def hidratar(self, anexos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Copia de los anexos con su "texto" cuando está guardado. Solo consulta si todos los anexos
+        pueden ir en el mensaje (pocos y de texto); si no, retorna los anexos sin cambios.
+        """
+        if not anexos or len(anexos) > FAST_PATH_MAX_ANEXOS or not all(
+            a.get("sha256") and es_anexo_texto(a.get("filename", "")) for a in anexos
+        ):
+            return anexos
+        textos = {}
+        async for doc in self.collection.find({"_id": {"$in": [a["sha256"] for a in anexos]}}, {"texto": 1}):
+            textos[doc["_id"]] = doc["texto"]
+        return [{**a, "texto": textos[a["sha256"]]} if a["sha256"] in textos else a for a in anexos]
@@ -0,0 +1,101 @@
+import gzip
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# --- Configuración de la compresión de respuestas ---
+COMPRESION_HABILITADA = os.getenv("VIGIA_COMPRESION", "true").lower() in ("1", "true", "yes")
+COMPRESION_MINIMO = int(os.getenv("VIGIA_COMPRESION_MINIMO", "1024"))
+COMPRESION_NIVEL_GZIP = int(os.getenv("VIGIA_COMPRESION_NIVEL_GZIP", "6"))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("VIGIA_COMPRESION_NIVEL_BROTLI", "5"))
+
+# Respuestas que se consumen a medida que llegan: comprimirlas retrasaría cada evento
+TIPOS_SIN_COMPRESION = ("text/event-stream", "application/x-ndjson")
+
+
+def elegir_codificacion(accept_encoding: str, brotli_disponible: bool = brotli is not None) -> Optional[str]:
+    """
+    Codificación a usar según Accept-Encoding: br si el cliente la acepta y brotli está instalado,
+    si no gzip. Las codificaciones con q=0 se consideran rechazadas.
+    """
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                calidad = float(parametros.strip()[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre:
+            aceptadas[nombre.lower()] = calidad
+    if brotli_disponible and aceptadas.get("br", 0) > 0:
+        return "br"
+    if aceptadas.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def comprimir(contenido: bytes, codificacion: str, nivel_gzip: int = COMPRESION_NIVEL_GZIP, nivel_brotli: int = COMPRESION_NIVEL_BROTLI) -> bytes:
+    if codificacion == "br":
+        return brotli.compress(contenido, quality=nivel_brotli)
+    return gzip.compress(contenido, compresslevel=nivel_gzip, mtime=0)
+
+
+class CompresionMiddleware:
+    """
+    Comprime con brotli o gzip las respuestas de un solo bloque que superan `minimo` bytes.
+    Las respuestas por streaming (SSE, NDJSON o cualquier cuerpo enviado en varios bloques)
+    pasan sin cambios para no retener eventos.
+    """
+
+    def __init__(self, app: ASGIApp, minimo: int = COMPRESION_MINIMO):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codificacion = elegir_codificacion(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+        inicio: Optional[Message] = None
+
+        async def enviar(message: Message):
+            nonlocal inicio
+            if message["type"] == "http.response.start":
+                # Se retiene hasta conocer el primer bloque del cuerpo
+                inicio = message
+                return
+            if message["type"] != "http.response.body" or inicio is None:
+                await send(message)
+                return
+            start, inicio = inicio, None
+            headers = MutableHeaders(raw=start["headers"])
+            cuerpo = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(cuerpo) < self.minimo
+                or "content-encoding" in headers
+                or headers.get("content-type", "").startswith(TIPOS_SIN_COMPRESION)
+            ):
+                await send(start)
+                await send(message)
+                return
+            comprimido = comprimir(cuerpo, codificacion)
+            headers["Content-Encoding"] = codificacion
+            headers["Content-Length"] = str(len(comprimido))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": comprimido})
+
+        await self.app(scope, receive, enviar)
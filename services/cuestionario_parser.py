@@ -0,0 +1,197 @@
+import logging
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+from typing import Optional, List, Dict, Any
+from models import TipoAsistenteEnum
+
+logger = logging.getLogger("vigia.cuestionario")
+
+HOJA_CUESTIONARIO = "Cuestionario"
+# La fila 4 de la hoja contiene los encabezados
+FILAS_OMITIDAS = 3
+# Columnas A a P
+MAX_COLUMNAS = 16
+COLUMNA_DIMENSION = "dimensión"
+SIN_DIMENSION = "Sin dimensión"
+# Campo de cada grupo del cuestionario con las dimensiones (TipoAsistenteEnum) a las que pertenece
+CAMPO_TIPOS = "tipos"
+# Campo de cada grupo con los pesos y puntajes de la hoja, en columnas alineadas con "items".
+# No se envían al asistente: los usa el cálculo local de puntajes (services/puntaje.py)
+CAMPO_PESOS = "pesos"
+CAMPOS_PESO = {
+    "puntaje_respuesta": "puntaje_respuesta",
+    "peso_criterio": "peso_criterio",
+    "puntaje_del_criterio": "puntaje_del_criterio",
+    "peso_dimensión": "peso_dimension",
+}
+
+CAMPOS_EXCLUIR = frozenset({
+    "opciones_de_respuesta",
+    "puntaje_respuesta",
+    "peso_criterio",
+    "puntaje_del_criterio",
+    "puntaje_de_la_dimensión",
+    "peso_dimensión",
+    "puntaje_final"
+})
+CAMPOS_RENOMBRAR = {
+    "calificación_asigne_en_la_columna_el_puntaje_de_la_respuesta_que_más_se_ajusta_a_la_realidad_de_tu_empresa.": "calificacion_por_proveedor",
+    "soportes_aplicables_para_justificar_respuesta_estos_son_algunos_ejemplos_de_los_soportes_que_puedes_anexar_para_comprobar_la_respuesta_seleccionada.": "soportes",
+    "justificación_explica_brevemente_lo_que_la_empresa_realiza_acorde_a_la_respuesta_seleccionada.": "justificacion_por_proveedor",
+}
+
+
+def _normalizar_columna(col) -> str:
+    return str(col).replace('\n', ' ').replace('\r', ' ').strip().lower().replace(" ", "_")
+
+
+def _convertir_valor(value):
+    # Misma conversión de celdas que aplica pandas.read_excel con openpyxl
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    return value
+
+
+def _leer_filas(fuente) -> List[list]:
+    """
+    Lee solo la hoja 'Cuestionario' con el lector de openpyxl en modo read-only, valor por valor,
+    recortando filas vacías al final y limitando las columnas a las que se procesan.
+    """
+    if hasattr(fuente, "seek"):
+        fuente.seek(0)
+    workbook = load_workbook(fuente, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[HOJA_CUESTIONARIO]
+        sheet.reset_dimensions()
+        filas: List[list] = []
+        ultima_con_datos = -1
+        ancho = 0
+        for numero, row in enumerate(sheet.iter_rows(values_only=True)):
+            fila = [_convertir_valor(v) for v in row]
+            while fila and fila[-1] == "":
+                fila.pop()
+            if fila:
+                ultima_con_datos = numero
+            fila = fila[:MAX_COLUMNAS]
+            ancho = max(ancho, len(fila))
+            filas.append(fila)
+    finally:
+        workbook.close()
+    filas = filas[: ultima_con_datos + 1]
+    return [fila + [""] * (ancho - len(fila)) for fila in filas]
+
+
+def _leer_dataframe(fuente) -> pd.DataFrame:
+    filas = _leer_filas(fuente)
+    if not filas:
+        return pd.DataFrame()
+    # TextParser es el mismo motor que usa read_excel: conserva la inferencia de tipos y valores NA
+    try:
+        parser = TextParser(filas, header=0, skiprows=FILAS_OMITIDAS, skip_blank_lines=False)
+        return parser.read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def _columna_como_texto(serie: pd.Series) -> np.ndarray:
+    """
+    Convierte la columna a texto sin saltos de línea; las celdas vacías quedan como "".
+    """
+    vacias = serie.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(serie) or isinstance(serie.dtype, pd.PeriodDtype):
+        texto = serie.map(str, na_action="ignore").to_numpy(dtype=object, copy=True)
+    else:
+        texto = serie.astype(object).to_numpy(dtype=object, copy=True)
+        texto[vacias] = ""
+        texto = texto.astype(str).astype(object)
+    texto[vacias] = ""
+    # Reemplazo de saltos de línea sobre toda la columna a la vez; el XML no admite "\x00"
+    unido = "\x00".join(texto)
+    if "\n" in unido or "\r" in unido:
+        texto = np.array(unido.replace('\n', ' ').replace('\r', ' ').split("\x00"), dtype=object)
+    return texto
+
+
+def parsear_cuestionario(fuente, pesos: bool = False) -> List[Dict[str, Any]]:
+    """
+    Lee la hoja 'Cuestionario' y retorna [{"dimension": str, "items": [dict, ...]}, ...] con los
+    campos ya depurados (excluidos y renombrados), en el orden en que aparecen en la hoja.
+    Con pesos=True cada grupo incluye además "pesos": {campo: [valor por item]} con las columnas
+    de puntajes y pesos que la depuración excluye de los items.
+    """
+    df = _leer_dataframe(fuente)
+    columnas = [_normalizar_columna(col) for col in df.columns]
+    valores = [_columna_como_texto(df.iloc[:, i]) for i in range(df.shape[1])]
+
+    # Plan de columnas: se calcula una sola vez para toda la hoja
+    if COLUMNA_DIMENSION in columnas:
+        dimensiones = valores[columnas.index(COLUMNA_DIMENSION)]
+    else:
+        dimensiones = np.full(len(df), SIN_DIMENSION, dtype=object)
+    plan = [
+        (CAMPOS_RENOMBRAR.get(col, col), valores[i])
+        for i, col in enumerate(columnas)
+        if col != COLUMNA_DIMENSION and col not in CAMPOS_EXCLUIR
+    ]
+    claves = [k for k, _ in plan]
+    plan_pesos = [(CAMPOS_PESO[col], valores[i]) for i, col in enumerate(columnas) if col in CAMPOS_PESO] if pesos else []
+
+    if len(df) == 0:
+        return []
+    codigos, etiquetas = pd.factorize(dimensiones, sort=False)
+    orden = np.argsort(codigos, kind="stable")
+    limites = np.flatnonzero(np.diff(codigos[orden])) + 1
+    resultado = []
+    for grupo in np.split(orden, limites):
+        if plan:
+            items = [dict(zip(claves, fila)) for fila in zip(*(arr[grupo] for _, arr in plan))]
+        else:
+            items = [{} for _ in grupo]
+        bloque = {"dimension": etiquetas[codigos[grupo[0]]], "items": items}
+        if pesos:
+            bloque[CAMPO_PESOS] = {campo: arr[grupo].tolist() for campo, arr in plan_pesos}
+        resultado.append(bloque)
+    return resultado
+
+
+def parsear_cuestionario_bytes(contenido: bytes, pesos: bool = False) -> List[Dict[str, Any]]:
+    """
+    Variante de parsear_cuestionario que recibe el contenido del archivo; es la que se envía
+    al pool de procesos, donde los objetos de archivo no se pueden serializar.
+    """
+    return parsear_cuestionario(BytesIO(contenido), pesos)
+
+
+def tipos_dimension(nombre: str) -> List[str]:
+    """
+    Dimensiones de evaluación de un grupo del cuestionario según el nombre de su dimensión.
+    """
+    nombre = (nombre or "").lower()
+    tipos = []
+    if "ambiental" in nombre:
+        tipos.append(TipoAsistenteEnum.ambiental.value)
+    if "social" in nombre:
+        tipos.append(TipoAsistenteEnum.social.value)
+    if "económica" in nombre or "gobernanza" in nombre:
+        tipos.append(TipoAsistenteEnum.economica.value)
+    return tipos
+
+
+def cuestionario_dimension(cuestionario: Optional[list], tipo_asistente: TipoAsistenteEnum) -> list:
+    """
+    Grupos del cuestionario que evalúa un asistente. Los grupos sin "tipos" (solicitudes
+    anteriores) se clasifican por el nombre de la dimensión.
+    """
+    return [
+        grupo for grupo in cuestionario or []
+        if tipo_asistente.value in grupo.get(CAMPO_TIPOS, tipos_dimension(grupo.get("dimension", "")))
+    ]
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from pymongo import ReturnDocument
+
+# --- Configuración de la caché de evaluaciones ---
+EVALUATION_CACHE_ENABLED = os.getenv("VIGIA_EVALUACION_CACHE", "true").lower() in ("1", "true", "yes")
+EVALUATION_CACHE_TTL_DAYS = float(os.getenv("VIGIA_EVALUACION_CACHE_TTL_DIAS", "30"))
+
+
+def clave_evaluacion(assistant_id: str, dimension: str, cuestionario: Optional[str], anexos: List[dict]) -> Optional[str]:
+    """
+    Clave de la evaluación: asistente + dimensión + hash del cuestionario de la dimensión +
+    hashes de contenido de los anexos (ordenados). Retorna None si algún anexo no trae sha256,
+    porque sin el contenido no se puede asegurar que la evaluación sea la misma.
+    """
+    hashes = [a.get("sha256") for a in anexos]
+    if any(not h for h in hashes):
+        return None
+    material = json.dumps(
+        [assistant_id, dimension, hashlib.sha256((cuestionario or "").encode("utf-8")).hexdigest(), sorted(hashes)]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """
+    Caché de resultados (pares required_action / assistant_response) de las evaluaciones por dimensión.
+    Las entradas vencen por un índice TTL y se invalidan explícitamente cuando cambian las
+    instrucciones de un asistente.
+    """
+
+    def __init__(self, collection, ttl_days: float = EVALUATION_CACHE_TTL_DAYS):
+        self.collection = collection
+        self.ttl_days = ttl_days
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("creado", expireAfterSeconds=int(self.ttl_days * 86400))
+        await self.collection.create_index([("assistant_id", 1), ("dimension", 1)])
+
+    async def buscar(self, clave: str) -> Optional[List[Dict[str, Any]]]:
+        doc = await self.collection.find_one_and_update(
+            {"_id": clave},
+            {"$inc": {"hits": 1}, "$set": {"ultimo_uso": datetime.utcnow()}},
+            projection={"resultado": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["resultado"] if doc else None
+
+    async def guardar(self, clave: str, assistant_id: str, dimension: str, resultado: List[Dict[str, Any]]):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": clave},
+            {
+                "$set": {"resultado": resultado, "creado": now, "ultimo_uso": now},
+                "$setOnInsert": {"assistant_id": assistant_id, "dimension": dimension, "hits": 0}
+            },
+            upsert=True
+        )
+
+    async def invalidar(self, assistant_id: Optional[str] = None, dimension: Optional[str] = None) -> int:
+        """
+        Elimina las entradas del asistente y/o dimensión indicados (todas si no se indica ninguno).
+        """
+        filtro = {}
+        if assistant_id:
+            filtro["assistant_id"] = assistant_id
+        if dimension:
+            filtro["dimension"] = dimension
+        result = await self.collection.delete_many(filtro)
+        return result.deleted_count
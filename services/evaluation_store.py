@@ -0,0 +1,80 @@
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+import bson
+
+logger = logging.getLogger("vigia.evaluaciones")
+
+# --- Configuración del almacenamiento de evaluaciones grandes ---
+# Por encima de este tamaño (BSON) la evaluación de una dimensión se guarda en la colección
+# lateral EvaluacionDetalle y la Solicitud conserva solo la marca EvaluacionExterna.<dimension>
+EVALUACION_MAX_INLINE_BYTES = int(os.getenv("VIGIA_EVALUACION_MAX_INLINE_BYTES", "16384"))
+
+
+def tamano_bson(campos: Dict[str, Any]) -> int:
+    return len(bson.encode(campos))
+
+
+class EvaluationStore:
+    """
+    Mantiene pequeños los documentos de Solicitud: los campos Evaluacion*/Respuesta* de una
+    dimensión que superan max_inline_bytes se guardan en un documento aparte (uno por solicitud
+    y dimensión) y se reincorporan al leer la solicitud completa.
+    """
+
+    def __init__(self, collection, max_inline_bytes: int = EVALUACION_MAX_INLINE_BYTES):
+        self.collection = collection
+        self.max_inline_bytes = max_inline_bytes
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("SolicitudID")
+
+    async def separar(self, solicitud_id: str, dimension: str, campos: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Retorna los campos a escribir en la Solicitud y si la evaluación quedó en la colección lateral.
+        El documento lateral se escribe antes que la Solicitud, así que una dimensión marcada
+        como terminada siempre tiene su detalle disponible.
+        """
+        if tamano_bson(campos) <= self.max_inline_bytes:
+            return campos, False
+        await self.collection.replace_one(
+            {"_id": f"{solicitud_id}:{dimension}"},
+            {"SolicitudID": solicitud_id, "dimension": dimension, "campos": campos, "creado": datetime.utcnow()},
+            upsert=True
+        )
+        logger.info(f"Evaluación {dimension} de {solicitud_id} guardada aparte ({tamano_bson(campos)} bytes)")
+        return {campo: None for campo in campos}, True
+
+    async def hidratar(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Completa en el documento de Solicitud los campos de las dimensiones guardadas aparte.
+        """
+        dimensiones = [d for d, externa in (doc.get("EvaluacionExterna") or {}).items() if externa]
+        if not dimensiones:
+            return doc
+        async for detalle in self.collection.find({"SolicitudID": doc["SolicitudID"], "dimension": {"$in": dimensiones}}):
+            doc.update(detalle["campos"])
+        return doc
+
+    async def hidratar_varios(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        hidratar para una lista de solicitudes, con una sola consulta a la colección lateral.
+        """
+        ids = [
+            f"{doc['SolicitudID']}:{d}"
+            for doc in docs for d, externa in (doc.get("EvaluacionExterna") or {}).items() if externa
+        ]
+        if not ids:
+            return docs
+        por_solicitud: Dict[str, List[Dict[str, Any]]] = {}
+        async for detalle in self.collection.find({"_id": {"$in": ids}}):
+            por_solicitud.setdefault(detalle["SolicitudID"], []).append(detalle["campos"])
+        for doc in docs:
+            for campos in por_solicitud.get(doc.get("SolicitudID"), []):
+                doc.update(campos)
+        return docs
+
+    async def eliminar(self, solicitud_id: str):
+        await self.collection.delete_many({"SolicitudID": solicitud_id})
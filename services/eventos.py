@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Any, Set, Optional
+
+logger = logging.getLogger("vigia.eventos")
+
+# --- Configuración de eventos de progreso ---
+EVENTOS_CHANGE_STREAM = os.getenv("VIGIA_EVENTOS_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+EVENTOS_MAX_PENDIENTES = int(os.getenv("VIGIA_EVENTOS_MAX_PENDIENTES", "100"))
+EVENTOS_REINTENTO_STREAM = float(os.getenv("VIGIA_EVENTOS_REINTENTO_STREAM", "5"))
+
+EVENTO_DIMENSION = "dimension"
+EVENTO_COMPLETADO = "completado"
+
+
+class EventBus:
+    """
+    Pub/sub en proceso de los cambios de estado de las solicitudes. Cada suscriptor recibe su
+    propia cola acotada; si un cliente lento la llena se descartan sus eventos más antiguos.
+    Con VIGIA_EVENTOS_CHANGE_STREAM los eventos llegan desde el change stream de MongoDB (para
+    despliegues con varios workers) y las publicaciones locales se omiten para no duplicarlos.
+    """
+
+    def __init__(self, change_stream: bool = EVENTOS_CHANGE_STREAM, max_pendientes: int = EVENTOS_MAX_PENDIENTES):
+        self.change_stream = change_stream
+        self.max_pendientes = max_pendientes
+        self._suscriptores: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, solicitud_id: str) -> asyncio.Queue:
+        cola: asyncio.Queue = asyncio.Queue(maxsize=self.max_pendientes)
+        self._suscriptores.setdefault(solicitud_id, set()).add(cola)
+        return cola
+
+    def unsubscribe(self, solicitud_id: str, cola: asyncio.Queue):
+        colas = self._suscriptores.get(solicitud_id)
+        if colas is not None:
+            colas.discard(cola)
+            if not colas:
+                del self._suscriptores[solicitud_id]
+
+    def _entregar(self, solicitud_id: str, evento: Dict[str, Any]):
+        for cola in self._suscriptores.get(solicitud_id, ()):
+            if cola.full():
+                cola.get_nowait()
+            cola.put_nowait(evento)
+
+    def publish(self, solicitud_id: str, evento: Dict[str, Any]):
+        """
+        Publica un evento originado en este proceso.
+        """
+        if not self.change_stream:
+            self._entregar(solicitud_id, evento)
+
+    @staticmethod
+    def eventos_desde_cambio(cambio: Dict[str, Any]) -> list:
+        """
+        Traduce un evento de change stream (update de Solicitud) a los mismos eventos que se publican localmente.
+        """
+        campos = cambio.get("updateDescription", {}).get("updatedFields", {})
+        eventos = []
+        for campo, valor in campos.items():
+            if campo.startswith("Estado."):
+                dimension = campo.split(".", 1)[1]
+                eventos.append({
+                    "tipo": EVENTO_DIMENSION,
+                    "dimension": dimension,
+                    "estado": valor,
+                    "desde_cache": campos.get(f"EvaluacionDesdeCache.{dimension}", False)
+                })
+        if campos.get("EstadoGeneral") == "completado":
+            fecha = campos.get("FechaFinalizacion")
+            eventos.append({
+                "tipo": EVENTO_COMPLETADO,
+                "EstadoGeneral": "completado",
+                "FechaFinalizacion": fecha.isoformat() if fecha else None,
+                # finalizar_solicitud escribe el puntaje en la misma actualización que completa la solicitud
+                "PuntajeConsolidado": campos.get("PuntajeConsolidado"),
+                "NivelGlobal": campos.get("NivelGlobal")
+            })
+        return eventos
+
+    async def _seguir_change_stream(self, collection):
+        pipeline = [
+            {"$match": {"operationType": "update"}},
+            {"$project": {"fullDocument.SolicitudID": 1, "updateDescription.updatedFields": 1}}
+        ]
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document="updateLookup") as stream:
+                    logger.info("Change stream de Solicitud activo")
+                    async for cambio in stream:
+                        solicitud_id = (cambio.get("fullDocument") or {}).get("SolicitudID")
+                        if solicitud_id in self._suscriptores:
+                            for evento in self.eventos_desde_cambio(cambio):
+                                self._entregar(solicitud_id, evento)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Change stream interrumpido: {str(e)}; reintento en {EVENTOS_REINTENTO_STREAM}s")
+                await asyncio.sleep(EVENTOS_REINTENTO_STREAM)
+
+    def start(self, collection):
+        if self.change_stream and self._task is None:
+            self._task = asyncio.create_task(self._seguir_change_stream(collection))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "change_stream": self.change_stream,
+            "solicitudes_suscritas": len(self._suscriptores),
+            "suscriptores": sum(len(c) for c in self._suscriptores.values()),
+        }
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Optional, Callable, Any
+
+logger = logging.getLogger("vigia.executor")
+
+# --- Configuración del executor de parseo (pandas/openpyxl) ---
+PARSE_EXECUTOR = os.getenv("VIGIA_PARSE_EXECUTOR", "process").lower()
+PARSE_WORKERS = int(os.getenv("VIGIA_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARSE_MAX_CONCURRENT = int(os.getenv("VIGIA_PARSE_MAX_CONCURRENT", str(PARSE_WORKERS * 2)))
+PARSE_TIMEOUT = float(os.getenv("VIGIA_PARSE_TIMEOUT", "60"))
+# Los procesos del pool no se crean con fork: el proceso ya tiene hilos (cliente de Motor, httpx)
+# y un fork con hilos vivos puede heredar locks tomados y bloquearse
+PARSE_START_METHOD = os.getenv("VIGIA_PARSE_START_METHOD", "spawn").lower()  # spawn | forkserver
+
+_executor: Optional[Executor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+class ParseTimeoutError(TimeoutError):
+    pass
+
+
+def _crear_executor() -> Executor:
+    if PARSE_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="vigia-parse")
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+
+
+def init_executor() -> Executor:
+    """
+    Crea el executor de trabajo CPU: pool de procesos por defecto (VIGIA_PARSE_EXECUTOR=process)
+    o pool de hilos (thread). Se invoca desde el lifespan de la aplicación.
+    """
+    global _executor, _semaphore
+    if _executor is None:
+        _executor = _crear_executor()
+        logger.info(f"Pool de parseo '{PARSE_EXECUTOR}' con {PARSE_WORKERS} workers")
+    _semaphore = asyncio.Semaphore(PARSE_MAX_CONCURRENT)
+    return _executor
+
+
+def _reciclar_pool(executor: ProcessPoolExecutor):
+    """
+    Reemplaza el pool de procesos y termina sus workers, incluido el que sigue ocupado con la tarea
+    que excedió el tiempo. Las otras tareas del pool viejo fallan con BrokenProcessPool y run_cpu
+    las reintenta en el nuevo.
+    """
+    global _executor
+    if _executor is executor:
+        _executor = _crear_executor()
+    terminar = getattr(executor, "terminate_workers", None)  # Python 3.14+
+    if terminar is not None:
+        terminar()
+        return
+    # Antes de 3.14 el pool no expone sus procesos; si la versión no los tiene, solo se cierra
+    procesos = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for proceso in procesos:
+        proceso.terminate()
+    logger.warning(f"Pool de parseo reciclado: {len(procesos)} procesos terminados")
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Pool de parseo cerrado")
+    _executor = None
+
+
+async def run_cpu(func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Ejecuta func fuera del event loop, limitado por VIGIA_PARSE_MAX_CONCURRENT y con un tiempo
+    máximo por tarea. Con pool de procesos, func y sus argumentos deben ser serializables (pickle).
+    Si se excede el tiempo se lanza ParseTimeoutError y, con pool de procesos, el pool se recicla
+    para no dejar el worker ocupado con la tarea; con pool de hilos la tarea termina en segundo plano.
+    """
+    semaphore = _semaphore or asyncio.Semaphore(PARSE_MAX_CONCURRENT)
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        for intento in range(2):
+            executor = _executor or init_executor()
+            future = loop.run_in_executor(executor, partial(func, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(future, timeout=timeout or PARSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if isinstance(executor, ProcessPoolExecutor):
+                    _reciclar_pool(executor)
+                raise ParseTimeoutError(f"{getattr(func, '__name__', func)} excedió {timeout or PARSE_TIMEOUT}s")
+            except BrokenProcessPool:
+                # El pool se recicló por el timeout de otra tarea (o murió un worker): un reintento
+                if intento:
+                    raise
+                if _executor is executor:
+                    _reciclar_pool(executor)
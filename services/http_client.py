@@ -0,0 +1,126 @@
+import logging
+import os
+import httpx
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger("vigia.http")
+
+# --- Configuración del pool HTTP compartido ---
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("OPENAI_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("OPENAI_HTTP_READ_TIMEOUT", "120"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("OPENAI_HTTP_WRITE_TIMEOUT", "120"))
+HTTP_POOL_TIMEOUT = float(os.getenv("OPENAI_HTTP_POOL_TIMEOUT", "30"))
+HTTP2_ENABLED = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+_stats: Dict[str, int] = {"requests": 0, "responses": 0, "errores_http": 0}
+
+
+def _http2_disponible() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _on_request(request: httpx.Request):
+    _stats["requests"] += 1
+
+
+async def _on_response(response: httpx.Response):
+    _stats["responses"] += 1
+    if response.status_code >= 400:
+        _stats["errores_http"] += 1
+
+
+def init_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Crea el cliente HTTP compartido (keep-alive, opcionalmente HTTP/2) que usan todas las
+    instancias de OpenAIAssistant. Se invoca desde el lifespan de la aplicación.
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        return _client
+    http2 = HTTP2_ENABLED and _http2_disponible()
+    if HTTP2_ENABLED and not http2:
+        logger.info("OPENAI_HTTP2 activo pero el paquete 'h2' no está instalado; se usa HTTP/1.1")
+    _client = httpx.AsyncClient(
+        http2=http2,
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_WRITE_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+    logger.info(f"Cliente compartido creado (http2={http2}, max_connections={HTTP_MAX_CONNECTIONS})")
+    return _client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna el cliente compartido. Si la aplicación no pasó por el lifespan
+    (scripts, pruebas), lo crea de forma perezosa.
+    """
+    if _client is None or _client.is_closed:
+        return init_http_client()
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Cliente compartido cerrado")
+    _client = None
+
+
+def _estado_pool() -> Dict[str, int]:
+    """
+    Conexiones del pool de httpcore. httpx no expone su pool: se lee con getattr y, si la versión
+    instalada no tiene esos atributos, retorna {} en lugar de fallar.
+    """
+    try:
+        pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+        if pool is None:
+            return {}
+        connections = list(pool.connections)
+        return {
+            "conexiones": len(connections),
+            "conexiones_ociosas": sum(1 for c in connections if c.is_idle()),
+            "conexiones_activas": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "peticiones_en_cola": len(getattr(pool, "_requests", None) or []),
+        }
+    except Exception as e:
+        logger.debug(f"Estado del pool HTTP no disponible: {e}")
+        return {}
+
+
+def http_pool_stats() -> Dict[str, Any]:
+    """
+    Estadísticas del cliente compartido: límites del pool y contadores propios de peticiones y
+    respuestas (event hooks), más las conexiones abiertas, ociosas y activas cuando la versión de
+    httpx permite leerlas.
+    """
+    return {
+        "activo": _client is not None and not _client.is_closed,
+        "http2_habilitado": HTTP2_ENABLED and _http2_disponible(),
+        "limites": {
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE,
+            "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        },
+        **_stats,
+        **_estado_pool(),
+    }
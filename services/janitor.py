@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import os
+from typing import Optional, Callable, Dict, Any
+
+logger = logging.getLogger("vigia.janitor")
+
+# --- Configuración de la limpieza periódica de archivos en OpenAI ---
+JANITOR_INTERVAL = float(os.getenv("VIGIA_JANITOR_INTERVALO", "3600"))
+JANITOR_TTL_HOURS = float(os.getenv("VIGIA_JANITOR_TTL_HORAS", "24"))
+
+
+class FileJanitor:
+    """
+    Tarea de fondo que cada `interval` segundos elimina de OpenAI los archivos de la caché de
+    subidas que llevan más de `ttl_hours` sin referencias. Con interval <= 0 queda desactivada.
+    """
+
+    def __init__(self, interval: float = JANITOR_INTERVAL, ttl_hours: float = JANITOR_TTL_HOURS):
+        self.interval = interval
+        self.ttl_hours = ttl_hours
+        self._task: Optional[asyncio.Task] = None
+        self._ultima: Dict[str, Any] = {}
+
+    async def ejecutar(self, assistant) -> int:
+        eliminados = await assistant.depurar_archivos_huerfanos(self.ttl_hours * 3600)
+        self._ultima = {"eliminados": len(eliminados)}
+        return len(eliminados)
+
+    async def _loop(self, crear_assistant: Callable[[], Any]):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.ejecutar(crear_assistant())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._ultima = {"error": str(e)}
+                logger.error(f"Limpieza de archivos: {str(e)}")
+
+    def start(self, crear_assistant: Callable[[], Any]):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop(crear_assistant))
+            logger.info(f"Limpieza de archivos cada {self.interval}s (TTL {self.ttl_hours}h)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def estado(self) -> Dict[str, Any]:
+        return {"activo": self._task is not None, "intervalo": self.interval, "ttl_horas": self.ttl_hours, "ultima": self._ultima}
@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+from pymongo import ReturnDocument, UpdateOne
+from services.metricas import medir, registro, FASE_SEGUNDOS
+
+logger = logging.getLogger("vigia.jobs")
+
+# --- Configuración de la cola de evaluaciones ---
+JOB_WORKERS = int(os.getenv("VIGIA_WORKERS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("VIGIA_JOB_LEASE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("VIGIA_JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("VIGIA_JOB_POLL_INTERVAL", "5"))
+JOB_RETRY_DELAY = float(os.getenv("VIGIA_JOB_RETRY_DELAY", "30"))
+# Workers del proceso que reclaman primero del carril batch (evita que el batch quede sin atender)
+JOB_MIN_BATCH = int(os.getenv("VIGIA_JOB_MIN_BATCH", "1"))
+# Pesos por usuario "usuario=peso,otro=peso" en el reparto de la cola; un usuario sin peso pesa 1
+JOB_PESOS_USUARIO = os.getenv("VIGIA_JOB_PESOS_USUARIO", "")
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_EN_PROCESO = "en_proceso"
+ESTADO_COMPLETADO = "completado"
+ESTADO_FALLIDO = "fallido"
+
+# Carriles: los jobs de solicitudes individuales se reclaman antes que los de cargas masivas
+CARRIL_INTERACTIVO = "interactivo"
+CARRIL_BATCH = "batch"
+PRIORIDAD_CARRIL = {CARRIL_INTERACTIVO: 0, CARRIL_BATCH: 1}
+
+ESPERA_SEGUNDOS = registro.histograma(
+    "vigia_jobs_espera_seconds", "Espera de un job desde que está disponible hasta que un worker lo reclama, por carril",
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+
+def parsear_pesos(texto: str) -> Dict[str, float]:
+    pesos = {}
+    for par in texto.split(","):
+        usuario, _, peso = par.partition("=")
+        if not usuario.strip() or not peso.strip():
+            continue
+        try:
+            valor = float(peso)
+        except ValueError:
+            logger.warning(f"Peso inválido para {usuario.strip()}: {peso}")
+            continue
+        if valor > 0:
+            pesos[usuario.strip()] = valor
+    return pesos
+
+
+class EvaluationJobQueue:
+    """
+    Cola durable de evaluaciones respaldada en MongoDB: un job por (SolicitudID, dimensión).
+    Los workers reclaman jobs de forma atómica con find_one_and_update y mantienen un lease
+    que renuevan mientras procesan; si un worker muere, el lease expira y otro lo retoma.
+
+    Orden de reclamo: el carril interactivo antes que el batch (salvo los primeros `min_batch`
+    workers, que prefieren el batch) y, dentro de un carril, weighted fair queuing entre usuarios:
+    cada job recibe al encolarse un `turno` = max(turno del primer job pendiente del carril,
+    último turno pendiente del usuario) + 1 / peso, y se reclama el menor. Un usuario con cientos
+    de jobs pendientes avanza a su ritmo sin tapar el primer job de los demás.
+    """
+
+    def __init__(
+        self,
+        collection,
+        workers: int = JOB_WORKERS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        min_batch: int = JOB_MIN_BATCH,
+        pesos: Optional[Dict[str, float]] = None
+    ):
+        self.collection = collection
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.min_batch = min_batch
+        self.pesos = parsear_pesos(JOB_PESOS_USUARIO) if pesos is None else pesos
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._al_fallar: Optional[Callable[[Dict[str, Any], str], Awaitable[Any]]] = None
+        self._en_proceso = 0
+        self._procesados = 0
+        self._fallidos = 0
+        # Profundidad por carril, refrescada por los workers para los gauges de /metrics
+        self._en_espera: Dict[str, int] = {CARRIL_INTERACTIVO: 0, CARRIL_BATCH: 0}
+        self._espera_mas_antigua: Dict[str, float] = {CARRIL_INTERACTIVO: 0.0, CARRIL_BATCH: 0.0}
+
+    @staticmethod
+    def job_id(solicitud_id: str, dimension: str) -> str:
+        return f"{solicitud_id}:{dimension}"
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("estado", 1), ("prioridad", 1), ("turno", 1), ("creado", 1)])
+        await self.collection.create_index([("estado", 1), ("carril", 1), ("usuario", 1), ("turno", -1)])
+        await self.collection.create_index([("estado", 1), ("lease_hasta", 1)])
+        await self.collection.create_index("SolicitudID")
+
+    async def _turno_base(self, carril: str, usuario: str) -> float:
+        """
+        Turno desde el que se numeran los nuevos jobs del usuario en el carril.
+        """
+        pendiente = {"estado": ESTADO_PENDIENTE, "carril": carril}
+        primero = await self.collection.find_one(pendiente, projection={"turno": 1}, sort=[("turno", 1)])
+        ultimo = await self.collection.find_one(
+            {**pendiente, "usuario": usuario}, projection={"turno": 1}, sort=[("turno", -1)]
+        )
+        return max((primero or {}).get("turno") or 0.0, (ultimo or {}).get("turno") or 0.0)
+
+    async def _turnos(self, carril: str, usuarios: List[str]) -> List[float]:
+        """
+        Turno de cada job, en orden, para jobs encolados juntos por los usuarios dados.
+        """
+        siguientes: Dict[str, float] = {}
+        turnos = []
+        for usuario in usuarios:
+            if usuario not in siguientes:
+                siguientes[usuario] = await self._turno_base(carril, usuario)
+            siguientes[usuario] += 1 / self.pesos.get(usuario, 1.0)
+            turnos.append(siguientes[usuario])
+        return turnos
+
+    def _operacion_enqueue(
+        self, solicitud_id: str, dimension: str, carril: str, usuario: str, turno: float, extra: Dict[str, Any], now: datetime
+    ) -> tuple:
+        return (
+            {"_id": self.job_id(solicitud_id, dimension)},
+            {"$setOnInsert": {
+                "SolicitudID": solicitud_id,
+                "dimension": dimension,
+                "estado": ESTADO_PENDIENTE,
+                "carril": carril,
+                "prioridad": PRIORIDAD_CARRIL[carril],
+                "usuario": usuario,
+                "turno": turno,
+                "intentos": 0,
+                "creado": now,
+                "disponible_desde": now,
+                "lease_hasta": None,
+                "worker": None,
+                **extra
+            }}
+        )
+
+    async def enqueue(
+        self, solicitud_id: str, dimension: str, carril: str = CARRIL_INTERACTIVO, usuario: str = "", **extra
+    ) -> str:
+        """
+        Registra el job de forma idempotente: si ya existe para (SolicitudID, dimensión) no se duplica.
+        """
+        turno, = await self._turnos(carril, [usuario])
+        filtro, update = self._operacion_enqueue(solicitud_id, dimension, carril, usuario, turno, extra, datetime.utcnow())
+        await self.collection.update_one(filtro, update, upsert=True)
+        self._wakeup.set()
+        return self.job_id(solicitud_id, dimension)
+
+    async def enqueue_many(self, jobs: List[Dict[str, Any]], carril: str = CARRIL_BATCH) -> int:
+        """
+        Encola varios jobs {"SolicitudID", "dimension", "usuario", ...} en un solo bulk_write idempotente.
+        """
+        if not jobs:
+            return 0
+        now = datetime.utcnow()
+        turnos = await self._turnos(carril, [job.get("usuario", "") for job in jobs])
+        operaciones = [
+            UpdateOne(*self._operacion_enqueue(
+                job["SolicitudID"], job["dimension"], carril, job.get("usuario", ""), turno,
+                {k: v for k, v in job.items() if k not in ("SolicitudID", "dimension", "usuario")}, now
+            ), upsert=True)
+            for job, turno in zip(jobs, turnos)
+        ]
+        result = await self.collection.bulk_write(operaciones, ordered=False)
+        self._wakeup.set()
+        return result.upserted_count
+
+    async def claim(self, worker_id: str, batch_primero: bool = False) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {"$or": [
+                {"estado": ESTADO_PENDIENTE, "disponible_desde": {"$lte": now}},
+                {"estado": ESTADO_EN_PROCESO, "lease_hasta": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "estado": ESTADO_EN_PROCESO,
+                    "worker": worker_id,
+                    "lease_hasta": now + timedelta(seconds=self.lease_seconds),
+                    "actualizado": now
+                },
+                "$inc": {"intentos": 1}
+            },
+            sort=[("prioridad", -1 if batch_primero else 1), ("turno", 1), ("creado", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None and job.get("disponible_desde"):
+            ESPERA_SEGUNDOS.observar(
+                max((now - job["disponible_desde"]).total_seconds(), 0.0), carril=job.get("carril", CARRIL_INTERACTIVO)
+            )
+        return job
+
+    async def complete(self, job: Dict[str, Any]):
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker": job["worker"]},
+            {"$set": {"estado": ESTADO_COMPLETADO, "lease_hasta": None, "actualizado": datetime.utcnow()}}
+        )
+
+    async def fail(self, job: Dict[str, Any], error: str):
+        """
+        Reprograma el job con espera creciente o, agotados sus intentos, lo marca fallido y
+        notifica el fallo definitivo al callback al_fallar de start().
+        """
+        now = datetime.utcnow()
+        definitivo = job.get("intentos", 0) >= self.max_attempts
+        if not definitivo:
+            update = {
+                "estado": ESTADO_PENDIENTE,
+                "disponible_desde": now + timedelta(seconds=JOB_RETRY_DELAY * job.get("intentos", 1)),
+            }
+        else:
+            update = {"estado": ESTADO_FALLIDO}
+        result = await self.collection.update_one(
+            {"_id": job["_id"], "worker": job["worker"]},
+            {"$set": {**update, "lease_hasta": None, "ultimo_error": error, "actualizado": now}}
+        )
+        if definitivo and result.modified_count and self._al_fallar is not None:
+            try:
+                await self._al_fallar(job, error)
+            except Exception as e:
+                logger.error(f"No se pudo notificar el fallo definitivo de {job['_id']}: {str(e)}")
+
+    async def _renovar_lease(self, job: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.collection.update_one(
+                    {"_id": job["_id"], "worker": job["worker"], "estado": ESTADO_EN_PROCESO},
+                    {"$set": {"lease_hasta": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                logger.error(f"No se pudo renovar lease de {job['_id']}: {str(e)}")
+
+    async def _worker(self, worker_id: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]], batch_primero: bool = False):
+        while not self._stopping:
+            try:
+                job = await self.claim(worker_id, batch_primero)
+            except Exception as e:
+                logger.error(f"{worker_id} no pudo reclamar job: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job["intentos"] > self.max_attempts:
+                # Lease expirado de un job que ya agotó sus intentos
+                await self.fail(job, "Intentos agotados")
+                continue
+            logger.info(f"{worker_id} procesa {job['_id']} (intento {job['intentos']})")
+            self._en_proceso += 1
+            heartbeat = asyncio.create_task(self._renovar_lease(job))
+            try:
+                with medir(FASE_SEGUNDOS, logger, fase="job", dimension=job.get("dimension")):
+                    await handler(job)
+                await self.complete(job)
+                self._procesados += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{job['_id']} falló: {str(e)}")
+                self._fallidos += 1
+                try:
+                    await self.fail(job, str(e))
+                except Exception as e2:
+                    logger.error(f"No se pudo registrar fallo de {job['_id']}: {str(e2)}")
+            finally:
+                heartbeat.cancel()
+                self._en_proceso -= 1
+
+    async def _ensure_indexes_safe(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logger.error(f"No se pudieron crear índices de la cola: {str(e)}")
+
+    def start(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        al_fallar: Optional[Callable[[Dict[str, Any], str], Awaitable[Any]]] = None
+    ):
+        """
+        Arranca los workers de este proceso. Con workers=0 el proceso solo encola
+        y deja el procesamiento a otras réplicas. al_fallar(job, error) se invoca cuando un job
+        queda fallido sin más reintentos, incluido el lease vencido de un job que agotó sus intentos.
+        """
+        if self._tasks or self.workers <= 0:
+            return
+        self._al_fallar = al_fallar
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._ensure_indexes_safe()))
+        self._tasks.append(asyncio.create_task(self._medir_profundidad()))
+        # Con un solo worker no se reserva nada: el carril interactivo conserva la prioridad
+        reservados = max(0, min(self.min_batch, self.workers - 1))
+        for n in range(self.workers):
+            worker_id = f"{self.worker_prefix}:{n}"
+            self._tasks.append(asyncio.create_task(self._worker(worker_id, handler, batch_primero=n < reservados)))
+        logger.info(f"{self.workers} workers de evaluación iniciados ({self.worker_prefix}, {reservados} con prioridad batch)")
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def profundidad(self) -> Dict[str, Dict[str, float]]:
+        """
+        Jobs pendientes por carril y segundos que lleva disponible el más antiguo.
+        """
+        now = datetime.utcnow()
+        en_espera = {CARRIL_INTERACTIVO: 0, CARRIL_BATCH: 0}
+        async for row in self.collection.aggregate([
+            {"$match": {"estado": ESTADO_PENDIENTE, "disponible_desde": {"$lte": now}}},
+            {"$group": {"_id": "$carril", "total": {"$sum": 1}}}
+        ]):
+            en_espera[row["_id"]] = row["total"]
+        mas_antigua = {}
+        for carril in en_espera:
+            primero = await self.collection.find_one(
+                {"estado": ESTADO_PENDIENTE, "carril": carril, "disponible_desde": {"$lte": now}},
+                projection={"disponible_desde": 1}, sort=[("disponible_desde", 1)]
+            ) if en_espera[carril] else None
+            mas_antigua[carril] = round((now - primero["disponible_desde"]).total_seconds(), 3) if primero else 0.0
+        self._en_espera = en_espera
+        self._espera_mas_antigua = mas_antigua
+        return {carril: {"en_espera": en_espera[carril], "espera_mas_antigua": mas_antigua[carril]} for carril in en_espera}
+
+    async def _medir_profundidad(self):
+        while not self._stopping:
+            try:
+                await self.profundidad()
+            except Exception as e:
+                logger.error(f"No se pudo medir la profundidad de la cola: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    @property
+    def en_proceso(self) -> int:
+        return self._en_proceso
+
+    @property
+    def en_espera(self) -> Dict[str, int]:
+        return dict(self._en_espera)
+
+    @property
+    def espera_mas_antigua(self) -> Dict[str, float]:
+        return dict(self._espera_mas_antigua)
+
+    async def resumen(self) -> Dict[str, Any]:
+        conteo = {}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$estado", "total": {"$sum": 1}}}]):
+            conteo[row["_id"]] = row["total"]
+        return {
+            "jobs": conteo,
+            "carriles": await self.profundidad(),
+            "workers_batch_primero": max(0, min(self.min_batch, self.workers - 1)),
+            "workers_locales": self.workers,
+            "en_proceso_local": self._en_proceso,
+            "procesados_local": self._procesados,
+            "fallidos_local": self._fallidos,
+        }
@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+# Configuración de logs de la aplicación. Todos los módulos usan loggers bajo "vigia";
+# el bucle de consulta de runs usa "vigia.openai.poll", con nivel propio para no inundar
+# los logs con cada cambio de estado de un run.
+
+# Atributos estándar de LogRecord; el resto proviene de `extra` y se emite como campo estructurado
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class FormatoJSON(logging.Formatter):
+    """
+    Una línea JSON por registro con los campos pasados en `extra` (solicitud_id, dimension, span, duracion...).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        datos.update({k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_RECORD})
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def configurar_logs(nivel: Optional[str] = None, nivel_poll: Optional[str] = None, formato: Optional[str] = None):
+    """
+    Instala un único handler en el logger "vigia" (idempotente) y fija los niveles. Sin argumentos
+    usa VIGIA_LOG_LEVEL (INFO), VIGIA_LOG_POLL_LEVEL (WARNING) y VIGIA_LOG_FORMATO (texto | json).
+    """
+    nivel = (nivel or os.getenv("VIGIA_LOG_LEVEL", "INFO")).upper()
+    nivel_poll = (nivel_poll or os.getenv("VIGIA_LOG_POLL_LEVEL", "WARNING")).upper()
+    formato = (formato or os.getenv("VIGIA_LOG_FORMATO", "texto")).lower()
+    logger = logging.getLogger("vigia")
+    if not any(getattr(h, "_vigia", False) for h in logger.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler._vigia = True
+        logger.addHandler(handler)
+    for handler in logger.handlers:
+        if getattr(handler, "_vigia", False):
+            handler.setFormatter(
+                FormatoJSON() if formato == "json"
+                else logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+            )
+    logger.setLevel(nivel)
+    logger.propagate = False
+    logging.getLogger("vigia.openai.poll").setLevel(nivel_poll)
@@ -0,0 +1,81 @@
+import json
+import os
+import posixpath
+import shutil
+import zipfile
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from typing import List, Dict, Any, Tuple
+from fastapi import UploadFile
+
+# --- Configuración de cargas masivas ---
+BATCH_MAX_SOLICITUDES = int(os.getenv("VIGIA_BATCH_MAX_SOLICITUDES", "500"))
+BATCH_SPOOL_MAX_BYTES = int(os.getenv("VIGIA_BATCH_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+MANIFIESTO = "manifest.json"
+CAMPOS_REQUERIDOS = ("CodigoProyecto", "ProveedorNombre", "ProveedorNIT", "excel")
+
+
+class ManifiestoError(ValueError):
+    pass
+
+
+def leer_manifiesto(zf: zipfile.ZipFile) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Lee manifest.json del zip: una lista de proveedores con CodigoProyecto, ProveedorNombre,
+    ProveedorNIT, la ruta del Excel ("excel") y opcionalmente las rutas de sus anexos ("anexos").
+    Retorna (entradas válidas, errores por entrada); las rutas se validan contra el contenido del zip.
+    """
+    try:
+        entradas = json.loads(zf.read(MANIFIESTO))
+    except KeyError:
+        raise ManifiestoError(f"El zip no contiene {MANIFIESTO}")
+    except ValueError as e:
+        raise ManifiestoError(f"{MANIFIESTO} no es JSON válido: {e}")
+    if isinstance(entradas, dict):
+        entradas = entradas.get("solicitudes")
+    if not isinstance(entradas, list):
+        raise ManifiestoError(f"{MANIFIESTO} debe ser una lista de solicitudes")
+    if len(entradas) > BATCH_MAX_SOLICITUDES:
+        raise ManifiestoError(f"El lote supera el máximo de {BATCH_MAX_SOLICITUDES} solicitudes")
+
+    nombres = set(zf.namelist())
+    validas, errores = [], []
+    for indice, entrada in enumerate(entradas):
+        if not isinstance(entrada, dict):
+            errores.append({"indice": indice, "error": "La entrada no es un objeto"})
+            continue
+        faltantes = [c for c in CAMPOS_REQUERIDOS if not entrada.get(c)]
+        if faltantes:
+            errores.append({"indice": indice, "error": f"Faltan campos: {', '.join(faltantes)}"})
+            continue
+        anexos = entrada.get("anexos") or []
+        ausentes = [ruta for ruta in [entrada["excel"], *anexos] if ruta not in nombres]
+        if ausentes:
+            errores.append({"indice": indice, "error": f"Archivos no encontrados en el zip: {', '.join(ausentes)}"})
+            continue
+        validas.append({**entrada, "anexos": anexos, "indice": indice})
+    return validas, errores
+
+
+def abrir_miembro(zf: zipfile.ZipFile, ruta: str) -> UploadFile:
+    """
+    Copia un archivo del zip a un temporal (en memoria hasta VIGIA_BATCH_SPOOL_MAX_BYTES) y lo
+    entrega como UploadFile, igual que los anexos recibidos por formulario.
+    """
+    destino = SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_BYTES)
+    with zf.open(ruta) as origen:
+        shutil.copyfileobj(origen, destino)
+    destino.seek(0)
+    return UploadFile(file=destino, filename=posixpath.basename(ruta))
+
+
+def copiar_a_temporal(origen) -> str:
+    """
+    Copia el zip recibido a un archivo temporal en disco y retorna su ruta. El archivo del
+    formulario se cierra al terminar la petición y el lote se prepara después en segundo plano;
+    quien lo prepara elimina el temporal.
+    """
+    with NamedTemporaryFile(prefix="vigia-lote-", suffix=".zip", delete=False) as destino:
+        origen.seek(0)
+        shutil.copyfileobj(origen, destino)
+    return destino.name
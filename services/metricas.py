@@ -0,0 +1,199 @@
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Registro de métricas en proceso con exposición en formato de texto de Prometheus (versión 0.0.4),
+# sin depender de prometheus_client.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS_DEFECTO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+logger = logging.getLogger("vigia.metricas")
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _etiquetas(labels: Dict[str, object]) -> Etiquetas:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _formatear_etiquetas(etiquetas: Etiquetas, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(etiquetas) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    escapar = lambda v: v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, valor: float = 1, **labels):
+        clave = _etiquetas(labels)
+        self.valores[clave] = self.valores.get(clave, 0) + valor
+
+    def valor(self, **labels) -> float:
+        return self.valores.get(_etiquetas(labels), 0)
+
+    def muestras(self) -> List[str]:
+        return [f"{self.nombre}{_formatear_etiquetas(k)} {_numero(v)}" for k, v in sorted(self.valores.items())]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, buckets: Tuple[float, ...] = BUCKETS_DEFECTO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: conteo por bucket (no acumulado), suma y total
+        self.valores: Dict[Etiquetas, Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, **labels):
+        clave = _etiquetas(labels)
+        conteos, totales = self.valores.setdefault(clave, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+        indice = next((i for i, limite in enumerate(self.buckets) if valor <= limite), len(self.buckets))
+        conteos[indice] += 1
+        totales[0] += valor
+        totales[1] += 1
+
+    def conteo(self, **labels) -> int:
+        valores = self.valores.get(_etiquetas(labels))
+        return int(valores[1][1]) if valores else 0
+
+    def muestras(self) -> List[str]:
+        lineas = []
+        for clave, (conteos, (suma, total)) in sorted(self.valores.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave, ('le', _numero(limite)))} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} {int(total)}")
+        return lineas
+
+
+class Gauge:
+    """
+    Valor instantáneo leído al exponer las métricas (por ejemplo, jobs en proceso). Con `etiqueta`,
+    la función retorna un diccionario {valor de la etiqueta: valor} y se expone una muestra por entrada.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], object], etiqueta: Optional[str] = None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiqueta = etiqueta
+
+    def muestras(self) -> List[str]:
+        try:
+            if self.etiqueta:
+                return [
+                    f"{self.nombre}{_formatear_etiquetas(_etiquetas({self.etiqueta: k}))} {_numero(v)}"
+                    for k, v in sorted(self.funcion().items())
+                ]
+            return [f"{self.nombre} {_numero(self.funcion())}"]
+        except Exception as e:
+            logger.warning(f"No se pudo leer el gauge {self.nombre}: {e}")
+            return []
+
+
+class Registro:
+    def __init__(self):
+        self.metricas: Dict[str, object] = {}
+
+    def _registrar(self, metrica):
+        if metrica.nombre in self.metricas:
+            return self.metricas[metrica.nombre]
+        self.metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str) -> Contador:
+        return self._registrar(Contador(nombre, ayuda))
+
+    def histograma(self, nombre: str, ayuda: str, buckets: Tuple[float, ...] = BUCKETS_DEFECTO) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, buckets))
+
+    def gauge(self, nombre: str, ayuda: str, funcion: Callable[[], object], etiqueta: Optional[str] = None) -> Gauge:
+        metrica = Gauge(nombre, ayuda, funcion, etiqueta)
+        self.metricas[nombre] = metrica
+        return metrica
+
+    def exponer(self) -> str:
+        lineas = []
+        for nombre, metrica in sorted(self.metricas.items()):
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {metrica.tipo}")
+            lineas.extend(metrica.muestras())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+# --- Métricas de la aplicación ---
+FASE_SEGUNDOS = registro.histograma(
+    "vigia_fase_seconds", "Duración de cada fase del procesamiento de una solicitud"
+)
+EVALUACION_SEGUNDOS = registro.histograma(
+    "vigia_evaluacion_seconds", "Duración total de la evaluación de una dimensión"
+)
+REINTENTOS = registro.contador(
+    "vigia_reintentos_total", "Reintentos de la aplicación (evaluaciones, consultas de runs, runs adicionales)"
+)
+PROMPT_TOKENS = registro.histograma(
+    "vigia_prompt_tokens", "Tokens estimados del mensaje de evaluación por dimensión",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+OPENAI_REQUEST_SEGUNDOS = registro.histograma(
+    "openai_request_seconds", "Duración de las peticiones a OpenAI por endpoint, método y estado HTTP"
+)
+OPENAI_REINTENTOS = registro.contador(
+    "openai_reintentos_total", "Peticiones a OpenAI reintentadas por el limitador, por motivo"
+)
+
+_ID_RUTA = re.compile(r"/(thread|run|msg|file|vs|asst|call|step)[-_][A-Za-z0-9]+")
+
+
+def endpoint_openai(url: str) -> str:
+    """
+    Ruta de OpenAI sin identificadores, para usarla como etiqueta: /threads/{id}/runs/{id}.
+    """
+    ruta = url.split("/v1", 1)[-1].split("?", 1)[0]
+    return _ID_RUTA.sub("/{id}", ruta)
+
+
+@contextmanager
+def medir(histograma: Histograma, log: Optional[logging.Logger] = None, **labels) -> Iterator[None]:
+    """
+    Span de tiempo: observa la duración en el histograma con la etiqueta resultado=ok|error y,
+    si se entrega un logger, registra el span en nivel DEBUG con sus campos estructurados.
+    """
+    inicio = time.perf_counter()
+    resultado = "ok"
+    try:
+        yield
+    except BaseException:
+        resultado = "error"
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        histograma.observar(duracion, resultado=resultado, **labels)
+        if log is not None and log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                f"span {histograma.nombre} {labels} {duracion:.3f}s",
+                extra={"span": histograma.nombre, "duracion": round(duracion, 6), "resultado": resultado, **labels}
+            )
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Dict, Any
+from pymongo import ASCENDING, DESCENDING
+
+# Índices de la colección Solicitud. Los compuestos terminan en (FechaCreacion, _id) para
+# resolver con el mismo índice los filtros y el orden keyset del listado paginado.
+SOLICITUD_INDICES: List[Dict[str, Any]] = [
+    {"name": "solicitud_id_unico", "keys": [("SolicitudID", ASCENDING)], "unique": True},
+    {"name": "listado", "keys": [("FechaCreacion", DESCENDING), ("_id", DESCENDING)]},
+    {"name": "estado_fecha", "keys": [("EstadoGeneral", ASCENDING), ("FechaCreacion", DESCENDING), ("_id", DESCENDING)]},
+    {"name": "proveedor_fecha", "keys": [("ProveedorNIT", ASCENDING), ("FechaCreacion", DESCENDING), ("_id", DESCENDING)]},
+    {"name": "lote", "keys": [("LoteID", ASCENDING)]},
+    {"name": "usuario_fecha", "keys": [("UsuarioSolicitante", ASCENDING), ("FechaCreacion", DESCENDING), ("_id", DESCENDING)]},
+]
+
+ORDEN_LISTADO = [("FechaCreacion", DESCENDING), ("_id", DESCENDING)]
+
+# Consultas frecuentes del router, con valores de ejemplo; el plan no depende de los valores.
+CONSULTAS_FRECUENTES: List[Dict[str, Any]] = [
+    {"nombre": "solicitud_por_id", "filtro": {"SolicitudID": "0"}},
+    {"nombre": "listado", "filtro": {}, "orden": ORDEN_LISTADO},
+    {"nombre": "listado_por_estado", "filtro": {"EstadoGeneral": "pendiente"}, "orden": ORDEN_LISTADO},
+    {"nombre": "listado_por_proveedor", "filtro": {"ProveedorNIT": "0"}, "orden": ORDEN_LISTADO},
+    {"nombre": "listado_por_usuario", "filtro": {"UsuarioSolicitante": "0"}, "orden": ORDEN_LISTADO},
+    {"nombre": "listado_por_fecha", "filtro": {"FechaCreacion": {"$gte": datetime(2000, 1, 1)}}, "orden": ORDEN_LISTADO},
+]
+
+
+async def ensure_solicitud_indexes(collection):
+    """
+    Crea los índices declarados en SOLICITUD_INDICES (create_index es idempotente).
+    """
+    for indice in SOLICITUD_INDICES:
+        await collection.create_index(indice["keys"], name=indice["name"], unique=indice.get("unique", False))
+
+
+def etapas_plan(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Recorre un winningPlan de explain y retorna sus etapas (stage e índice usado).
+    """
+    etapas = []
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        if "queryPlan" in nodo:
+            # Formato de planes del motor SBE (MongoDB 7+)
+            nodo = nodo["queryPlan"]
+        etapas.append({"stage": nodo.get("stage"), "indice": nodo.get("indexName")})
+        if "inputStage" in nodo:
+            pendientes.append(nodo["inputStage"])
+        pendientes.extend(nodo.get("inputStages", []))
+    return etapas
+
+
+def resumir_explain(nombre: str, explain: Dict[str, Any]) -> Dict[str, Any]:
+    planner = explain.get("queryPlanner", {})
+    etapas = etapas_plan(planner.get("winningPlan", {}))
+    stats = explain.get("executionStats", {})
+    return {
+        "consulta": nombre,
+        "collscan": any(e["stage"] == "COLLSCAN" for e in etapas),
+        "sort_en_memoria": any(e["stage"] == "SORT" for e in etapas),
+        "indices": sorted({e["indice"] for e in etapas if e["indice"]}),
+        "etapas": [e["stage"] for e in etapas],
+        "docs_examinados": stats.get("totalDocsExamined"),
+    }
+
+
+async def explicar_consultas(collection) -> List[Dict[str, Any]]:
+    """
+    Ejecuta explain sobre las consultas frecuentes y reporta cuáles recorren la colección completa.
+    """
+    reporte = []
+    for consulta in CONSULTAS_FRECUENTES:
+        cursor = collection.find(consulta["filtro"]).limit(1)
+        if consulta.get("orden"):
+            cursor = cursor.sort(consulta["orden"])
+        reporte.append(resumir_explain(consulta["nombre"], await cursor.explain()))
+    return reporte
+
+
+async def _main(crear: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+    collection = client["VigIAHackathon"].Solicitud
+    if crear:
+        await ensure_solicitud_indexes(collection)
+        print("[Indices] Índices de Solicitud creados")
+    reporte = await explicar_consultas(collection)
+    for fila in reporte:
+        marca = "COLLSCAN" if fila["collscan"] else "ok"
+        print(f"[Indices] {fila['consulta']:<24} {marca:<9} {', '.join(fila['indices']) or '-'} {' <- '.join(fila['etapas'])}")
+    client.close()
+    return 1 if any(fila["collscan"] for fila in reporte) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisa con explain los planes de las consultas frecuentes de Solicitud")
+    parser.add_argument("--crear", action="store_true", help="Crea los índices antes de revisar los planes")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.crear)))
@@ -0,0 +1,88 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from models import TipoAsistenteEnum
+
+logger = logging.getLogger("vigia.motor")
+
+# Motores de evaluación de una dimensión:
+# - assistants: hilo, mensaje, run, espera y submit_tool_outputs (lee anexos con file_search/code_interpreter)
+# - completions: una sola llamada a chat/completions con salida estructurada (anexos de texto en el mensaje).
+#   Solo usa las instrucciones y la función del asistente, no su file_search ni code_interpreter.
+MOTOR_ASSISTANTS = "assistants"
+MOTOR_COMPLETIONS = "completions"
+MOTOR_AUTO = "auto"
+MOTORES = (MOTOR_AUTO, MOTOR_ASSISTANTS, MOTOR_COMPLETIONS)
+
+# --- Configuración del enrutamiento ---
+# Motor por defecto; VIGIA_MOTOR_EVALUACION_<DIMENSION> (p. ej. _SOCIAL) lo cambia para una dimensión.
+# completions y auto son opcionales: cambian el flujo con el que se evalúa
+MOTOR_EVALUACION = os.getenv("VIGIA_MOTOR_EVALUACION", MOTOR_ASSISTANTS).lower()
+# En modo auto se usa completions si hay a lo sumo este número de anexos, todos de texto...
+FAST_PATH_MAX_ANEXOS = int(os.getenv("VIGIA_FAST_PATH_MAX_ANEXOS", "3"))
+# ...y su texto suma a lo sumo estos bytes (también es el máximo de texto guardado por anexo)
+FAST_PATH_MAX_BYTES = int(os.getenv("VIGIA_FAST_PATH_MAX_BYTES", "32768"))
+
+# Anexos que se pueden enviar como texto en el mensaje (los Excel se envían como CSV)
+EXTENSIONES_TEXTO = (".txt", ".csv", ".md", ".json")
+
+
+def es_anexo_texto(filename: str) -> bool:
+    return filename.lower().endswith(EXTENSIONES_TEXTO + (".xlsx", ".xls"))
+
+
+def motor_configurado(tipo_asistente: TipoAsistenteEnum) -> str:
+    motor = os.getenv(f"VIGIA_MOTOR_EVALUACION_{tipo_asistente.value.upper()}", MOTOR_EVALUACION).lower()
+    if motor not in MOTORES:
+        # completions es opcional: un valor mal escrito no debe activarlo
+        logger.warning(f"Motor de evaluación desconocido '{motor}' para {tipo_asistente.value}; se usa {MOTOR_ASSISTANTS}")
+        return MOTOR_ASSISTANTS
+    return motor
+
+
+def anexos_en_linea(anexos: List[Dict[str, Any]]) -> bool:
+    """
+    True si todos los anexos tienen su texto guardado y caben en el mensaje de una sola llamada.
+    """
+    if len(anexos) > FAST_PATH_MAX_ANEXOS or any(a.get("texto") is None for a in anexos):
+        return False
+    return sum(len(a["texto"].encode("utf-8")) for a in anexos) <= FAST_PATH_MAX_BYTES
+
+
+def usa_conocimiento(definicion: Dict[str, Any]) -> bool:
+    """
+    True si el asistente tiene herramientas distintas de funciones (file_search, code_interpreter)
+    o archivos y vector stores propios, que el motor completions no puede usar.
+    """
+    if any(t.get("type") != "function" for t in definicion.get("tools") or []):
+        return True
+    recursos = definicion.get("tool_resources") or {}
+    return any(
+        valores for recurso in recursos.values() if isinstance(recurso, dict) for valores in recurso.values()
+    )
+
+
+def elegir_motor(
+    tipo_asistente: TipoAsistenteEnum, anexos: List[Dict[str, Any]], definicion: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Motor con el que se evalúa la dimensión. completions solo ve el texto de los anexos, así que
+    se usa únicamente si todos los anexos caben en el mensaje, incluso cuando está forzado. En modo
+    auto además hace falta la definición del asistente (obtener_definicion) y que no use conocimiento
+    propio; sin definición se usa assistants.
+    """
+    motor = motor_configurado(tipo_asistente)
+    if motor == MOTOR_ASSISTANTS:
+        return MOTOR_ASSISTANTS
+    if anexos_en_linea(anexos):
+        if motor == MOTOR_COMPLETIONS:
+            if definicion is not None and usa_conocimiento(definicion):
+                logger.warning(f"Motor completions forzado para {tipo_asistente.value}: se omiten las herramientas de conocimiento del asistente")
+            return MOTOR_COMPLETIONS
+        if definicion is not None and not usa_conocimiento(definicion):
+            return MOTOR_COMPLETIONS
+        return MOTOR_ASSISTANTS
+    if motor == MOTOR_COMPLETIONS:
+        logger.warning(f"Motor completions configurado para {tipo_asistente.value}, pero los anexos no caben en el mensaje; se usa {MOTOR_ASSISTANTS}")
+    return MOTOR_ASSISTANTS
@@ -1,15 +1,294 @@
 import io
 import pandas as pd
-from flask import json
 import httpx
 import asyncio
-from typing import Optional, Dict, Any, List
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from fastapi.concurrency import run_in_threadpool
 from models import TipoAsistenteEnum
+from services.http_client import get_http_client
+from services.executor import run_cpu
+from services.serializacion import json_dumps, json_loads
+from services.metricas import (
+    medir, endpoint_openai, FASE_SEGUNDOS, REINTENTOS, OPENAI_REQUEST_SEGUNDOS, OPENAI_REINTENTOS
+)
+from services.upload_cache import UploadCache, hash_archivo, VARIANTE_CSV, VARIANTE_ORIGINAL
+from services.motor_evaluacion import es_anexo_texto
+
+logger = logging.getLogger("vigia.openai")
+# Bucle de consulta de runs: nivel propio (VIGIA_LOG_POLL_LEVEL) para no inundar los logs
+logger_poll = logging.getLogger("vigia.openai.poll")
+
+# --- Configuración de espera de runs ---
+RUN_STREAMING = os.getenv("OPENAI_RUN_STREAMING", "true").lower() in ("1", "true", "yes")
+POLL_MIN_INTERVAL = float(os.getenv("OPENAI_POLL_MIN_INTERVAL", "0.5"))
+POLL_MAX_INTERVAL = float(os.getenv("OPENAI_POLL_MAX_INTERVAL", "10"))
+POLL_BACKOFF = float(os.getenv("OPENAI_POLL_BACKOFF", "1.5"))
+# Runs adicionales (con recordatorio) en un mismo hilo cuando el run termina sin llamar la función
+RUN_MAX_RECORDATORIOS = int(os.getenv("OPENAI_RUN_MAX_RECORDATORIOS", "2"))
+
+# --- Configuración de vector stores compartidos ---
+SHARED_VECTOR_STORE = os.getenv("OPENAI_SHARED_VECTOR_STORE", "true").lower() in ("1", "true", "yes")
+VECTOR_STORE_EXPIRY_DAYS = int(os.getenv("OPENAI_VECTOR_STORE_EXPIRY_DAYS", "2"))
+CODE_INTERPRETER_MAX_FILES = 20
+
+# --- Configuración del limitador de peticiones (compartido por todo el proceso) ---
+RATE_LIMIT_RPM = float(os.getenv("OPENAI_RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = float(os.getenv("OPENAI_RATE_LIMIT_TPM", "200000"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("OPENAI_RATE_LIMIT_MAX_RETRIES", "5"))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("OPENAI_RATE_LIMIT_BACKOFF_BASE", "1"))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("OPENAI_RATE_LIMIT_BACKOFF_MAX", "60"))
+# --- Configuración del motor completions ---
+# Modelo de la llamada a chat/completions; por defecto el del asistente de la dimensión
+COMPLETIONS_MODEL = os.getenv("OPENAI_COMPLETIONS_MODEL")
+COMPLETIONS_MAX_TOKENS = int(os.getenv("OPENAI_COMPLETIONS_MAX_TOKENS", "4096"))
+# --- Configuración de limpieza de archivos ---
+DELETE_CONCURRENCY = int(os.getenv("OPENAI_DELETE_CONCURRENCY", "8"))
+FILES_PAGE_SIZE = int(os.getenv("OPENAI_FILES_PAGE_SIZE", "1000"))
+
+# Errores de servidor que se reintentan en peticiones idempotentes
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "DELETE")
+
+# Esperas de indexación en curso, compartidas por las dimensiones de una misma solicitud
+_vector_store_waits: Dict[str, "asyncio.Task[bool]"] = {}
+# Definición (modelo, instrucciones y función) de cada asistente, leída una vez por proceso
+_definiciones_assistant: Dict[str, Dict[str, Any]] = {}
+
+RUN_TERMINAL_STATUSES = ("cancelling", "failed", "cancelled", "incomplete", "expired")
+RUN_ACTIVE_STATUSES = ("queued", "in_progress", "requires_action")
+
+# Fases del checkpoint de una evaluación: {"thread_id", "run_id", "fase", "required_action"}
+FASE_HILO = "hilo"        # hilo creado y mensaje enviado, sin run
+FASE_RUN = "run"          # run creado, esperando el llamado a la función
+FASE_ACCION = "accion"    # required_action recibido, esperando que el run complete
+RECORDATORIO_FUNCION = "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
+
+GuardarCheckpoint = Callable[[Dict[str, Any]], Awaitable[None]]
+RUN_STREAM_DECISIVE_EVENTS = (
+    "thread.run.requires_action",
+    "thread.run.completed",
+    "thread.run.failed",
+    "thread.run.cancelling",
+    "thread.run.cancelled",
+    "thread.run.expired",
+    "thread.run.incomplete",
+)
+
+def _segundos_reset(valor: Optional[str]) -> Optional[float]:
+    """
+    Convierte los valores de x-ratelimit-reset-* ("1s", "6m0s", "20ms", "1h2m3.5s") a segundos.
+    """
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    partes = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", valor)
+    if not partes:
+        return None
+    unidades = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * unidades[u] for n, u in partes)
+
+
+def _segundos_retry_after(headers: httpx.Headers) -> Optional[float]:
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    valor = headers.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def estimar_tokens(payload: Any) -> int:
+    """
+    Estimación gruesa (4 caracteres por token) de lo que consume una petición JSON.
+    """
+    if not payload:
+        return 1
+    return max(1, len(json_dumps(payload)) // 4)
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens que se recarga de forma continua a `rate` por segundo hasta `capacity`.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _recargar(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def espera(self, n: float) -> float:
+        """
+        Retorna 0 y descuenta n si hay saldo; si no, los segundos a esperar antes de reintentar.
+        """
+        self._recargar()
+        n = min(n, self.capacity)
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    def reservar(self, n: float) -> float:
+        """
+        Descuenta n aunque el saldo quede negativo y retorna los segundos hasta que la reserva queda
+        cubierta; las reservas siguientes esperan detrás de ella, en orden de llegada.
+        """
+        self._recargar()
+        self.tokens -= min(n, self.capacity)
+        return max(-self.tokens, 0.0) / self.rate
+
+    def ajustar(self, limite: Optional[float], restante: Optional[float]):
+        self._recargar()
+        if limite:
+            self.capacity = limite
+            self.rate = limite / 60
+        if restante is not None:
+            # El servidor es la fuente de verdad: la cuota se comparte con otras réplicas
+            self.tokens = min(self.tokens, restante, self.capacity)
+
+
+class RateLimiter:
+    """
+    Limitador de peticiones y tokens hacia OpenAI compartido por todos los asistentes del proceso.
+    Se ajusta con los encabezados x-ratelimit-* de cada respuesta y se pausa completo ante un
+    429 (Retry-After) o cuando el servidor informa que la cuota restante llegó a cero.
+    """
+
+    def __init__(self, rpm: float = RATE_LIMIT_RPM, tpm: float = RATE_LIMIT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._pausa_hasta = 0.0
+        self._stats: Dict[str, Any] = {
+            "peticiones": 0,
+            "esperas": 0,
+            "segundos_esperados": 0.0,
+            "respuestas_429": 0,
+            "reintentos": 0,
+            "ultimos_encabezados": {},
+        }
+
+    async def acquire(self, tokens: int = 1):
+        """
+        Espera el turno de una petición sin bloquear a las demás mientras duerme. La cuota de
+        peticiones se reserva en orden de llegada (cada petición duerme hasta que su reserva queda
+        cubierta); la de tokens se descuenta cuando hay saldo, así una petición grande que espera
+        tokens no frena las consultas baratas (polls de runs, borrados). Tras cada espera se vuelve
+        a revisar la pausa por 429.
+        """
+        espera = self.requests.reservar(1)
+        while True:
+            espera = max(espera, self._pausa_hasta - time.monotonic())
+            if espera <= 0:
+                espera = self.tokens.espera(tokens)
+                if espera == 0:
+                    break
+            self._stats["esperas"] += 1
+            self._stats["segundos_esperados"] += espera
+            await asyncio.sleep(espera)
+            espera = 0.0
+        self._stats["peticiones"] += 1
+
+    def pausar(self, segundos: float):
+        self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+
+    def registrar(self, response: httpx.Response) -> Optional[float]:
+        """
+        Actualiza las cubetas con los encabezados de la respuesta. Retorna Retry-After (segundos) si viene.
+        """
+        headers = response.headers
+        encabezados = {k: v for k, v in headers.items() if k.startswith("x-ratelimit-")}
+        if encabezados:
+            self._stats["ultimos_encabezados"] = encabezados
+        for tipo, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limite = headers.get(f"x-ratelimit-limit-{tipo}")
+            restante = headers.get(f"x-ratelimit-remaining-{tipo}")
+            try:
+                bucket.ajustar(float(limite) if limite else None, float(restante) if restante else None)
+            except ValueError:
+                continue
+            if restante is not None and restante.strip() == "0":
+                reset = _segundos_reset(headers.get(f"x-ratelimit-reset-{tipo}"))
+                if reset:
+                    self.pausar(reset)
+        retry_after = _segundos_retry_after(headers)
+        if response.status_code == 429:
+            self._stats["respuestas_429"] += 1
+            if retry_after is not None:
+                self.pausar(retry_after)
+        return retry_after
+
+    def backoff(self, intento: int, minimo: float = 0.0) -> float:
+        """
+        Espera exponencial con jitter completo; nunca menor al Retry-After indicado.
+        """
+        self._stats["reintentos"] += 1
+        techo = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * (2 ** intento))
+        return max(minimo, random.uniform(0, techo))
+
+    def estado(self) -> Dict[str, Any]:
+        self.requests._recargar()
+        self.tokens._recargar()
+        return {
+            "requests": {"limite_por_minuto": self.requests.capacity, "disponibles": round(self.requests.tokens, 2)},
+            "tokens": {"limite_por_minuto": self.tokens.capacity, "disponibles": round(self.tokens.tokens, 2)},
+            "pausa_restante": round(max(self._pausa_hasta - time.monotonic(), 0.0), 3),
+            **self._stats,
+            "segundos_esperados": round(self._stats["segundos_esperados"], 3),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def excel_a_csv(contenido: bytes) -> bytes:
+    """
+    Convierte la primera hoja de un Excel a CSV. Se ejecuta en el executor de parseo.
+    """
+    df = pd.read_excel(io.BytesIO(contenido))
+    csv_buffer = io.StringIO()
+    df.to_csv(csv_buffer, index=False)
+    return csv_buffer.getvalue().encode('utf-8')
 
 class OpenAIAssistant:
-    def __init__(self, api_key: str, assistant_id: str):
+    def __init__(
+        self,
+        api_key: str,
+        assistant_id: str,
+        client: Optional[httpx.AsyncClient] = None,
+        streaming: Optional[bool] = None,
+        upload_cache: Optional[UploadCache] = None
+    ):
         self.api_key = api_key
         self.assistant_id = assistant_id
+        # Cliente HTTP inyectado; si no se entrega se usa el pool compartido del proceso
+        self._client = client
+        self.streaming = RUN_STREAMING if streaming is None else streaming
+        # Caché direccionada por contenido para no volver a subir anexos idénticos
+        self.upload_cache = upload_cache
         self.base_url = "https://api.openai.com/v1"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -17,28 +296,180 @@ class OpenAIAssistant:
             "OpenAI-Beta": "assistants=v2"
         }
 
-    async def create_thread(self) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/threads",
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    @staticmethod
+    def _rebobinar(files: Optional[Dict[str, Any]]):
+        for valor in (files or {}).values():
+            contenido = valor[1] if isinstance(valor, tuple) else valor
+            if hasattr(contenido, "seek"):
+                contenido.seek(0)
+
+    async def _request(self, method: str, url: str, tokens: Optional[int] = None, **kwargs) -> httpx.Response:
+        """
+        Envía una petición pasando por el limitador del proceso. Reintenta los 429 (respetando
+        Retry-After) y, en métodos idempotentes, los errores 5xx y de red, con backoff exponencial
+        con jitter. La última respuesta se retorna tal cual para que el llamador decida.
+        """
+        tokens = tokens if tokens is not None else estimar_tokens(kwargs.get("json"))
+        endpoint = endpoint_openai(url)
+        intento = 0
+        while True:
+            await rate_limiter.acquire(tokens)
+            self._rebobinar(kwargs.get("files"))
+            inicio = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.ReadTimeout) as e:
+                OPENAI_REQUEST_SEGUNDOS.observar(time.perf_counter() - inicio, endpoint=endpoint, metodo=method, status="error_red")
+                # Solo se reintenta si la petición no alcanzó a enviarse o es idempotente
+                enviada = isinstance(e, httpx.ReadTimeout)
+                if intento >= RATE_LIMIT_MAX_RETRIES or (enviada and method not in IDEMPOTENT_METHODS):
+                    raise
+                espera = rate_limiter.backoff(intento)
+                OPENAI_REINTENTOS.inc(endpoint=endpoint, motivo="red")
+                logger.warning(f"{method} {url} error de red ({type(e).__name__}); reintento en {espera:.1f}s")
+                await asyncio.sleep(espera)
+                intento += 1
+                continue
+            OPENAI_REQUEST_SEGUNDOS.observar(
+                time.perf_counter() - inicio, endpoint=endpoint, metodo=method, status=response.status_code
+            )
+            retry_after = rate_limiter.registrar(response)
+            reintentable = response.status_code == 429 or (
+                response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS
+            )
+            if not reintentable or intento >= RATE_LIMIT_MAX_RETRIES:
+                return response
+            espera = rate_limiter.backoff(intento, retry_after or 0.0)
+            OPENAI_REINTENTOS.inc(endpoint=endpoint, motivo=str(response.status_code))
+            logger.warning(f"{method} {url} -> {response.status_code}; reintento {intento+1} en {espera:.1f}s")
+            await asyncio.sleep(espera)
+            intento += 1
+
+    async def create_thread(self, tool_resources: Optional[Dict[str, Any]] = None) -> str:
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/threads",
+            headers=self.headers,
+            json={"tool_resources": tool_resources} if tool_resources else None
+        )
+        response.raise_for_status()
+        thread_id = response.json()["id"]
+        logger.info(f"Thread creado: {thread_id}")
+        return thread_id
+
+    async def _invalidar_rechazados(self, response: httpx.Response, file_ids: List[str]):
+        """
+        Si OpenAI rechaza la petición (400/404) nombrando archivos que no existen o no son válidos,
+        los saca de la caché de subidas para que las siguientes solicitudes los vuelvan a subir.
+        """
+        if self.upload_cache is None or response.status_code not in (400, 404):
+            return
+        rechazados = [file_id for file_id in file_ids if file_id in response.text]
+        if rechazados:
+            logger.warning(f"Archivos rechazados por OpenAI, se quitan de la caché: {rechazados}")
+            try:
+                await self.upload_cache.invalidar(rechazados)
+            except Exception as e:
+                logger.error(f"Invalidación de caché de archivos: {str(e)}")
+
+    async def archivo_existe(self, file_id: str) -> bool:
+        """
+        False solo si OpenAI responde 404; ante otros errores se asume que el archivo existe.
+        """
+        try:
+            response = await self._request("GET", f"{self.base_url}/files/{file_id}", headers=self.headers)
+        except Exception as e:
+            logger.warning(f"No se pudo verificar el archivo {file_id}: {str(e)}")
+            return True
+        return response.status_code != 404
+
+    async def create_vector_store(self, file_ids: List[str], name: str) -> str:
+        """
+        Crea un vector store con los archivos indicados; OpenAI los indexa una sola vez
+        y los hilos de las tres dimensiones lo comparten vía tool_resources.
+        """
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/vector_stores",
+            headers=self.headers,
+            json={
+                "name": name,
+                "file_ids": file_ids,
+                "expires_after": {"anchor": "last_active_at", "days": VECTOR_STORE_EXPIRY_DAYS}
+            }
+        )
+        await self._invalidar_rechazados(response, file_ids)
+        response.raise_for_status()
+        vector_store_id = response.json()["id"]
+        logger.info(f"Vector store creado: {vector_store_id} ({len(file_ids)} archivos)")
+        return vector_store_id
+
+    async def _poll_vector_store(self, vector_store_id: str, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = POLL_MIN_INTERVAL
+        while loop.time() < deadline:
+            response = await self._request(
+                "GET",
+                f"{self.base_url}/vector_stores/{vector_store_id}",
                 headers=self.headers
             )
             response.raise_for_status()
-            thread_id = response.json()["id"]
-            print(f"[OpenAI] Thread creado: {thread_id}")
-            return thread_id
+            vector_store = response.json()
+            status = vector_store.get("status")
+            if status == "completed" or (
+                status != "expired" and vector_store.get("file_counts", {}).get("in_progress", 0) == 0
+            ):
+                logger.info(f"Vector store listo: {vector_store_id} {vector_store.get('file_counts')}")
+                return True
+            if status == "expired":
+                logger.error(f"Vector store expirado: {vector_store_id}")
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_INTERVAL)
+        logger.error(f"Timeout esperando indexación del vector store {vector_store_id}")
+        return False
 
-    async def create_message(self, thread_id: str, content: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/threads/{thread_id}/messages",
-                headers=self.headers,
-                json={"role": "user", "content": content}
+    async def wait_vector_store_ready(self, vector_store_id: str, timeout: float = 600.0) -> bool:
+        """
+        Espera a que termine la indexación del vector store. Las esperas concurrentes del mismo
+        vector store dentro del proceso comparten una sola consulta.
+        """
+        task = _vector_store_waits.get(vector_store_id)
+        if task is None:
+            task = asyncio.create_task(self._poll_vector_store(vector_store_id, timeout))
+            _vector_store_waits[vector_store_id] = task
+            task.add_done_callback(lambda _: _vector_store_waits.pop(vector_store_id, None))
+        return await asyncio.shield(task)
+
+    async def delete_vector_store(self, vector_store_id: str):
+        try:
+            response = await self._request(
+                "DELETE",
+                f"{self.base_url}/vector_stores/{vector_store_id}",
+                headers=self.headers
             )
-            response.raise_for_status()
-            message_id = response.json()["id"]
-            print(f"[OpenAI] Mensaje creado en thread {thread_id}: {message_id}")
-            return message_id
+            if response.status_code not in (200, 204, 404):
+                response.raise_for_status()
+            logger.info(f"Vector store eliminado: {vector_store_id}")
+        except Exception as e:
+            logger.error(f"delete_vector_store {vector_store_id}: {str(e)}")
+
+    async def create_message(self, thread_id: str, content: str) -> str:
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/threads/{thread_id}/messages",
+            headers=self.headers,
+            json={"role": "user", "content": content}
+        )
+        response.raise_for_status()
+        message_id = response.json()["id"]
+        logger.info(f"Mensaje creado en thread {thread_id}: {message_id}")
+        return message_id
 
     async def create_message_with_files(self, thread_id: str, content: str, file_ids: Optional[List[str]]) -> Optional[str]:
         """
@@ -74,34 +505,35 @@ class OpenAIAssistant:
                     ],
                     "attachments": attachments
                 }
-                print("Payload enviado a OpenAI:", message_payload)
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/threads/{thread_id}/messages",
-                        headers=self.headers,
-                        json=message_payload
-                    )
-                    response.raise_for_status()
-                    message_id = response.json()["id"]
-                    print(f"[OpenAI] Mensaje con archivos creado en thread {thread_id}: {message_id} (Archivos {i+1}-{i+len(batch)})")
-                    message_ids.append(message_id)
+                logger.debug(f"Payload enviado a OpenAI: {message_payload}")
+                response = await self._request(
+                    "POST",
+                    f"{self.base_url}/threads/{thread_id}/messages",
+                    headers=self.headers,
+                    json=message_payload
+                )
+                await self._invalidar_rechazados(response, batch)
+                response.raise_for_status()
+                message_id = response.json()["id"]
+                logger.info(f"Mensaje con archivos creado en thread {thread_id}: {message_id} (Archivos {i+1}-{i+len(batch)})")
+                message_ids.append(message_id)
             # Retorna el último message_id (o lista si prefieres)
             return message_ids[-1] if message_ids else None
         except Exception as e:
-            print(f"[OpenAI][ERROR] create_message_with_files Unexpected error: {str(e)}")
+            logger.error(f"create_message_with_files Unexpected error: {str(e)}")
             return None
 
     async def create_run(self, thread_id: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/threads/{thread_id}/runs",
-                headers=self.headers,
-                json={"assistant_id": self.assistant_id}
-            )
-            response.raise_for_status()
-            run_id = response.json()["id"]
-            print(f"[OpenAI] Run creado en thread {thread_id}: {run_id}")
-            return run_id
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/threads/{thread_id}/runs",
+            headers=self.headers,
+            json={"assistant_id": self.assistant_id}
+        )
+        response.raise_for_status()
+        run_id = response.json()["id"]
+        logger.info(f"Run creado en thread {thread_id}: {run_id}")
+        return run_id
 
     async def get_run_status(self, thread_id: str, run_id: str, max_retries: int = 10, retry_interval: float = 2.0) -> Dict[str, Any]:
         """
@@ -110,88 +542,284 @@ class OpenAIAssistant:
         attempt = 0
         while attempt < max_retries:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{self.base_url}/threads/{thread_id}/runs/{run_id}",
-                        headers=self.headers
-                    )
-                    response.raise_for_status()
-                    return response.json()
+                response = await self._request(
+                    "GET",
+                    f"{self.base_url}/threads/{thread_id}/runs/{run_id}",
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                return response.json()
             except httpx.HTTPStatusError as e:
-                print(f"[OpenAI][ERROR] get_run_status intento {attempt+1}: {e.response.status_code} - {e.response.text}")
+                logger.error(f"get_run_status intento {attempt+1}: {e.response.status_code} - {e.response.text}")
             except Exception as e:
-                print(f"[OpenAI][ERROR] get_run_status intento {attempt+1}: {str(e)}")
+                logger.error(f"get_run_status intento {attempt+1}: {str(e)}")
+            REINTENTOS.inc(tipo="get_run_status")
             attempt += 1
             await asyncio.sleep(retry_interval)
-        print(f"[OpenAI][ERROR] get_run_status falló tras {max_retries} intentos para run {run_id}")
+        logger.error(f"get_run_status falló tras {max_retries} intentos para run {run_id}")
         return {}
 
+    def _build_tool_outputs(self, required_action: Dict[str, Any]) -> List[Dict[str, str]]:
+        tool_calls = required_action.get("submit_tool_outputs", {}).get("tool_calls", [])
+        return [
+            {
+                "tool_call_id": call["id"],
+                "output": "Ok, función ejecutada correctamente."
+            }
+            for call in tool_calls
+        ]
+
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict[str, str]]):
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/threads/{thread_id}/runs/{run_id}/submit_tool_outputs",
+            headers=self.headers,
+            json={"tool_outputs": tool_outputs}
+        )
+        response.raise_for_status()
+
+    async def _avanzar(
+        self, checkpoint: Optional[Dict[str, Any]], guardar_checkpoint: Optional[GuardarCheckpoint], **cambios
+    ):
+        """
+        Actualiza el checkpoint en sitio y lo persiste. Un fallo al guardarlo no detiene la evaluación.
+        """
+        if checkpoint is None:
+            return
+        checkpoint.update(cambios)
+        if guardar_checkpoint is not None:
+            try:
+                await guardar_checkpoint(dict(checkpoint))
+            except Exception as e:
+                logger.error(f"No se pudo guardar el checkpoint del hilo {checkpoint.get('thread_id')}: {str(e)}")
+
     async def wait_for_required_action(
         self,
         thread_id: str,
         run_id: str,
         tipo_asistente: TipoAsistenteEnum,
-        interval: float = 10.0,
-        timeout: float = 10000.0
+        interval: float = POLL_MAX_INTERVAL,
+        timeout: float = 10000.0,
+        min_interval: float = POLL_MIN_INTERVAL,
+        required_action: Optional[Dict[str, Any]] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        guardar_checkpoint: Optional[GuardarCheckpoint] = None,
+        max_recordatorios: int = RUN_MAX_RECORDATORIOS
     ) -> Optional[Dict[str, Any]]:
-        elapsed = 0
-        required_action_detected = False
-        required_action_response = None
-        while elapsed < timeout:
+        """
+        Consulta el run con backoff adaptativo: empieza con min_interval y crece
+        hasta interval mientras el estado no cambia. Es el modo de respaldo cuando
+        el streaming de eventos no está disponible.
+        Si el run completa sin llamar la función, envía un recordatorio y crea otro run en el
+        mismo hilo, a lo sumo max_recordatorios veces; después retorna None.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        required_action_response = required_action
+        delay = min_interval
+        last_status = None
+        recordatorios = 0
+        while loop.time() < deadline:
             run_status = await self.get_run_status(thread_id, run_id)
             status = run_status.get("status")
-            print(f"[OpenAI] status ({tipo_asistente.value}) {status}")
+            if status != last_status:
+                logger_poll.info(f"status ({tipo_asistente.value}) {status}")
+                last_status = status
             if status == "requires_action" and run_status.get("required_action"):
-                required_action_detected = True
-                required_action = run_status["required_action"]
-                required_action_response = required_action
-                tool_calls = required_action.get("submit_tool_outputs", {}).get("tool_calls", [])
-                tool_outputs = [
-                    {
-                        "tool_call_id": call["id"],
-                        "output": "Ok, función ejecutada correctamente."
-                    }
-                    for call in tool_calls
-                ]
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.base_url}/threads/{thread_id}/runs/{run_id}/submit_tool_outputs",
-                        headers=self.headers,
-                        json={"tool_outputs": tool_outputs}
-                    )
-                    response.raise_for_status()
-                print(f"[OpenAI] Acción requerida completada en run {run_id} ({tipo_asistente.value})")
-                #return {
-                #    "required_action": required_action_response,
-                #    "assistant_response": None
-                #}
+                required_action_response = run_status["required_action"]
+                # Se guarda antes de enviar: al reanudar, un run aún en requires_action se vuelve a enviar
+                await self._avanzar(checkpoint, guardar_checkpoint, fase=FASE_ACCION, required_action=required_action_response)
+                await self.submit_tool_outputs(thread_id, run_id, self._build_tool_outputs(required_action_response))
+                logger.info(f"Acción requerida completada en run {run_id} ({tipo_asistente.value})")
+                # El run retoma su ejecución: volver a consultar rápido
+                delay = min_interval
+                continue
             if status == "completed":
-                if not required_action_detected:
-                    retry_message = (
-                        "Por favor, ejecuta la función configurada en el assistant y entrega el resultado de la revisión."
-                    )
-                    await self.create_message(thread_id, retry_message)
-                    new_run_id = await self.create_run(thread_id)
-                    print(f"[OpenAI] Run adicional creado en thread {thread_id}: {new_run_id} (no hubo required_action inicial)")
-                    return await self.wait_for_required_action(thread_id, new_run_id, tipo_asistente, interval, timeout)
+                if required_action_response is None:
+                    if recordatorios >= max_recordatorios:
+                        logger.warning(f"Run {run_id} completado sin llamar la función tras {recordatorios} recordatorios ({tipo_asistente.value})")
+                        return None
+                    await self.create_message(thread_id, RECORDATORIO_FUNCION)
+                    run_id = await self.create_run(thread_id)
+                    recordatorios += 1
+                    await self._avanzar(checkpoint, guardar_checkpoint, run_id=run_id, fase=FASE_RUN)
+                    REINTENTOS.inc(tipo="run_adicional", dimension=tipo_asistente.value)
+                    logger.info(f"Run adicional creado en thread {thread_id}: {run_id} (no hubo required_action inicial)")
+                    delay = min_interval
+                    last_status = None
+                    continue
                 assistant_response = await self.get_completed_run_response(thread_id, run_id)
-                print(f"[OpenAI] Run completado en thread {thread_id}: {run_id}")
+                logger.info(f"Run completado en thread {thread_id}: {run_id}")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": assistant_response
                 }
-            if status in ["cancelling","failed", "cancelled","incomplete","expired"]:
-                print(f"[OpenAI] Run {run_id} estado ({status})")
+            if status in RUN_TERMINAL_STATUSES:
+                logger.info(f"Run {run_id} estado ({status})")
                 return {
                     "required_action": required_action_response,
                     "assistant_response": status
                 }
-            await asyncio.sleep(interval)
-            elapsed += interval
-        
-        print(f"[OpenAI] wait_for_required_action Timeout esperando required_action o completion en run {run_id}")
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            delay = min(delay * POLL_BACKOFF, interval)
+
+        logger.warning(f"wait_for_required_action Timeout esperando required_action o completion en run {run_id}")
         raise TimeoutError("wait_for_required_action Run did not reach required_action or completed state in time.")
 
+    async def _consume_run_stream(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Abre un run en modo streaming (server-sent events) y consume eventos hasta que el run
+        requiere acción o termina. Retorna {"event", "run_id", "run"}; "event" es None si el
+        stream se cortó antes de un evento decisivo, y "fallback" si el servidor no respondió
+        con un stream (en ese caso "run" trae el objeto run en JSON).
+        """
+        endpoint = endpoint_openai(url)
+        intento = 0
+        while True:
+            await rate_limiter.acquire(estimar_tokens(payload))
+            inicio = time.perf_counter()
+            async with self.client.stream(
+                "POST", url, headers=self.headers, json={**payload, "stream": True}
+            ) as response:
+                # Tiempo hasta los encabezados; la duración del run se mide en la fase esperar_run
+                OPENAI_REQUEST_SEGUNDOS.observar(
+                    time.perf_counter() - inicio, endpoint=endpoint, metodo="POST", status=response.status_code
+                )
+                retry_after = rate_limiter.registrar(response)
+                if response.status_code != 429 or intento >= RATE_LIMIT_MAX_RETRIES:
+                    return await self._leer_stream_run(response)
+                await response.aread()
+            espera = rate_limiter.backoff(intento, retry_after or 0.0)
+            OPENAI_REINTENTOS.inc(endpoint=endpoint, motivo="429")
+            logger.warning(f"stream de run -> 429; reintento {intento+1} en {espera:.1f}s")
+            await asyncio.sleep(espera)
+            intento += 1
+
+    async def _leer_stream_run(self, response: httpx.Response) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"event": None, "run_id": None, "run": None}
+        if response.status_code >= 400:
+            await response.aread()
+            response.raise_for_status()
+        if "text/event-stream" not in response.headers.get("content-type", ""):
+            await response.aread()
+            run = response.json()
+            return {"event": "fallback", "run_id": run.get("id"), "run": run}
+        event = None
+        data_lines: List[str] = []
+        try:
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    continue
+                if line.startswith("data:"):
+                    data_lines.append(line[len("data:"):].strip())
+                    continue
+                if line or not data_lines:
+                    continue
+                # Línea en blanco: fin del evento
+                raw = "\n".join(data_lines)
+                data_lines = []
+                if raw == "[DONE]":
+                    break
+                if not event or not event.startswith("thread.run.") or event.startswith("thread.run.step"):
+                    continue
+                data = json_loads(raw)
+                result["run_id"] = data.get("id", result["run_id"])
+                result["run"] = data
+                if event in RUN_STREAM_DECISIVE_EVENTS:
+                    result["event"] = event
+                    return result
+        except httpx.TransportError as e:
+            logger.error(f"stream de run interrumpido: {str(e)}")
+        return result
+
+    async def stream_required_action(
+        self,
+        thread_id: str,
+        tipo_asistente: TipoAsistenteEnum,
+        timeout: float = 10000.0,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        guardar_checkpoint: Optional[GuardarCheckpoint] = None,
+        max_recordatorios: int = RUN_MAX_RECORDATORIOS
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Crea el run en modo streaming y reacciona a requires_action/completed en cuanto el
+        servidor emite el evento, sin esperas fijas. Mismo contrato de retorno que
+        wait_for_required_action; si el streaming no está disponible pasa a consultar el run.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        required_action_response = None
+        url = f"{self.base_url}/threads/{thread_id}/runs"
+        payload: Dict[str, Any] = {"assistant_id": self.assistant_id}
+        run_id = None
+        recordatorios = 0
+        # Al pasar a consulta periódica se conservan el checkpoint y los recordatorios restantes
+        espera = {"checkpoint": checkpoint, "guardar_checkpoint": guardar_checkpoint}
+        while loop.time() < deadline:
+            try:
+                outcome = await self._consume_run_stream(url, payload)
+            except httpx.HTTPStatusError as e:
+                if run_id is None and e.response.status_code == 400:
+                    # El endpoint no acepta streaming: crear el run de forma tradicional
+                    logger.info(f"Streaming no disponible ({e.response.text}); se usa consulta periódica")
+                    run_id = await self.create_run(thread_id)
+                    await self._avanzar(checkpoint, guardar_checkpoint, run_id=run_id, fase=FASE_RUN)
+                    return await self.wait_for_required_action(
+                        thread_id, run_id, tipo_asistente, timeout=deadline - loop.time(),
+                        max_recordatorios=max_recordatorios - recordatorios, **espera
+                    )
+                raise
+            if outcome["run_id"] and outcome["run_id"] != run_id:
+                run_id = outcome["run_id"]
+                await self._avanzar(checkpoint, guardar_checkpoint, run_id=run_id, fase=FASE_RUN)
+            event = outcome["event"]
+            run = outcome["run"] or {}
+            if event in ("fallback", None):
+                if not run_id:
+                    raise RuntimeError("El stream del run terminó sin identificar el run")
+                logger.info(f"Stream sin evento final para run {run_id} ({tipo_asistente.value}); se continúa con consulta periódica")
+                return await self.wait_for_required_action(
+                    thread_id, run_id, tipo_asistente,
+                    timeout=deadline - loop.time(), required_action=required_action_response,
+                    max_recordatorios=max_recordatorios - recordatorios, **espera
+                )
+            logger_poll.info(f"evento ({tipo_asistente.value}) {event}")
+            if event == "thread.run.requires_action" and run.get("required_action"):
+                required_action_response = run["required_action"]
+                await self._avanzar(checkpoint, guardar_checkpoint, fase=FASE_ACCION, required_action=required_action_response)
+                url = f"{self.base_url}/threads/{thread_id}/runs/{run_id}/submit_tool_outputs"
+                payload = {"tool_outputs": self._build_tool_outputs(required_action_response)}
+                logger.info(f"Acción requerida recibida en run {run_id} ({tipo_asistente.value})")
+                continue
+            if event == "thread.run.completed":
+                if required_action_response is None:
+                    if recordatorios >= max_recordatorios:
+                        logger.warning(f"Run {run_id} completado sin llamar la función tras {recordatorios} recordatorios ({tipo_asistente.value})")
+                        return None
+                    await self.create_message(thread_id, RECORDATORIO_FUNCION)
+                    url = f"{self.base_url}/threads/{thread_id}/runs"
+                    payload = {"assistant_id": self.assistant_id}
+                    recordatorios += 1
+                    REINTENTOS.inc(tipo="run_adicional", dimension=tipo_asistente.value)
+                    logger.info(f"Run adicional en thread {thread_id} (no hubo required_action inicial)")
+                    continue
+                assistant_response = await self.get_completed_run_response(thread_id, run_id)
+                logger.info(f"Run completado en thread {thread_id}: {run_id}")
+                return {
+                    "required_action": required_action_response,
+                    "assistant_response": assistant_response
+                }
+            status = run.get("status") or event.rsplit(".", 1)[-1]
+            logger.info(f"Run {run_id} estado ({status})")
+            return {
+                "required_action": required_action_response,
+                "assistant_response": status
+            }
+
+        logger.warning(f"stream_required_action Timeout esperando required_action o completion en thread {thread_id}")
+        raise TimeoutError("stream_required_action Run did not reach required_action or completed state in time.")
+
     async def get_completed_run_response(self, thread_id: str, run_id: str, max_retries: int = 5, retry_interval: float = 2.0) -> Optional[str]:
         """
         Consulta la respuesta del asistente cuando el run está completado.
@@ -201,173 +829,461 @@ class OpenAIAssistant:
         attempt = 0
         while attempt < max_retries:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"{self.base_url}/threads/{thread_id}/messages",
-                        headers=self.headers
-                    )
-                    response.raise_for_status()
-                    messages = response.json().get("data", [])
-                    assistant_texts = []
-                    for msg in messages:
-                        if msg.get("role") == "assistant":
-                            content = msg.get("content")
-                            if isinstance(content, list):
-                                for c in content:
-                                    if c.get("type") == "text":
-                                        text_obj = c.get("text")
-                                        if isinstance(text_obj, dict):
-                                            assistant_texts.append(text_obj.get("value", ""))
-                                        elif isinstance(text_obj, str):
-                                            assistant_texts.append(text_obj)
-                            elif isinstance(content, str):
-                                assistant_texts.append(content)
-                    return "\n".join(assistant_texts) if assistant_texts else None
+                response = await self._request(
+                    "GET",
+                    f"{self.base_url}/threads/{thread_id}/messages",
+                    headers=self.headers
+                )
+                response.raise_for_status()
+                messages = response.json().get("data", [])
+                assistant_texts = []
+                for msg in messages:
+                    if msg.get("role") == "assistant":
+                        content = msg.get("content")
+                        if isinstance(content, list):
+                            for c in content:
+                                if c.get("type") == "text":
+                                    text_obj = c.get("text")
+                                    if isinstance(text_obj, dict):
+                                        assistant_texts.append(text_obj.get("value", ""))
+                                    elif isinstance(text_obj, str):
+                                        assistant_texts.append(text_obj)
+                        elif isinstance(content, str):
+                            assistant_texts.append(content)
+                return "\n".join(assistant_texts) if assistant_texts else None
             except httpx.HTTPStatusError as e:
-                print(f"[OpenAI][ERROR] get_completed_run_response intento {attempt+1}: {e.response.status_code} - {e.response.text}")
+                logger.error(f"get_completed_run_response intento {attempt+1}: {e.response.status_code} - {e.response.text}")
             except Exception as e:
-                print(f"[OpenAI][ERROR] get_completed_run_response intento {attempt+1}: {str(e)}")
+                logger.error(f"get_completed_run_response intento {attempt+1}: {str(e)}")
+            REINTENTOS.inc(tipo="get_completed_run_response")
             attempt += 1
             await asyncio.sleep(retry_interval)
-        print(f"[OpenAI][ERROR] get_completed_run_response falló tras {max_retries} intentos para thread {thread_id}, run {run_id}")
+        logger.error(f"get_completed_run_response falló tras {max_retries} intentos para thread {thread_id}, run {run_id}")
+        return None
+
+    async def _reanudar_run(
+        self,
+        checkpoint: Dict[str, Any],
+        tipo_asistente: TipoAsistenteEnum,
+        guardar_checkpoint: Optional[GuardarCheckpoint]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Retoma el run del checkpoint: si sigue activo vuelve a consultarlo y, si ya completó
+        después del required_action, solo lee la respuesta. Retorna None si el hilo necesita
+        un run nuevo.
+        """
+        thread_id, run_id = checkpoint["thread_id"], checkpoint["run_id"]
+        required_action = checkpoint.get("required_action")
+        status = (await self.get_run_status(thread_id, run_id)).get("status")
+        logger.info(f"Reanudando run {run_id} del hilo {thread_id} ({tipo_asistente.value}): {status}")
+        if status in RUN_ACTIVE_STATUSES:
+            return await self.wait_for_required_action(
+                thread_id, run_id, tipo_asistente, required_action=required_action,
+                checkpoint=checkpoint, guardar_checkpoint=guardar_checkpoint
+            )
+        if status == "completed" and required_action:
+            return {
+                "required_action": required_action,
+                "assistant_response": await self.get_completed_run_response(thread_id, run_id)
+            }
         return None
 
     async def run_assistant_flow(
         self,
         user_message: str,
         tipo_asistente: TipoAsistenteEnum,
-        file_ids: Optional[List[str]] = None
+        file_ids: Optional[List[str]] = None,
+        vector_store_id: Optional[str] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+        guardar_checkpoint: Optional[GuardarCheckpoint] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Ejecuta el flujo completo: crea hilo, mensaje (con archivos si hay), run y espera el llamado a función.
+        Si se entrega vector_store_id, el hilo usa ese vector store compartido en lugar de adjuntar
+        los archivos en lotes.
+        Con checkpoint (se actualiza en sitio y se persiste con guardar_checkpoint en cada fase),
+        un reintento o un proceso reiniciado retoma el hilo existente: sigue esperando el run
+        activo o envía un recordatorio y crea un run nuevo en el mismo hilo, sin reenviar archivos.
         Retorna el required_action si se dispara, None si termina sin requerir acción.
         """
+        checkpoint = checkpoint if checkpoint is not None else {}
         try:
-            thread_id = await self.create_thread()
-            if file_ids:
-                await self.create_message_with_files(thread_id, "Estos son los archivos que debes revisar", file_ids)
-            await self.create_message(thread_id, user_message)
-            run_id = await self.create_run(thread_id)
-            result = await self.wait_for_required_action(thread_id, run_id, tipo_asistente=tipo_asistente)
-            return result
+            thread_id = checkpoint.get("thread_id")
+            if thread_id:
+                if checkpoint.get("run_id"):
+                    with medir(FASE_SEGUNDOS, logger, fase="esperar_run", dimension=tipo_asistente.value):
+                        result = await self._reanudar_run(checkpoint, tipo_asistente, guardar_checkpoint)
+                    if result:
+                        return result
+                    await self.create_message(thread_id, RECORDATORIO_FUNCION)
+                    await self._avanzar(checkpoint, guardar_checkpoint, run_id=None, fase=FASE_HILO, required_action=None)
+                REINTENTOS.inc(tipo="reanudacion", dimension=tipo_asistente.value)
+                logger.info(f"Nuevo run en el hilo existente {thread_id} ({tipo_asistente.value})")
+            else:
+                with medir(FASE_SEGUNDOS, logger, fase="indexar_vector_store", dimension=tipo_asistente.value):
+                    listo = not vector_store_id or await self.wait_vector_store_ready(vector_store_id)
+                if not listo:
+                    logger.warning(f"Vector store {vector_store_id} no disponible; se adjuntan los archivos al hilo")
+                    vector_store_id = None
+                with medir(FASE_SEGUNDOS, logger, fase="crear_hilo", dimension=tipo_asistente.value):
+                    if vector_store_id:
+                        tool_resources = {"file_search": {"vector_store_ids": [vector_store_id]}}
+                        if file_ids:
+                            tool_resources["code_interpreter"] = {"file_ids": file_ids[:CODE_INTERPRETER_MAX_FILES]}
+                        thread_id = await self.create_thread(tool_resources=tool_resources)
+                    else:
+                        thread_id = await self.create_thread()
+                        if file_ids:
+                            await self.create_message_with_files(thread_id, "Estos son los archivos que debes revisar", file_ids)
+                    await self.create_message(thread_id, user_message)
+                await self._avanzar(
+                    checkpoint, guardar_checkpoint, thread_id=thread_id, run_id=None, fase=FASE_HILO, required_action=None
+                )
+            with medir(FASE_SEGUNDOS, logger, fase="esperar_run", dimension=tipo_asistente.value):
+                if self.streaming:
+                    return await self.stream_required_action(
+                        thread_id, tipo_asistente=tipo_asistente, checkpoint=checkpoint, guardar_checkpoint=guardar_checkpoint
+                    )
+                run_id = await self.create_run(thread_id)
+                await self._avanzar(checkpoint, guardar_checkpoint, run_id=run_id, fase=FASE_RUN)
+                result = await self.wait_for_required_action(
+                    thread_id, run_id, tipo_asistente=tipo_asistente, checkpoint=checkpoint, guardar_checkpoint=guardar_checkpoint
+                )
+                return result
+        except httpx.HTTPStatusError as e:
+            logger.error(f"run_assistant_flow {tipo_asistente.value} {e.response.status_code} - {e.response.text}")
+            if e.response.status_code == 404 and checkpoint.get("thread_id"):
+                # El hilo del checkpoint ya no existe: el siguiente intento empieza de cero
+                await self._avanzar(checkpoint, guardar_checkpoint, thread_id=None, run_id=None, fase=None, required_action=None)
+            return None
+        except Exception as e:
+            logger.error(f"run_assistant_flow Unexpected error: {str(e)}")
+            return None
+
+    async def obtener_definicion(self) -> Dict[str, Any]:
+        """
+        Modelo, instrucciones y herramientas del asistente. Se consulta una vez por proceso.
+        """
+        definicion = _definiciones_assistant.get(self.assistant_id)
+        if definicion is None:
+            response = await self._request("GET", f"{self.base_url}/assistants/{self.assistant_id}", headers=self.headers)
+            response.raise_for_status()
+            definicion = _definiciones_assistant[self.assistant_id] = response.json()
+        return definicion
+
+    async def run_completions_flow(
+        self,
+        user_message: str,
+        tipo_asistente: TipoAsistenteEnum,
+        anexos: Optional[List[Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Evalúa la dimensión con una sola llamada a chat/completions: las instrucciones y la función
+        del asistente se convierten en un response_format json_schema cuyos "argumentos" son los
+        parámetros de la función. Los anexos van como texto en el mensaje. Retorna el mismo
+        {"required_action", "assistant_response"} que run_assistant_flow, o None si falla.
+        """
+        try:
+            definicion = await self.obtener_definicion()
+            funcion = next(
+                (t["function"] for t in definicion.get("tools") or [] if t.get("type") == "function"), None
+            )
+            if funcion is None:
+                logger.warning(f"El asistente {self.assistant_id} no tiene una función configurada; no aplica el motor completions")
+                return None
+            schema = {
+                "type": "object",
+                "properties": {
+                    "argumentos": funcion.get("parameters") or {"type": "object"},
+                    "respuesta": {"type": "string", "description": "Observaciones y recomendaciones de la evaluación"}
+                },
+                "required": ["argumentos", "respuesta"],
+                "additionalProperties": False
+            }
+            documentos = "\n\n".join(
+                f"--- Anexo {a['filename']} (ID: {a['id']}) ---\n{a['texto']}" for a in anexos or [] if a.get("texto")
+            )
+            instrucciones = (
+                f"{definicion.get('instructions') or ''}\n\n"
+                f"Entrega en \"argumentos\" los argumentos con los que llamarías la función {funcion['name']} "
+                "y en \"respuesta\" tus observaciones y recomendaciones."
+            )
+            payload = {
+                "model": COMPLETIONS_MODEL or definicion.get("model"),
+                "messages": [
+                    {"role": "system", "content": instrucciones},
+                    {"role": "user", "content": f"{user_message}\n\n{documentos}" if documentos else user_message}
+                ],
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": funcion["name"], "schema": schema, "strict": bool(funcion.get("strict"))}
+                },
+                "max_completion_tokens": COMPLETIONS_MAX_TOKENS
+            }
+            if definicion.get("temperature") is not None:
+                payload["temperature"] = definicion["temperature"]
+            with medir(FASE_SEGUNDOS, logger, fase="completions", dimension=tipo_asistente.value):
+                response = await self._request(
+                    "POST", f"{self.base_url}/chat/completions", headers=self.headers, json=payload
+                )
+            response.raise_for_status()
+            result = response.json()
+            mensaje = result["choices"][0]["message"]
+            if mensaje.get("refusal") or not mensaje.get("content"):
+                logger.warning(f"run_completions_flow {tipo_asistente.value} sin contenido: {mensaje.get('refusal')}")
+                return None
+            salida = json_loads(mensaje["content"])
+            return {
+                "required_action": {
+                    "type": "submit_tool_outputs",
+                    "submit_tool_outputs": {"tool_calls": [{
+                        "id": f"call_{result.get('id', '')}",
+                        "type": "function",
+                        "function": {"name": funcion["name"], "arguments": json_dumps(salida["argumentos"])}
+                    }]}
+                },
+                "assistant_response": salida.get("respuesta")
+            }
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] run_assistant_flow {tipo_asistente.value} {e.response.status_code} - {e.response.text}")
+            logger.error(f"run_completions_flow {tipo_asistente.value} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] run_assistant_flow Unexpected error: {str(e)}")
+            logger.error(f"run_completions_flow Unexpected error: {str(e)}")
             return None
 
+    @staticmethod
+    def _archivo_fuente(file):
+        """
+        Retorna el objeto de archivo subyacente (el SpooledTemporaryFile de un UploadFile)
+        posicionado al inicio, para que httpx lo lea por bloques al construir el multipart.
+        """
+        source = getattr(file, "file", file)
+        source.seek(0)
+        return source
+
     async def upload_file_from_formdata(self, file, filename: str, purpose: str = "assistants") -> Optional[Dict[str, Any]]:
         """
         Sube un archivo recibido como FormData (por ejemplo, desde FastAPI) al API de OpenAI.
         """
         try:
-            async with httpx.AsyncClient() as client:
-                files = {"file": (filename, await file.read(), "application/octet-stream")}
-                data = {"purpose": purpose}
-                response = await client.post(
-                    f"{self.base_url}/files",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "OpenAI-Beta": "assistants=v2"
-                    },
-                    data=data,
-                    files=files
-                )
-                response.raise_for_status()
-                file_id = response.json().get("id")
-                print(f"[OpenAI] Archivo subido: {file_id} ({filename})")
-                return response.json()
+            files = {"file": (filename, self._archivo_fuente(file), "application/octet-stream")}
+            data = {"purpose": purpose}
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/files",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "OpenAI-Beta": "assistants=v2"
+                },
+                data=data,
+                files=files
+            )
+            response.raise_for_status()
+            file_id = response.json().get("id")
+            logger.info(f"Archivo subido: {file_id} ({filename})")
+            return response.json()
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
+            logger.error(f"Upload file:{filename} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
+            logger.error(f"{filename} Unexpected error al subir archivo: {str(e)}")
             return None
         
     # ...existing code...
 
-    async def upload_file_from_formdata_v2(self, file, filename: str, purpose: str = "assistants") -> Optional[Dict[str, Any]]:
+    async def upload_file_from_formdata_v2(
+        self, file, filename: str, purpose: str = "assistants", texto_max_bytes: int = 0
+    ) -> Optional[Dict[str, Any]]:
         """
         Sube un archivo recibido como FormData (por ejemplo, desde FastAPI) al API de OpenAI.
-        Si el archivo es Excel, lo convierte a CSV antes de subirlo.
+        Si el archivo es Excel, lo convierte a CSV antes de subirlo; los demás archivos
+        se envían en streaming desde el archivo temporal, sin cargarlos completos en memoria.
+        Con texto_max_bytes, los anexos de texto (y los Excel como CSV) que no superan ese tamaño
+        se retornan también en "texto" para el motor completions.
         """
         try:
-            file_bytes = await file.read()
+            source = self._archivo_fuente(file)
+            es_excel = filename.lower().endswith(('.xlsx', '.xls'))
+            variante = VARIANTE_CSV if es_excel else VARIANTE_ORIGINAL
+            tamano = source.seek(0, io.SEEK_END)
+            source.seek(0)
+            csv = None
+            texto = None
+            if texto_max_bytes and tamano <= texto_max_bytes and es_anexo_texto(filename):
+                contenido = source.read()
+                source.seek(0)
+                if es_excel:
+                    with medir(FASE_SEGUNDOS, logger, fase="excel_a_csv"):
+                        contenido = csv = await run_cpu(excel_a_csv, contenido)
+                if len(contenido) <= texto_max_bytes:
+                    texto = contenido.decode("utf-8", errors="replace")
+            en_linea = {"bytes": tamano, "texto": texto}
+            sha256 = None
+            if self.upload_cache is not None:
+                # Un anexo puede pesar varios MB: el hash se calcula fuera del event loop
+                sha256 = await run_in_threadpool(hash_archivo, source)
+                try:
+                    cached = await self.upload_cache.buscar(sha256, variante)
+                except Exception as e:
+                    logger.error(f"Consulta de caché de archivos: {str(e)}")
+                    cached = None
+                if cached and not await self.archivo_existe(cached["file_id"]):
+                    # Eliminado en OpenAI fuera de la aplicación: se saca de la caché y se vuelve a subir
+                    logger.warning(f"Archivo en caché ya no existe en OpenAI: {cached['file_id']} ({filename})")
+                    await self.upload_cache.invalidar([cached["file_id"]])
+                    cached = None
+                if cached:
+                    logger.info(f"Archivo en caché: {cached['file_id']} ({filename})")
+                    return {"id": cached["file_id"], "filename": cached["filename"], "sha256": sha256, "cached": True, **en_linea}
             # Detecta si es un archivo Excel por la extensión
-            if filename.lower().endswith(('.xlsx', '.xls')):
-                # Convierte el Excel a CSV
-                excel_io = io.BytesIO(file_bytes)
-                df = pd.read_excel(excel_io)
-                csv_buffer = io.StringIO()
-                df.to_csv(csv_buffer, index=False)
-                file_bytes = csv_buffer.getvalue().encode('utf-8')
+            if es_excel:
+                # Convierte el Excel a CSV fuera del event loop
+                if csv is None:
+                    with medir(FASE_SEGUNDOS, logger, fase="excel_a_csv"):
+                        csv = await run_cpu(excel_a_csv, source.read())
+                payload = csv
+                size = len(payload)
                 filename = filename.rsplit('.', 1)[0] + ".txt"
                 mime_type = "text"
             else:
+                payload = source
+                size = source.seek(0, io.SEEK_END)
+                source.seek(0)
                 mime_type = "application/octet-stream"
-            async with httpx.AsyncClient() as client:
-                files = {"file": (filename, file_bytes, mime_type)}
-                data = {"purpose": purpose}
-                response = await client.post(
-                    f"{self.base_url}/files",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "OpenAI-Beta": "assistants=v2"
-                    },
-                    data=data,
-                    files=files
-                )
-                response.raise_for_status()
-                file_id = response.json().get("id")
-                print(f"[OpenAI] Archivo subido: {file_id} ({filename})")
-                return response.json()
+            files = {"file": (filename, payload, mime_type)}
+            data = {"purpose": purpose}
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/files",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "OpenAI-Beta": "assistants=v2"
+                },
+                data=data,
+                files=files
+            )
+            response.raise_for_status()
+            result = {**response.json(), **en_linea}
+            file_id = result.get("id")
+            logger.info(f"Archivo subido: {file_id} ({filename})")
+            if self.upload_cache is not None:
+                result["sha256"] = sha256
+                try:
+                    cached_id = await self.upload_cache.registrar(sha256, variante, file_id, filename, size)
+                except Exception as e:
+                    logger.error(f"Registro en caché de archivos: {str(e)}")
+                    cached_id = file_id
+                if cached_id != file_id:
+                    # Otra subida concurrente del mismo contenido quedó registrada primero
+                    await self.delete_file(file_id)
+                    result["id"] = cached_id
+            return result
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] Upload file:{filename} {e.response.status_code} - {e.response.text}")
+            logger.error(f"Upload file:{filename} {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] {filename} Unexpected error al subir archivo: {str(e)}")
+            logger.error(f"{filename} Unexpected error al subir archivo: {str(e)}")
             return None
+
+    async def delete_file(self, file_id: str) -> bool:
+        """
+        Elimina un archivo de OpenAI. Un 404 se considera eliminado.
+        """
+        response = await self._request(
+            "DELETE",
+            f"{self.base_url}/files/{file_id}",
+            headers=self.headers
+        )
+        if response.status_code in (200, 204, 404):
+            logger.info(f"Archivo eliminado: {file_id}")
+            return True
+        logger.error(f"No se pudo eliminar archivo: {file_id} - {response.status_code}")
+        return False
 # ...existing code...
         
-    async def depureFiles(self):
+    async def _eliminar_archivos(self, file_ids: List[str]) -> List[str]:
+        """
+        Elimina archivos en paralelo, con a lo sumo OPENAI_DELETE_CONCURRENCY peticiones a la vez.
+        Retorna los que quedaron eliminados.
         """
-        Consulta todos los archivos en OpenAI y los elimina uno por uno.
+        semaforo = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+        async def eliminar(file_id: str) -> bool:
+            async with semaforo:
+                try:
+                    return await self.delete_file(file_id)
+                except Exception as e:
+                    logger.error(f"delete_file {file_id}: {str(e)}")
+                    return False
+
+        resultados = await asyncio.gather(*(eliminar(file_id) for file_id in file_ids))
+        return [file_id for file_id, ok in zip(file_ids, resultados) if ok]
+
+    async def depureFiles(self, file_ids: List[str]) -> List[str]:
+        """
+        Elimina de OpenAI los archivos de una solicitud que ya no usa ninguna otra; los que siguen
+        referenciados en la caché de subidas se conservan. Los que no se pudieron eliminar quedan
+        registrados para la limpieza periódica.
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Obtener la lista de archivos
-                response = await client.get(
-                    f"{self.base_url}/files",
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                files = response.json().get("data", [])
-                print(f"[OpenAI] Archivos encontrados: {len(files)}")
-                # Eliminar cada archivo
-                for file in files:
-                    file_id = file.get("id")
-                    if file_id:
-                        del_response = await client.delete(
-                            f"{self.base_url}/files/{file_id}",
-                            headers=self.headers
-                        )
-                        if del_response.status_code == 204:
-                            print(f"[OpenAI] Archivo eliminado: {file_id}")
-                        else:
-                            print(f"[OpenAI][ERROR] No se pudo eliminar archivo: {file_id} - {del_response.status_code}")
+            if self.upload_cache is not None:
+                file_ids = await self.upload_cache.reclamar_libres(file_ids)
+            file_ids = list(dict.fromkeys(file_ids))
+            eliminados = await self._eliminar_archivos(file_ids)
+            if self.upload_cache is not None and len(eliminados) < len(file_ids):
+                await self.upload_cache.pendientes_de_borrado([f for f in file_ids if f not in set(eliminados)])
+            logger.info(f"Archivos eliminados: {len(eliminados)}/{len(file_ids)}")
+            return eliminados
         except Exception as e:
-            print(f"[OpenAI][ERROR] depureFiles Unexpected error: {str(e)}")
-    
+            logger.error(f"depureFiles Unexpected error: {str(e)}")
+            return []
+
+    async def listar_archivos(self, purpose: Optional[str] = None):
+        """
+        Recorre /files página por página (cursor `after`) y entrega cada archivo.
+        """
+        params: Dict[str, Any] = {"limit": FILES_PAGE_SIZE, "order": "asc"}
+        if purpose:
+            params["purpose"] = purpose
+        while True:
+            response = await self._request("GET", f"{self.base_url}/files", headers=self.headers, params=params)
+            response.raise_for_status()
+            pagina = response.json()
+            archivos = pagina.get("data", [])
+            for archivo in archivos:
+                yield archivo
+            if not pagina.get("has_more") or not archivos:
+                return
+            params["after"] = pagina.get("last_id") or archivos[-1]["id"]
+
+    async def depurar_archivos_huerfanos(self, ttl_seconds: float) -> List[str]:
+        """
+        Elimina los archivos subidos por la aplicación que quedaron sin referencias en la caché de
+        subidas hace más de ttl_seconds sin que nadie los depurara. Los archivos de la cuenta que la
+        caché no registra (por ejemplo, la base de conocimiento de los asistentes) no se tocan.
+        """
+        if self.upload_cache is None:
+            return []
+        candidatos = await self.upload_cache.liberados_antes(datetime.utcnow() - timedelta(seconds=ttl_seconds))
+        eliminados = []
+        for i in range(0, len(candidatos), FILES_PAGE_SIZE):
+            lote = await self.upload_cache.reclamar_libres(candidatos[i:i + FILES_PAGE_SIZE])
+            borrados = await self._eliminar_archivos(lote)
+            if len(borrados) < len(lote):
+                await self.upload_cache.pendientes_de_borrado([f for f in lote if f not in set(borrados)])
+            eliminados.extend(borrados)
+        logger.info(f"Limpieza de archivos huérfanos: {len(eliminados)} eliminados de {len(candidatos)} liberados")
+        return eliminados
+
     async def analizar_solicitud_completions(self, solicitud: Any) -> Optional[str]:
         """
         Consume el endpoint de completions de OpenAI para analizar la solicitud y sus evaluaciones.
         Recibe la solicitud (con evaluaciones ambiental, social y económica) y retorna un análisis detallado.
         """
         # Serializa los campos complejos a texto
-        eval_ambiental = json.dumps(solicitud.EvaluacionAmbiental, ensure_ascii=False, indent=2) if solicitud.EvaluacionAmbiental else "Sin evaluación"
-        eval_social = json.dumps(solicitud.EvaluacionSocial, ensure_ascii=False, indent=2) if solicitud.EvaluacionSocial else "Sin evaluación"
-        eval_economica = json.dumps(solicitud.EvaluacionEconomica, ensure_ascii=False, indent=2) if solicitud.EvaluacionEconomica else "Sin evaluación"
+        eval_ambiental = json_dumps(solicitud.EvaluacionAmbiental, indent=True) if solicitud.EvaluacionAmbiental else "Sin evaluación"
+        eval_social = json_dumps(solicitud.EvaluacionSocial, indent=True) if solicitud.EvaluacionSocial else "Sin evaluación"
+        eval_economica = json_dumps(solicitud.EvaluacionEconomica, indent=True) if solicitud.EvaluacionEconomica else "Sin evaluación"
 
         prompt = (
             f"Analiza detalladamente la siguiente solicitud y sus resultados de evaluación.\n"
@@ -390,18 +1306,18 @@ class OpenAIAssistant:
             "temperature": 0.7
         }
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            response = await self._request(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=payload
+            )
+            response.raise_for_status()
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
         except httpx.HTTPStatusError as e:
-            print(f"[OpenAI][ERROR] analizar_solicitud_completions: {e.response.status_code} - {e.response.text}")
+            logger.error(f"analizar_solicitud_completions: {e.response.status_code} - {e.response.text}")
             return None
         except Exception as e:
-            print(f"[OpenAI][ERROR] analizar_solicitud_completions: {str(e)}")
+            logger.error(f"analizar_solicitud_completions: {str(e)}")
             return None
\ No newline at end of file
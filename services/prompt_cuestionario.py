@@ -0,0 +1,167 @@
+import argparse
+import os
+import re
+import sys
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from models import TipoAsistenteEnum
+from services.cuestionario_parser import CAMPO_PESOS, CAMPO_TIPOS, cuestionario_dimension, parsear_cuestionario, tipos_dimension
+from services.serializacion import json_dumps
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken es opcional: sin él se usa una estimación por palabras
+    tiktoken = None
+
+# --- Configuración del cuestionario en el mensaje al asistente ---
+PROMPT_FORMATO = os.getenv("VIGIA_PROMPT_FORMATO", "tabla").lower()  # tabla | json
+# Tokens máximos del mensaje de evaluación de una dimensión (0 = sin límite)
+PROMPT_TOKEN_BUDGET = int(os.getenv("VIGIA_PROMPT_TOKEN_BUDGET", "0"))
+PROMPT_ENCODING = os.getenv("VIGIA_PROMPT_ENCODING", "o200k_base")
+
+SEPARADOR = "|"
+MISMO_ANTERIOR = "^"
+# Textos de al menos este largo que se repiten se escriben una sola vez y se citan como [Tn]
+TEXTO_REPETIDO_MINIMO = 40
+
+LEYENDA = (
+    f"Cuestionario en tabla: una fila por pregunta, columnas separadas por '{SEPARADOR}'. "
+    f"Celda vacía = sin dato; '{MISMO_ANTERIOR}' = igual a la fila anterior; [Tn] = texto de la sección Textos."
+)
+
+
+class PresupuestoTokensExcedido(ValueError):
+    def __init__(self, tokens: int, presupuesto: int):
+        super().__init__(f"El mensaje estima {tokens} tokens y el presupuesto es {presupuesto}")
+        self.tokens = tokens
+        self.presupuesto = presupuesto
+
+
+def _celda(valor: Any) -> str:
+    if valor is None or (isinstance(valor, float) and valor != valor):
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).replace("\r", " ").replace("\n", " ").strip().replace(SEPARADOR, "/")
+
+
+def codificar_tabla(grupos: List[Dict[str, Any]]) -> str:
+    """
+    Cuestionario como tabla: encabezado una vez y una fila por pregunta. Omite columnas vacías,
+    marca con '^' la celda igual a la de la fila anterior y define una sola vez los textos
+    largos que se repiten en la tabla.
+    """
+    filas = [(grupo.get("dimension", ""), item) for grupo in grupos for item in grupo.get("items", [])]
+    if not filas:
+        return ""
+    columnas: List[str] = []
+    for _, item in filas:
+        columnas.extend(k for k in item if k not in columnas and k != CAMPO_TIPOS)
+    valores = [[_celda(dimension), *(_celda(item.get(c)) for c in columnas)] for dimension, item in filas]
+    encabezado = ["dimension", *columnas]
+    indices = [i for i in range(len(encabezado)) if any(fila[i] for fila in valores)]
+
+    celdas = []
+    for n, fila in enumerate(valores):
+        celdas.append([
+            MISMO_ANTERIOR if n and fila[i] and fila[i] == valores[n - 1][i] else fila[i]
+            for i in indices
+        ])
+    repetidos = Counter(c for fila in celdas for c in fila if len(c) >= TEXTO_REPETIDO_MINIMO)
+    referencias = {texto: f"[T{n}]" for n, texto in enumerate((t for t, veces in repetidos.items() if veces > 1), start=1)}
+
+    lineas = [LEYENDA]
+    if referencias:
+        lineas.append("Textos:")
+        lineas.extend(f"{referencia} {texto}" for texto, referencia in referencias.items())
+    lineas.append(SEPARADOR.join(encabezado[i] for i in indices))
+    lineas.extend(SEPARADOR.join(referencias.get(c, c) for c in fila) for fila in celdas)
+    return "\n".join(lineas)
+
+
+def codificar_cuestionario(grupos: List[Dict[str, Any]], formato: Optional[str] = None) -> str:
+    """
+    Texto del cuestionario de una dimensión para el mensaje al asistente (y la clave de la caché
+    de evaluaciones): tabla compacta o JSON según VIGIA_PROMPT_FORMATO.
+    """
+    if (formato or PROMPT_FORMATO) == "json":
+        return json_dumps([{k: v for k, v in grupo.items() if k not in (CAMPO_TIPOS, CAMPO_PESOS)} for grupo in grupos])
+    return codificar_tabla(grupos)
+
+
+_PIEZAS = re.compile(r"\w+|[^\w\s]")
+_codificador = None
+
+
+def contar_tokens(texto: str) -> int:
+    """
+    Tokens del texto con tiktoken si está instalado; si no, una estimación sin red: cada
+    palabra cuenta un token por cada 4 caracteres y cada signo de puntuación cuenta uno.
+    """
+    global _codificador
+    if tiktoken is not None:
+        if _codificador is None:
+            _codificador = tiktoken.get_encoding(PROMPT_ENCODING)
+        return len(_codificador.encode(texto))
+    return sum(-(-len(pieza) // 4) if pieza[0].isalnum() or pieza[0] == "_" else 1 for pieza in _PIEZAS.findall(texto))
+
+
+def verificar_presupuesto(texto: str, presupuesto: int = PROMPT_TOKEN_BUDGET) -> int:
+    """
+    Retorna los tokens estimados del texto; lanza PresupuestoTokensExcedido si superan el presupuesto.
+    """
+    tokens = contar_tokens(texto)
+    if presupuesto and tokens > presupuesto:
+        raise PresupuestoTokensExcedido(tokens, presupuesto)
+    return tokens
+
+
+def reporte_dimensiones(grupos: List[Dict[str, Any]], presupuesto: int = PROMPT_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    Tamaño del cuestionario de cada dimensión en JSON y en tabla, y si cabe en el presupuesto.
+    """
+    grupos = [{**grupo, CAMPO_TIPOS: tipos_dimension(grupo.get("dimension", ""))} for grupo in grupos]
+    reporte = []
+    for tipo in TipoAsistenteEnum:
+        propios = cuestionario_dimension(grupos, tipo)
+        tokens_json = contar_tokens(codificar_cuestionario(propios, "json"))
+        tokens_tabla = contar_tokens(codificar_cuestionario(propios, "tabla"))
+        reporte.append({
+            "dimension": tipo.value,
+            "preguntas": sum(len(grupo.get("items", [])) for grupo in propios),
+            "tokens_json": tokens_json,
+            "tokens_tabla": tokens_tabla,
+            "reduccion": round(1 - tokens_tabla / tokens_json, 3) if tokens_json else 0.0,
+            "dentro_del_presupuesto": not presupuesto or tokens_tabla <= presupuesto,
+        })
+    return reporte
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Estima los tokens del cuestionario de cada dimensión")
+    parser.add_argument("excel", help="Archivo Excel con la hoja Cuestionario")
+    parser.add_argument("--presupuesto", type=int, default=PROMPT_TOKEN_BUDGET, help="Tokens máximos por dimensión (0 = sin límite)")
+    parser.add_argument("--mostrar", choices=[t.value for t in TipoAsistenteEnum], help="Imprime la tabla de una dimensión")
+    args = parser.parse_args(argv)
+
+    with open(args.excel, "rb") as f:
+        grupos = parsear_cuestionario(f)
+    reporte = reporte_dimensiones(grupos, args.presupuesto)
+    estimador = f"tiktoken {PROMPT_ENCODING}" if tiktoken is not None else "estimación por palabras"
+    print(f"Tokens por dimensión ({estimador}, presupuesto {args.presupuesto or 'sin límite'})")
+    print(f"{'dimension':<12} {'preguntas':>9} {'json':>8} {'tabla':>8} {'reducción':>10}")
+    for fila in reporte:
+        marca = "" if fila["dentro_del_presupuesto"] else "  EXCEDE"
+        print(f"{fila['dimension']:<12} {fila['preguntas']:>9} {fila['tokens_json']:>8} {fila['tokens_tabla']:>8} "
+              f"{fila['reduccion']:>10.1%}{marca}")
+    if args.mostrar:
+        print()
+        print(codificar_cuestionario(cuestionario_dimension(
+            [{**g, CAMPO_TIPOS: tipos_dimension(g.get("dimension", ""))} for g in grupos], TipoAsistenteEnum(args.mostrar)
+        ), "tabla"))
+    return 0 if all(fila["dentro_del_presupuesto"] for fila in reporte) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
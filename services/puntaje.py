@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from models import TipoAsistenteEnum
+from services.cuestionario_parser import CAMPO_PESOS, cuestionario_dimension
+from services.serializacion import json_loads
+
+# Puntajes calculados localmente a partir de los pesos de la hoja Cuestionario y de las
+# calificaciones por criterio que el asistente entrega en los argumentos de su función:
+#   dimensión = 100 * Σ peso_criterio * calificación / Σ peso_criterio * puntaje_máximo
+#   consolidado = promedio de las dimensiones ponderado por peso_dimensión
+
+
+def _campos(variable: str, por_defecto: str) -> tuple:
+    return tuple(c.strip() for c in os.getenv(variable, por_defecto).split(",") if c.strip())
+
+
+# --- Configuración del puntaje ---
+# Puntaje máximo de un criterio cuando la columna puntaje_respuesta no trae un número
+PUNTAJE_MAXIMO = float(os.getenv("VIGIA_PUNTAJE_MAXIMO", "5"))
+# Umbrales (0-100) del nivel de riesgo global: bajo desde el primero, medio desde el segundo
+NIVEL_BAJO_DESDE = float(os.getenv("VIGIA_NIVEL_BAJO_DESDE", "70"))
+NIVEL_MEDIO_DESDE = float(os.getenv("VIGIA_NIVEL_MEDIO_DESDE", "40"))
+# Campos de los argumentos de la función que identifican un criterio y que traen su calificación,
+# en orden de preferencia; dependen del esquema de la función de cada asistente
+CAMPOS_CLAVE = _campos("VIGIA_PUNTAJE_CAMPOS_CLAVE", "criterio,pregunta,pregunta_principal,id")
+CAMPOS_CALIFICACION = _campos(
+    "VIGIA_PUNTAJE_CAMPOS_CALIFICACION", "calificacion,calificación,puntaje,puntuacion,puntuación,score,nota"
+)
+# Campos de nivel superior con un puntaje (0-100) de toda la dimensión
+CAMPOS_PUNTAJE_DIMENSION = _campos(
+    "VIGIA_PUNTAJE_CAMPOS_DIMENSION", "puntaje_dimension,puntaje_dimensión,puntaje,puntaje_total"
+)
+
+CAMPOS_EVALUACION = {
+    TipoAsistenteEnum.ambiental: "EvaluacionAmbiental",
+    TipoAsistenteEnum.social: "EvaluacionSocial",
+    TipoAsistenteEnum.economica: "EvaluacionEconomica",
+}
+DIMENSIONES = [t.value for t in TipoAsistenteEnum]
+
+_NUMERO = r"-?\d+(?:\.\d+)?"
+# Coma decimal: solo dentro de un número aislado ("0,25", "1,5 / 3,5"); en "0,1,2,3" separa opciones
+_COMA_DECIMAL = re.compile(r"(?<![\d,])(-?\d+),(\d+)(?![\d,])")
+
+
+def _texto_numerico(valor: Any) -> str:
+    return _COMA_DECIMAL.sub(r"\1.\2", str(valor))
+
+
+def normalizar_clave(valor: Any) -> str:
+    return re.sub(r"\s+", " ", str(valor)).strip().lower()
+
+
+def _numero(valor: Any) -> Optional[float]:
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor) if valor == valor else None
+    if isinstance(valor, str):
+        encontrado = re.search(_NUMERO, _texto_numerico(valor))
+        return float(encontrado.group()) if encontrado else None
+    return None
+
+
+def _argumentos(evaluacion: Optional[List[dict]]) -> Iterable[dict]:
+    for resultado in evaluacion or []:
+        required_action = (resultado or {}).get("required_action") or {}
+        for call in (required_action.get("submit_tool_outputs") or {}).get("tool_calls") or []:
+            try:
+                argumentos = json_loads(call["function"]["arguments"])
+            except Exception:
+                continue
+            if isinstance(argumentos, dict):
+                yield argumentos
+
+
+def calificaciones(evaluacion: Optional[List[dict]]) -> tuple:
+    """
+    Calificaciones por criterio ({clave: calificación}) y puntaje de la dimensión (o None) leídos de
+    los argumentos de las llamadas a función. Una llamada posterior reemplaza a las anteriores.
+    """
+    por_criterio: Dict[str, float] = {}
+    puntaje = None
+    for argumentos in _argumentos(evaluacion):
+        for campo in CAMPOS_PUNTAJE_DIMENSION:
+            if _numero(argumentos.get(campo)) is not None:
+                puntaje = _numero(argumentos[campo])
+                break
+        for valor in argumentos.values():
+            if not isinstance(valor, list):
+                continue
+            for item in valor:
+                if not isinstance(item, dict):
+                    continue
+                clave = next((item[c] for c in CAMPOS_CLAVE if item.get(c) not in (None, "")), None)
+                nota = next((_numero(item[c]) for c in CAMPOS_CALIFICACION if _numero(item.get(c)) is not None), None)
+                if clave is not None and nota is not None:
+                    por_criterio[normalizar_clave(clave)] = nota
+    return por_criterio, puntaje
+
+
+def nivel(puntaje: Optional[float]) -> Optional[str]:
+    if puntaje is None:
+        return None
+    return "bajo" if puntaje >= NIVEL_BAJO_DESDE else "medio" if puntaje >= NIVEL_MEDIO_DESDE else "alto"
+
+
+def _numeros(valores: List[Any], maximo: bool = False) -> np.ndarray:
+    if not maximo:
+        return np.array([_numero(v) if v is not None else None for v in valores], dtype=float)
+    return np.array([
+        max(map(float, re.findall(_NUMERO, _texto_numerico(v))), default=np.nan) for v in valores
+    ], dtype=float)
+
+
+def puntuar_solicitud(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Campos de puntaje de una solicitud: el puntaje 0-100 de cada dimensión, PuntajeConsolidado y
+    NivelGlobal (riesgo alto/medio/bajo). Los criterios sin calificación no cuentan; una dimensión
+    sin calificaciones por criterio usa el puntaje global que haya entregado el asistente.
+    Es el único cálculo de puntajes: lo usan la finalización y puntuar_lote.
+    """
+    puntajes = np.full(len(DIMENSIONES), np.nan)
+    pesos_dimension = np.full(len(DIMENSIONES), np.nan)
+    for d, (tipo, campo) in enumerate(CAMPOS_EVALUACION.items()):
+        claves, preguntas, pesos, maximos, peso_dim = [], [], [], [], []
+        for grupo in cuestionario_dimension(doc.get("Cuestionario"), tipo):
+            items = grupo.get("items") or []
+            columnas = grupo.get(CAMPO_PESOS) or {}
+            vacios = [None] * len(items)
+            claves += [normalizar_clave(i.get("criterio", "")) for i in items]
+            preguntas += [normalizar_clave(i.get("pregunta_principal", i.get("pregunta", ""))) for i in items]
+            pesos += columnas.get("peso_criterio") or vacios
+            maximos += columnas.get("puntaje_respuesta") or vacios
+            peso_dim += columnas.get("peso_dimension") or vacios
+        por_criterio, puntaje = calificaciones(doc.get(campo))
+        if claves:
+            validos = _numeros(peso_dim)
+            validos = validos[~np.isnan(validos)]
+            pesos_dimension[d] = validos[0] if validos.size else np.nan
+        if por_criterio and claves:
+            notas = np.array([por_criterio.get(c, por_criterio.get(p, np.nan)) for c, p in zip(claves, preguntas)], dtype=float)
+            # Solo un peso ausente vale 1; un peso 0 de la hoja excluye el criterio
+            peso = _numeros(pesos)
+            peso = np.where(np.isnan(peso), 1.0, peso)
+            maximo = _numeros(maximos, maximo=True)
+            maximo = np.where(maximo > 0, maximo, PUNTAJE_MAXIMO)
+            calificados = ~np.isnan(notas)
+            posible = np.sum(peso[calificados] * maximo[calificados])
+            if posible > 0:
+                obtenido = np.sum(peso[calificados] * np.clip(notas[calificados], 0, None))
+                puntajes[d] = min(100 * obtenido / posible, 100)
+        if np.isnan(puntajes[d]) and puntaje is not None:
+            puntajes[d] = min(max(puntaje, 0), 100)
+
+    evaluadas = ~np.isnan(puntajes)
+    consolidado = None
+    pesos = np.where(np.isnan(pesos_dimension), 1.0, pesos_dimension)[evaluadas]
+    if evaluadas.any() and np.sum(pesos) > 0:
+        consolidado = float(np.sum(puntajes[evaluadas] * pesos) / np.sum(pesos))
+    return {
+        "PuntajeDimension": {d: None if np.isnan(p) else round(float(p), 2) for d, p in zip(DIMENSIONES, puntajes)},
+        "PuntajeConsolidado": round(consolidado, 2) if consolidado is not None else None,
+        "NivelGlobal": nivel(consolidado),
+    }
+
+
+def puntuar_lote(docs: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Puntajes de muchas solicitudes (puntuar_solicitud por documento): una fila por solicitud, en el
+    orden de docs, con el puntaje de cada dimensión, PuntajeConsolidado y NivelGlobal.
+    """
+    puntajes = [puntuar_solicitud(doc) for doc in docs]
+    columnas = {d: pd.Series([p["PuntajeDimension"][d] for p in puntajes], dtype=float) for d in DIMENSIONES}
+    columnas["PuntajeConsolidado"] = pd.Series([p["PuntajeConsolidado"] for p in puntajes], dtype=float)
+    columnas["NivelGlobal"] = pd.Series([p["NivelGlobal"] for p in puntajes], dtype=object)
+    return pd.DataFrame(columnas, index=pd.RangeIndex(len(docs)))
+
+
+def campos_puntaje(fila: pd.Series) -> Dict[str, Any]:
+    """
+    Campos de Solicitud ($set) a partir de una fila de puntuar_lote.
+    """
+    def valor(x):
+        return None if pd.isna(x) else float(x)
+
+    return {
+        "PuntajeDimension": {d: valor(fila[d]) for d in DIMENSIONES},
+        "PuntajeConsolidado": valor(fila["PuntajeConsolidado"]),
+        "NivelGlobal": fila["NivelGlobal"],
+    }
+
+
+PROYECCION_PUNTAJE = {
+    "SolicitudID": 1, "Cuestionario": 1, "EvaluacionExterna": 1, **{campo: 1 for campo in CAMPOS_EVALUACION.values()}
+}
+
+
+async def _main(todas: bool, escribir: bool, lote: int, limite: int) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import UpdateOne
+    from services.evaluation_store import EvaluationStore
+
+    load_dotenv()
+    db = AsyncIOMotorClient(os.getenv("MONGO_URL"))["VigIAHackathon"]
+    store = EvaluationStore(db.EvaluacionDetalle)
+    filtro: Dict[str, Any] = {"EstadoGeneral": "completado"}
+    if not todas:
+        filtro["PuntajeConsolidado"] = None
+    cursor = db.Solicitud.find(filtro, PROYECCION_PUNTAJE).batch_size(lote)
+    if limite:
+        cursor = cursor.limit(limite)
+
+    total = con_puntaje = 0
+    segundos = 0.0
+    docs: List[Dict[str, Any]] = []
+
+    async def procesar(docs: List[Dict[str, Any]]):
+        nonlocal total, con_puntaje, segundos
+        docs = [await store.hidratar(doc) for doc in docs]
+        inicio = time.perf_counter()
+        resultado = puntuar_lote(docs)
+        segundos += time.perf_counter() - inicio
+        total += len(docs)
+        con_puntaje += int(resultado["PuntajeConsolidado"].notna().sum())
+        if escribir:
+            await db.Solicitud.bulk_write([
+                UpdateOne({"SolicitudID": doc["SolicitudID"]}, {"$set": campos_puntaje(fila)})
+                for doc, (_, fila) in zip(docs, resultado.iterrows())
+            ], ordered=False)
+
+    async for doc in cursor:
+        docs.append(doc)
+        if len(docs) >= lote:
+            await procesar(docs)
+            docs = []
+    if docs:
+        await procesar(docs)
+
+    por_solicitud = f"{segundos * 1e6 / total:.1f} µs por solicitud" if total else "sin solicitudes"
+    print(f"{total} solicitudes puntuadas ({con_puntaje} con puntaje consolidado), cálculo: {por_solicitud}")
+    if not escribir:
+        print("Sin --escribir: no se actualizó la base de datos")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula PuntajeConsolidado y NivelGlobal de solicitudes completadas")
+    parser.add_argument("--todas", action="store_true", help="Recalcula también las que ya tienen puntaje")
+    parser.add_argument("--escribir", action="store_true", help="Guarda los puntajes en la base de datos")
+    parser.add_argument("--lote", type=int, default=1000, help="Solicitudes por lote de cálculo y escritura")
+    parser.add_argument("--limite", type=int, default=0, help="Máximo de solicitudes (0 = todas)")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.todas, args.escribir, args.lote, args.limite)))
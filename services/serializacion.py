@@ -0,0 +1,47 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from starlette.responses import Response
+
+# Serialización JSON con orjson: respuestas del router /vigia, cuestionarios para el asistente,
+# eventos SSE y cuerpos hacia OpenAI.
+
+
+def _por_defecto(valor: Any) -> Any:
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def json_dumps_bytes(valor: Any, indent: bool = False) -> bytes:
+    opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        opciones |= orjson.OPT_INDENT_2
+    return orjson.dumps(valor, default=_por_defecto, option=opciones)
+
+
+def json_dumps(valor: Any, indent: bool = False) -> str:
+    """
+    JSON compacto en UTF-8 (sin escapar caracteres no ASCII), como texto.
+    """
+    return json_dumps_bytes(valor, indent).decode("utf-8")
+
+
+def json_loads(texto: Any) -> Any:
+    return orjson.loads(texto)
+
+
+class RespuestaJSON(Response):
+    """
+    Respuesta JSON renderizada con orjson. Clase de respuesta por defecto del router /vigia.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps_bytes(content)
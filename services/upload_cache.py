@@ -0,0 +1,138 @@
+import hashlib
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from pymongo import ReturnDocument, UpdateOne
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+VARIANTE_ORIGINAL = "original"
+# Excel convertido a CSV en upload_file_from_formdata_v2
+VARIANTE_CSV = "xlsx-csv"
+
+
+def hash_archivo(source) -> str:
+    """
+    Calcula el SHA-256 de un archivo leyéndolo por bloques y lo deja posicionado al inicio.
+    """
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    Caché direccionada por contenido de los archivos subidos a OpenAI.
+    Cada documento relaciona (variante, sha256) con el file_id remoto y lleva un conteo
+    de referencias de las solicitudes que lo usan. Es también el registro de los archivos que
+    subió la aplicación: la limpieza periódica solo elimina archivos registrados aquí.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def cache_id(sha256: str, variante: str) -> str:
+        return f"{variante}:{sha256}"
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("file_id")
+
+    async def buscar(self, sha256: str, variante: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca el archivo en caché; si existe suma una referencia y lo retorna.
+        """
+        return await self.collection.find_one_and_update(
+            {"_id": self.cache_id(sha256, variante)},
+            {"$inc": {"refs": 1}, "$set": {"ultimo_uso": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def registrar(self, sha256: str, variante: str, file_id: str, filename: str, size: Optional[int]) -> str:
+        """
+        Registra un archivo recién subido con una referencia. Si otra subida concurrente del mismo
+        contenido ya lo registró, conserva la entrada existente y retorna su file_id.
+        """
+        now = datetime.utcnow()
+        doc = await self.collection.find_one_and_update(
+            {"_id": self.cache_id(sha256, variante)},
+            {
+                "$setOnInsert": {
+                    "sha256": sha256,
+                    "variante": variante,
+                    "file_id": file_id,
+                    "filename": filename,
+                    "bytes": size,
+                    "creado": now
+                },
+                "$inc": {"refs": 1},
+                "$set": {"ultimo_uso": now}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["file_id"]
+
+    async def liberar(self, file_ids: List[str]):
+        """
+        Resta una referencia por cada aparición del archivo (por ejemplo, cuando termina la solicitud
+        que lo usaba). Un mismo contenido anexado dos veces sumó dos referencias y libera dos.
+        """
+        por_veces: Dict[int, List[str]] = {}
+        for file_id, veces in Counter(file_ids).items():
+            por_veces.setdefault(veces, []).append(file_id)
+        now = datetime.utcnow()
+        for veces, ids in por_veces.items():
+            await self.collection.update_many(
+                {"file_id": {"$in": ids}, "refs": {"$gt": 0}},
+                {"$inc": {"refs": -veces}, "$set": {"liberado": now}}
+            )
+
+    async def liberados_antes(self, limite: datetime) -> List[str]:
+        """
+        Archivos sin referencias cuya última liberación es anterior a limite: los que ninguna
+        solicitud alcanzó a depurar (por ejemplo, si el proceso terminó entre liberar y depurar).
+        """
+        return await self.collection.distinct("file_id", {"refs": {"$lte": 0}, "liberado": {"$lt": limite}})
+
+    async def pendientes_de_borrado(self, file_ids: List[str]):
+        """
+        Vuelve a registrar, sin referencias, archivos ya reclamados cuyo borrado en OpenAI falló,
+        para que la limpieza periódica los reintente. La entrada no usa el _id de la caché, así
+        que ninguna subida la reutiliza.
+        """
+        if not file_ids:
+            return
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"_id": f"borrar:{file_id}"},
+                {"$set": {"file_id": file_id, "refs": 0, "liberado": now}},
+                upsert=True
+            )
+            for file_id in dict.fromkeys(file_ids)
+        ], ordered=False)
+
+    async def reclamar_libres(self, file_ids: List[str]) -> List[str]:
+        """
+        Retorna los archivos que se pueden eliminar en OpenAI: los que ninguna solicitud referencia.
+        Las entradas sin referencias se borran de la caché en el mismo paso (un delete_many con la
+        condición refs <= 0), así una subida concurrente ya no las encuentra y no puede reutilizar un
+        archivo en borrado; una entrada que recuperó una referencia entretanto sigue en uso.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        if not file_ids:
+            return []
+        await self.collection.delete_many({"file_id": {"$in": file_ids}, "refs": {"$lte": 0}})
+        en_uso = set(await self.collection.distinct("file_id", {"file_id": {"$in": file_ids}}))
+        return [file_id for file_id in file_ids if file_id not in en_uso]
+
+    async def invalidar(self, file_ids: List[str]):
+        """
+        Elimina de la caché los archivos que ya no existen en OpenAI.
+        """
+        if file_ids:
+            await self.collection.delete_many({"file_id": {"$in": list(file_ids)}})
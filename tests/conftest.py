@@ -0,0 +1,6 @@
+import os
+
+# Las pruebas no cuentan con MongoDB: no arrancar workers ni crear índices en el lifespan
+os.environ.setdefault("VIGIA_WORKERS", "0")
+os.environ.setdefault("VIGIA_CREAR_INDICES", "false")
+os.environ.setdefault("VIGIA_JANITOR_INTERVALO", "0")
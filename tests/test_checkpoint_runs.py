@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+
+import services.openai_assistant as oa
+from models import TipoAsistenteEnum
+
+ACCION = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+    {"id": "call_1", "type": "function", "function": {"name": "registrar_evaluacion", "arguments": "{}"}}
+]}}
+
+
+class _OpenAI:
+    """Hilos y runs mínimos: cada run requiere acción solo si `con_accion` lo indica."""
+
+    def __init__(self, runs, con_accion=True):
+        self.runs = dict(runs)
+        self.con_accion = con_accion
+        self.peticiones = []
+
+    def __call__(self, request):
+        ruta = request.url.path
+        self.peticiones.append(f"{request.method} {ruta}")
+        partes = ruta.split("/")
+        if request.method == "POST" and ruta == "/v1/threads":
+            return httpx.Response(200, json={"id": "thread_nuevo"})
+        if ruta.endswith("/messages"):
+            if request.method == "GET":
+                return httpx.Response(200, json={"data": [
+                    {"role": "assistant", "content": [{"type": "text", "text": {"value": "listo"}}]}
+                ]})
+            return httpx.Response(200, json={"id": "msg_1"})
+        if ruta.endswith("/submit_tool_outputs"):
+            self.runs[partes[-2]] = "completed"
+            return httpx.Response(200, json={})
+        if request.method == "POST" and ruta.endswith("/runs"):
+            run_id = f"run_{len(self.runs) + 1}"
+            self.runs[run_id] = "requires_action" if self.con_accion else "completed"
+            return httpx.Response(200, json={"id": run_id, "status": "queued"})
+        run_id = partes[-1]
+        estado = self.runs[run_id]
+        cuerpo = {"id": run_id, "status": estado}
+        if estado == "requires_action":
+            cuerpo["required_action"] = ACCION
+        return httpx.Response(200, json=cuerpo)
+
+
+def _flujo(openai, checkpoint, guardados):
+    async def guardar(estado):
+        guardados.append(estado)
+
+    async def ejecutar():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(openai)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client, streaming=False)
+            return await assistant.run_assistant_flow(
+                "mensaje", TipoAsistenteEnum.social, checkpoint=checkpoint, guardar_checkpoint=guardar
+            )
+
+    return asyncio.run(ejecutar())
+
+
+def test_reanuda_run_activo_sin_crear_hilo(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    openai = _OpenAI({"run_1": "requires_action"})
+    checkpoint = {"thread_id": "thread_1", "run_id": "run_1", "fase": oa.FASE_RUN}
+    guardados = []
+
+    resultado = _flujo(openai, checkpoint, guardados)
+
+    assert resultado == {"required_action": ACCION, "assistant_response": "listo"}
+    assert "POST /v1/threads" not in openai.peticiones
+    assert not any(p.startswith("POST") and p.endswith("/runs") for p in openai.peticiones)
+    assert guardados[-1]["fase"] == oa.FASE_ACCION
+    assert checkpoint["required_action"] == ACCION
+
+
+def test_run_completado_sin_accion_recibe_recordatorio_en_el_mismo_hilo(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    monkeypatch.setattr(oa, "RUN_MAX_RECORDATORIOS", 2)
+    openai = _OpenAI({"run_1": "completed"})
+    checkpoint = {"thread_id": "thread_1", "run_id": "run_1", "fase": oa.FASE_RUN}
+    guardados = []
+
+    resultado = _flujo(openai, checkpoint, guardados)
+
+    assert resultado["required_action"] == ACCION
+    assert "POST /v1/threads" not in openai.peticiones
+    assert openai.peticiones.count("POST /v1/threads/thread_1/runs") == 1
+    assert [g["fase"] for g in guardados] == [oa.FASE_HILO, oa.FASE_RUN, oa.FASE_ACCION]
+
+
+def test_recordatorios_acotados_sin_recursion(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    openai = _OpenAI({}, con_accion=False)
+
+    async def ejecutar():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(openai)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client, streaming=False)
+            openai.runs["run_1"] = "completed"
+            return await assistant.wait_for_required_action(
+                "thread_1", "run_1", TipoAsistenteEnum.social, max_recordatorios=3
+            )
+
+    assert asyncio.run(ejecutar()) is None
+    assert openai.peticiones.count("POST /v1/threads/thread_1/runs") == 3
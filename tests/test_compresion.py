@@ -0,0 +1,66 @@
+import asyncio
+import gzip
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from services.compresion import CompresionMiddleware, elegir_codificacion
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(CompresionMiddleware, minimo=500)
+
+    @app.get("/grande")
+    def grande():
+        return {"items": ["evaluación"] * 200}
+
+    @app.get("/pequena")
+    def pequena():
+        return {"ok": True}
+
+    @app.get("/eventos")
+    def eventos():
+        async def generar():
+            for n in range(3):
+                yield f"data: {'x' * 400}{n}\n\n"
+        return StreamingResponse(generar(), media_type="text/event-stream")
+
+    return app
+
+
+def _get(ruta, accept_encoding="gzip"):
+    async def consultar():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://vigia") as client:
+            # Sin decodificación automática para ver los bytes tal como viajan
+            async with client.stream("GET", ruta, headers={"Accept-Encoding": accept_encoding}) as respuesta:
+                return respuesta, b"".join([bloque async for bloque in respuesta.aiter_raw()])
+
+    return asyncio.run(consultar())
+
+
+def test_elegir_codificacion():
+    assert elegir_codificacion("gzip, deflate, br", brotli_disponible=True) == "br"
+    assert elegir_codificacion("gzip, deflate, br", brotli_disponible=False) == "gzip"
+    assert elegir_codificacion("br;q=0, gzip;q=0.5", brotli_disponible=True) == "gzip"
+    assert elegir_codificacion("identity") is None
+
+
+def test_comprime_solo_respuestas_grandes():
+    respuesta, cuerpo = _get("/grande")
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+    assert int(respuesta.headers["content-length"]) == len(cuerpo)
+    assert gzip.decompress(cuerpo).decode("utf-8").startswith('{"items":["evaluación"')
+
+    respuesta, _ = _get("/pequena")
+    assert "content-encoding" not in respuesta.headers
+    respuesta, _ = _get("/grande", accept_encoding="identity")
+    assert "content-encoding" not in respuesta.headers
+
+
+def test_streaming_no_se_comprime():
+    respuesta, cuerpo = _get("/eventos")
+    assert "content-encoding" not in respuesta.headers
+    assert cuerpo.decode("utf-8").count("data: ") == 3
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+
+import routers.vigia as vigia
+from benchmarks.memoria_mongo import MemoriaDatabase
+from main import app
+from models import TipoAsistenteEnum
+from services.evaluation_store import EvaluationStore
+from services.prompt_cuestionario import codificar_cuestionario
+
+GRUPOS = [
+    {"dimension": "Ambiental", "items": [{"pregunta": "¿Agua?"}]},
+    {"dimension": "Social", "items": [{"pregunta": "¿Empleo?"}]},
+    {"dimension": "Económica y Gobernanza", "items": [{"pregunta": "¿Ética?"}]},
+]
+
+
+def _doc(solicitud_id, cuestionario):
+    return {
+        "SolicitudID": solicitud_id, "CodigoProyecto": "P1", "ProveedorNombre": "Proveedor", "ProveedorNIT": "900",
+        "FechaCreacion": datetime.utcnow(), "EstadoGeneral": "En progreso", "UsuarioSolicitante": "ana",
+        "Estado": {"ambiental": "pending", "social": "pending", "economica": "pending"},
+        "EvaluacionAmbiental": [{"assistant_response": "x" * 100}], "Cuestionario": cuestionario,
+    }
+
+
+def test_proyeccion_filtra_la_dimension_en_la_consulta():
+    db = MemoriaDatabase()
+    cuestionario = [{**g, vigia.CAMPO_TIPOS: vigia.tipos_dimension(g["dimension"])} for g in GRUPOS]
+    legado = json.dumps(GRUPOS, ensure_ascii=False)
+
+    async def flujo():
+        await db.Solicitud.insert_one(_doc("s1", cuestionario))
+        await db.Solicitud.insert_one(_doc("s2", legado))
+        proyeccion = vigia.proyeccion_evaluacion(TipoAsistenteEnum.social)
+        return await db.Solicitud.find_one({"SolicitudID": "s1"}, proyeccion), await db.Solicitud.find_one({"SolicitudID": "s2"}, proyeccion)
+
+    nuevo, anterior = asyncio.run(flujo())
+    assert [g["dimension"] for g in nuevo["Cuestionario"]] == ["Social"]
+    assert "EvaluacionAmbiental" not in nuevo
+    # Un cuestionario guardado como texto se filtra al leerlo
+    solicitud = vigia.SolicitudModel(**anterior)
+    grupos = vigia.cuestionario_dimension(solicitud.Cuestionario, TipoAsistenteEnum.economica)
+    assert json.loads(codificar_cuestionario(grupos, formato="json")) == [GRUPOS[2]]
+
+
+def test_evaluaciones_grandes_van_a_la_coleccion_lateral():
+    db = MemoriaDatabase()
+    store = EvaluationStore(db.EvaluacionDetalle, max_inline_bytes=1000)
+
+    async def flujo():
+        pequena, externa_pequena = await store.separar("s1", "social", {"EvaluacionSocial": [{"a": 1}], "RespuestaSocial": "ok"})
+        grande, externa_grande = await store.separar("s1", "ambiental", {"EvaluacionAmbiental": [{"a": "x" * 5000}], "RespuestaAmbiental": "ok"})
+        doc = {"SolicitudID": "s1", "EvaluacionExterna": {"ambiental": externa_grande, "social": externa_pequena}, **grande, **pequena}
+        hidratado = await store.hidratar(dict(doc))
+        await store.eliminar("s1")
+        return pequena, externa_pequena, grande, externa_grande, hidratado, len(db.EvaluacionDetalle.docs)
+
+    pequena, externa_pequena, grande, externa_grande, hidratado, restantes = asyncio.run(flujo())
+    assert not externa_pequena and pequena["RespuestaSocial"] == "ok"
+    assert externa_grande and grande == {"EvaluacionAmbiental": None, "RespuestaAmbiental": None}
+    assert hidratado["EvaluacionAmbiental"] == [{"a": "x" * 5000}]
+    assert hidratado["EvaluacionSocial"] == [{"a": 1}]
+    assert restantes == 0
+
+
+def test_endpoint_cuestionario_por_dimension(monkeypatch):
+    db = MemoriaDatabase()
+    cuestionario = [{**g, vigia.CAMPO_TIPOS: vigia.tipos_dimension(g["dimension"])} for g in GRUPOS]
+    monkeypatch.setattr(vigia, "db", db)
+
+    async def consultar():
+        await db.Solicitud.insert_one(_doc("s1", cuestionario))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://vigia") as client:
+            return await client.get("/vigia/solicitud/s1/cuestionario/ambiental")
+
+    respuesta = asyncio.run(consultar())
+    assert respuesta.status_code == 200
+    assert [g["dimension"] for g in respuesta.json()] == ["Ambiental"]
@@ -0,0 +1,105 @@
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from routers.vigia import depurarPreguntas
+from services.cuestionario_parser import parsear_cuestionario
+
+ENCABEZADOS = [
+    "Dimensión",
+    "Criterio",
+    "Pregunta\nprincipal",
+    "Opciones de respuesta",
+    "Puntaje respuesta",
+    "Peso criterio",
+    "Calificación\nAsigne en la columna el puntaje de la respuesta que más se ajusta a la realidad de tu empresa.",
+    "Soportes aplicables para justificar respuesta\nEstos son algunos ejemplos de los soportes que puedes anexar para comprobar la respuesta seleccionada.",
+    "Justificación\nExplica brevemente lo que la empresa realiza acorde a la respuesta seleccionada.",
+    "Puntaje del criterio",
+    "Peso dimensión",
+    "Fecha",
+    None,
+    "Observaciones",
+]
+
+
+def _referencia(contents: bytes) -> list:
+    # Implementación original: read_excel + map por celda + iterrows + depurarPreguntas
+    df = pd.read_excel(BytesIO(contents), sheet_name="Cuestionario", skiprows=3)
+    df = df.iloc[:, 0:16]
+    df.columns = [
+        str(col).replace('\n', ' ').replace('\r', ' ').strip().lower().replace(" ", "_")
+        for col in df.columns
+    ]
+    df = df.map(lambda x: str(x).replace('\n', ' ').replace('\r', ' ') if pd.notnull(x) else "")
+    agrupado = {}
+    for _, row in df.iterrows():
+        dimension = row.get('dimensión', 'Sin dimensión')
+        agrupado.setdefault(dimension, []).append({k: v for k, v in row.items() if k != 'dimensión'})
+    return depurarPreguntas([{"dimension": d, "items": items} for d, items in agrupado.items()])
+
+
+def _libro(filas, encabezados=ENCABEZADOS, extra_hojas=True, fecha_1904=False) -> bytes:
+    wb = Workbook()
+    if fecha_1904:
+        wb.epoch = CALENDAR_MAC_1904
+    if extra_hojas:
+        wb.active.title = "Instrucciones"
+        wb.active["A1"] = "Diligencie la hoja Cuestionario"
+        ws = wb.create_sheet("Cuestionario")
+    else:
+        ws = wb.active
+        ws.title = "Cuestionario"
+    ws["A1"] = "Cuestionario de sostenibilidad"
+    ws["B2"] = "Proveedor"
+    for col, encabezado in enumerate(encabezados, start=1):
+        ws.cell(row=4, column=col, value=encabezado)
+    for numero, fila in enumerate(filas, start=5):
+        for col, valor in enumerate(fila, start=1):
+            celda = ws.cell(row=numero, column=col, value=valor)
+            if isinstance(valor, datetime):
+                celda.number_format = "dd/mm/yyyy hh:mm"
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+FILAS = [
+    ["Ambiental", "A1", "¿Tiene política\nambiental?", "Sí / No", 5, 0.2, 5, "Política\r\nfirmada", "Sí, desde 2020", 1.0, "30%", datetime(2024, 1, 1), None, None],
+    ["Ambiental", "A2", "¿Mide su huella?", "Sí / No", 3, 0.25, None, None, "N/A", 0.75, "30%", datetime(2024, 3, 5, 10, 30), None, "x"],
+    [None, None, None, None, None, None, None, None, None, None, None, None, None, None],
+    ["Social", "S1", "¿Cumple SST?", "Sí / No", 5, 0.5, 4.5, "Certificado", "Cumplimos", 2.25, "40%", None, None, None],
+    ["Económica y Gobernanza", "E1", "¿Tiene RUT?", "Sí / No", 5, 1, 5, "RUT", "NULL", 5, "30%", None, None, None],
+    ["Social", "S2", 12345, "Sí / No", None, 0.5, 0, "", "001", 0, "40%", None, None, None, "fuera de rango"],
+]
+
+
+@pytest.mark.parametrize("filas", [FILAS, FILAS[:1], []])
+def test_parser_igual_a_implementacion_original(filas):
+    contents = _libro(filas)
+    assert parsear_cuestionario(BytesIO(contents)) == _referencia(contents)
+
+
+def test_parser_libro_1904_con_formato_de_fecha_personalizado():
+    contents = _libro(FILAS, fecha_1904=True)
+    assert parsear_cuestionario(BytesIO(contents)) == _referencia(contents)
+
+
+def test_parser_sin_columna_dimension():
+    encabezados = ["Pregunta", "Peso criterio", "Respuesta"]
+    contents = _libro([["P1", 0.5, "Sí"], ["P2", 0.5, 3]], encabezados=encabezados, extra_hojas=False)
+    resultado = parsear_cuestionario(BytesIO(contents))
+    assert resultado == _referencia(contents)
+    assert resultado[0]["dimension"] == "Sin dimensión"
+
+
+def test_parser_sin_hoja_cuestionario():
+    wb = Workbook()
+    buffer = BytesIO()
+    wb.save(buffer)
+    with pytest.raises(KeyError):
+        parsear_cuestionario(buffer)
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from benchmarks.carga import ejecutar_carga
+from benchmarks.mock_openai import MockOpenAIConfig
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_pipeline_completo_contra_openai_simulado(streaming):
+    config = MockOpenAIConfig(latencia_ms=1, jitter_ms=0, duracion_run_ms=20, indexacion_ms=10, semilla=7)
+    resultado = asyncio.run(ejecutar_carga(
+        solicitudes=3, concurrencia=3, anexos=2, preguntas=9, workers=3,
+        streaming=streaming, timeout=60, config_mock=config
+    ))
+    assert resultado["errores"] == []
+    assert resultado["completadas"] == 3
+    # Al finalizar cada solicitud se eliminan sus anexos y su vector store
+    assert resultado["openai"]["archivos_vivos"] == 0
+    assert resultado["openai"]["vector_stores_vivos"] == 0
+    assert resultado["openai"]["por_ruta"]["POST /v1/threads"] == 9
+
+
+def test_pipeline_tolera_429_y_fallos():
+    config = MockOpenAIConfig(
+        latencia_ms=1, jitter_ms=0, duracion_run_ms=20, indexacion_ms=10,
+        tasa_429=0.1, retry_after_ms=5, tasa_fallos=0.02, semilla=3
+    )
+    resultado = asyncio.run(ejecutar_carga(
+        solicitudes=3, concurrencia=3, anexos=1, preguntas=9, workers=3, timeout=60, config_mock=config
+    ))
+    assert resultado["completadas"] == 3
+    assert resultado["openai"]["respuestas_429"] > 0
+
+
+def test_pipeline_motor_completions_con_anexos_de_texto():
+    config = MockOpenAIConfig(latencia_ms=1, jitter_ms=0, duracion_run_ms=20, indexacion_ms=10, semilla=5)
+    resultado = asyncio.run(ejecutar_carga(
+        solicitudes=3, concurrencia=3, anexos=2, preguntas=9, workers=3,
+        timeout=60, config_mock=config, motor="auto", anexos_texto=True
+    ))
+    assert resultado["completadas"] == 3
+    por_ruta = resultado["openai"]["por_ruta"]
+    # Una llamada por dimensión, sin hilos, runs ni vector store
+    assert por_ruta["POST /v1/chat/completions"] == 9
+    assert "POST /v1/threads" not in por_ruta
+    assert "POST /v1/vector_stores" not in por_ruta
+    assert resultado["openai"]["archivos_vivos"] == 0
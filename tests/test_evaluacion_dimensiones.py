@@ -0,0 +1,217 @@
+import asyncio
+import copy
+from datetime import datetime
+
+import pytest
+
+import routers.vigia as vigia
+from models import TipoAsistenteEnum
+
+
+def _valor(doc, ruta):
+    for parte in ruta.split("."):
+        doc = doc.get(parte, {}) if isinstance(doc, dict) else None
+    return doc
+
+
+class _Coleccion:
+    """Colección mínima en memoria: igualdad, $ne y $set con rutas punteadas."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.updates = []
+
+    def _coincide(self, filtro):
+        for ruta, esperado in filtro.items():
+            actual = _valor(self.doc, ruta)
+            if isinstance(esperado, dict) and "$ne" in esperado:
+                if actual == esperado["$ne"]:
+                    return False
+            elif actual != esperado:
+                return False
+        return True
+
+    async def find_one(self, filtro, proyeccion=None):
+        await asyncio.sleep(0)
+        return copy.deepcopy(self.doc) if self._coincide(filtro) else None
+
+    async def find_one_and_update(self, filtro, update, projection=None, return_document=False):
+        await asyncio.sleep(0)
+        if not self._coincide(filtro):
+            return None
+        self.updates.append(update["$set"])
+        antes = copy.deepcopy(self.doc)
+        for ruta, valor in update["$set"].items():
+            destino = self.doc
+            *padres, campo = ruta.split(".")
+            for parte in padres:
+                destino = destino.setdefault(parte, {})
+            destino[campo] = valor
+        return copy.deepcopy(self.doc) if return_document else antes
+
+    async def update_one(self, filtro, update):
+        await self.find_one_and_update(filtro, update)
+
+
+class _DB:
+    def __init__(self, doc):
+        self.Solicitud = _Coleccion(doc)
+
+
+class _Assistant:
+    assistant_id = "asst_1"
+
+    def __init__(self):
+        self.depuraciones = []
+        self.vector_stores = []
+
+    async def run_assistant_flow(self, mensaje, tipo_asistente, file_ids=None, vector_store_id=None, **kwargs):
+        await asyncio.sleep(0)
+        return {"assistant_response": f"respuesta {tipo_asistente.value}"}
+
+    async def delete_vector_store(self, vector_store_id):
+        self.vector_stores.append(vector_store_id)
+
+    async def depureFiles(self, file_ids):
+        self.depuraciones.append(file_ids)
+
+
+class _Cache:
+    def __init__(self):
+        self.liberados = []
+
+    async def liberar(self, file_ids):
+        self.liberados.append(file_ids)
+
+
+def test_tres_dimensiones_finalizan_una_sola_vez(monkeypatch):
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="pendiente", UsuarioSolicitante="ana",
+        Anexos=[{"id": "file-1", "filename": "a.pdf"}], VectorStoreID="vs-1"
+    )
+    db = _DB(solicitud.dict())
+    cache = _Cache()
+    assistant = _Assistant()
+    monkeypatch.setattr(vigia, "db", db)
+    monkeypatch.setattr(vigia, "upload_cache", cache)
+
+    async def evaluar():
+        await asyncio.gather(*(
+            vigia.procesar_solicitud_con_assistant(solicitud, solicitud.Anexos, assistant, tipo)
+            for tipo in TipoAsistenteEnum
+        ))
+
+    asyncio.run(evaluar())
+
+    doc = db.Solicitud.doc
+    assert doc["Estado"] == {"ambiental": "done", "social": "done", "economica": "done"}
+    assert doc["RespuestaSocial"] == "respuesta social"
+    assert doc["EstadoGeneral"] == "completado"
+    # Cada evaluación escribe solo sus propios campos
+    assert all("Cuestionario" not in update for update in db.Solicitud.updates)
+    assert assistant.depuraciones == [["file-1"]]
+    assert assistant.vector_stores == ["vs-1"]
+    assert cache.liberados == [["file-1"]]
+
+
+class _EvaluacionCache:
+    def __init__(self, resultados=None):
+        self.resultados = resultados or {}
+        self.guardados = []
+
+    async def buscar(self, clave):
+        return self.resultados.get(clave)
+
+    async def guardar(self, clave, assistant_id, dimension, resultado):
+        self.guardados.append((clave, dimension))
+        self.resultados[clave] = resultado
+
+
+def test_evaluacion_desde_cache(monkeypatch):
+    anexos = [{"id": "file-2", "filename": "b.pdf", "sha256": "bb"}, {"id": "file-1", "filename": "a.pdf", "sha256": "aa"}]
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="pendiente", UsuarioSolicitante="ana",
+        Anexos=anexos, Cuestionario=[
+            {"dimension": "Social", "items": [{"pregunta": 1}], "tipos": ["social"]},
+            {"dimension": "Ambiental", "items": [{"pregunta": 2}], "tipos": ["ambiental"]},
+        ]
+    )
+    resultado = [{"required_action": {"submit_tool_outputs": {}}, "assistant_response": "desde caché"}]
+    # El orden de los anexos no cambia la clave
+    texto = vigia.codificar_cuestionario([{"dimension": "Social", "items": [{"pregunta": 1}]}])
+    clave = vigia.clave_evaluacion("asst_1", "social", texto, list(reversed(anexos)))
+    cache = _EvaluacionCache({clave: resultado})
+    db = _DB(solicitud.dict())
+    assistant = _Assistant()
+
+    async def sin_llamadas(*args, **kwargs):
+        raise AssertionError("No debe llamar al asistente con un acierto de caché")
+
+    assistant.run_assistant_flow = sin_llamadas
+    monkeypatch.setattr(vigia, "db", db)
+    monkeypatch.setattr(vigia, "evaluation_cache", cache)
+
+    asyncio.run(vigia.procesar_solicitud_con_assistant(solicitud, anexos, assistant, TipoAsistenteEnum.social))
+
+    doc = db.Solicitud.doc
+    assert doc["EvaluacionSocial"] == resultado
+    assert doc["RespuestaSocial"] == "desde caché"
+    assert doc["EvaluacionDesdeCache"] == {"social": True}
+    assert cache.guardados == []
+
+
+def test_run_terminado_con_error_no_se_guarda_en_cache(monkeypatch):
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="pendiente", UsuarioSolicitante="ana"
+    )
+    cache = _EvaluacionCache()
+    assistant = _Assistant()
+
+    async def run_expirado(*args, **kwargs):
+        return {"required_action": {"submit_tool_outputs": {}}, "assistant_response": "expired"}
+
+    assistant.run_assistant_flow = run_expirado
+    monkeypatch.setattr(vigia, "db", _DB(solicitud.dict()))
+    monkeypatch.setattr(vigia, "evaluation_cache", cache)
+    monkeypatch.setattr(vigia, "EVALUATION_CACHE_ENABLED", True)
+
+    asyncio.run(vigia.procesar_solicitud_con_assistant(solicitud, [], assistant, TipoAsistenteEnum.social))
+    assert cache.guardados == []
+
+    async def run_completo(*args, **kwargs):
+        return {"required_action": {"submit_tool_outputs": {}}, "assistant_response": "ok"}
+
+    assistant.run_assistant_flow = run_completo
+    asyncio.run(vigia.procesar_solicitud_con_assistant(solicitud, [], assistant, TipoAsistenteEnum.ambiental))
+    assert [dimension for _, dimension in cache.guardados] == ["ambiental"]
+
+
+def test_evaluacion_sin_resultado_se_reintenta_en_la_cola(monkeypatch):
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="pendiente", UsuarioSolicitante="ana",
+        Estado={"ambiental": "pending"}
+    )
+    db = _DB(solicitud.dict())
+    assistant = _Assistant()
+
+    async def sin_funcion(*args, **kwargs):
+        return None
+
+    assistant.run_assistant_flow = sin_funcion
+    monkeypatch.setattr(vigia, "db", db)
+    monkeypatch.setattr(vigia, "EVALUATION_CACHE_ENABLED", False)
+
+    # Antes del último intento la dimensión sigue pendiente y la cola reintenta el job
+    with pytest.raises(vigia.EvaluacionFallida):
+        asyncio.run(vigia.procesar_solicitud_con_assistant(
+            solicitud, [], assistant, TipoAsistenteEnum.ambiental, ultimo_intento=False
+        ))
+    assert db.Solicitud.doc["Estado"]["ambiental"] == "pending"
+
+    with pytest.raises(vigia.EvaluacionFallida):
+        asyncio.run(vigia.procesar_solicitud_con_assistant(solicitud, [], assistant, TipoAsistenteEnum.ambiental))
+    assert db.Solicitud.doc["Estado"]["ambiental"] == "failed"
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import httpx
+
+import routers.vigia as vigia
+from main import app
+from services.eventos import EventBus
+
+
+class _Coleccion:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, filtro, proyeccion=None):
+        return self.doc if self.doc and filtro["SolicitudID"] == self.doc["SolicitudID"] else None
+
+
+class _DB:
+    def __init__(self, doc):
+        self.Solicitud = _Coleccion(doc)
+
+
+def _eventos(texto):
+    eventos = []
+    for bloque in texto.strip().split("\n\n"):
+        lineas = dict(linea.split(": ", 1) for linea in bloque.splitlines() if not linea.startswith(":"))
+        eventos.append((lineas["event"], json.loads(lineas["data"])))
+    return eventos
+
+
+def test_stream_de_eventos_hasta_completar(monkeypatch):
+    bus = EventBus(change_stream=False)
+    monkeypatch.setattr(vigia, "event_bus", bus)
+    monkeypatch.setattr(vigia, "db", _DB({
+        "SolicitudID": "S1", "EstadoGeneral": "En progreso",
+        "Estado": {"ambiental": "pending", "social": "pending", "economica": "pending"}
+    }))
+
+    async def flujo():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            respuesta = asyncio.create_task(client.get("/vigia/solicitud/S1/eventos"))
+            while not bus.estado()["suscriptores"]:
+                await asyncio.sleep(0.01)
+            bus.publish("S1", {"tipo": "dimension", "dimension": "social", "estado": "done", "desde_cache": False})
+            bus.publish("S1", {"tipo": "completado", "EstadoGeneral": "completado", "FechaFinalizacion": None})
+            return await respuesta
+
+    respuesta = asyncio.run(flujo())
+    assert respuesta.headers["content-type"].startswith("text/event-stream")
+    eventos = _eventos(respuesta.text)
+    assert [nombre for nombre, _ in eventos] == ["estado", "dimension", "completado"]
+    assert eventos[1][1] == {"SolicitudID": "S1", "tipo": "dimension", "dimension": "social", "estado": "done", "desde_cache": False}
+    # El suscriptor se libera al cerrar el stream
+    assert bus.estado()["suscriptores"] == 0
+
+
+def test_eventos_desde_change_stream():
+    cambio = {"updateDescription": {"updatedFields": {
+        "Estado.ambiental": "done", "EvaluacionDesdeCache.ambiental": True, "RespuestaAmbiental": "..."
+    }}}
+    assert EventBus.eventos_desde_cambio(cambio) == [
+        {"tipo": "dimension", "dimension": "ambiental", "estado": "done", "desde_cache": True}
+    ]
+
+
+def test_stream_se_cierra_si_una_dimension_falla(monkeypatch):
+    bus = EventBus(change_stream=False)
+    monkeypatch.setattr(vigia, "event_bus", bus)
+    monkeypatch.setattr(vigia, "db", _DB({
+        "SolicitudID": "S1", "EstadoGeneral": "En progreso",
+        "Estado": {"ambiental": "done", "social": "failed", "economica": "pending"}
+    }))
+
+    async def flujo():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            respuesta = asyncio.create_task(client.get("/vigia/solicitud/S1/eventos"))
+            while not bus.estado()["suscriptores"]:
+                await asyncio.sleep(0.01)
+            bus.publish("S1", {"tipo": "dimension", "dimension": "economica", "estado": "done", "desde_cache": False})
+            return await asyncio.wait_for(respuesta, timeout=5)
+
+    eventos = _eventos(asyncio.run(flujo()).text)
+    assert [nombre for nombre, _ in eventos] == ["estado", "dimension"]
+    assert bus.estado()["suscriptores"] == 0
+
+
+def test_change_stream_completado_con_puntaje():
+    cambio = {"updateDescription": {"updatedFields": {
+        "EstadoGeneral": "completado", "FechaFinalizacion": None, "PuntajeConsolidado": 82.5, "NivelGlobal": "bajo"
+    }}}
+    completado, = EventBus.eventos_desde_cambio(cambio)
+    assert completado["PuntajeConsolidado"] == 82.5
+    assert completado["NivelGlobal"] == "bajo"
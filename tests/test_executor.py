@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+import pytest
+
+import services.executor as executor
+
+
+def test_timeout_recicla_el_pool_de_procesos(monkeypatch):
+    monkeypatch.setattr(executor, "PARSE_EXECUTOR", "process")
+    monkeypatch.setattr(executor, "PARSE_WORKERS", 1)
+    executor.shutdown_executor()
+
+    async def flujo():
+        with pytest.raises(executor.ParseTimeoutError):
+            await executor.run_cpu(time.sleep, 30, timeout=1)
+        # Con un solo worker, la siguiente tarea no espera a que termine la que excedió el tiempo
+        inicio = time.monotonic()
+        resultado = await executor.run_cpu(sum, [1, 2, 3], timeout=20)
+        return resultado, time.monotonic() - inicio
+
+    try:
+        resultado, transcurrido = asyncio.run(flujo())
+    finally:
+        executor.shutdown_executor()
+    assert resultado == 6
+    assert transcurrido < 20
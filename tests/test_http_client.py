@@ -0,0 +1,28 @@
+import asyncio
+
+import httpx
+
+import services.http_client as http_client
+
+
+def test_estadisticas_sin_acceso_al_pool(monkeypatch):
+    # Un cliente sin los atributos internos de httpx no rompe el endpoint de estadísticas
+    monkeypatch.setattr(http_client, "_client", object.__new__(type("Cliente", (), {"is_closed": False})))
+    stats = http_client.http_pool_stats()
+    assert stats["activo"] is True
+    assert "conexiones" not in stats
+
+
+def test_contadores_propios_de_peticiones():
+    async def flujo():
+        await http_client.close_http_client()
+        cliente = http_client.init_http_client(transport=httpx.MockTransport(lambda r: httpx.Response(404)))
+        antes = http_client.http_pool_stats()
+        await cliente.get("http://openai.test/v1/files")
+        despues = http_client.http_pool_stats()
+        await http_client.close_http_client()
+        return antes, despues
+
+    antes, despues = asyncio.run(flujo())
+    assert despues["requests"] - antes["requests"] == 1
+    assert despues["errores_http"] - antes["errores_http"] == 1
@@ -0,0 +1,95 @@
+import asyncio
+
+import routers.vigia as vigia
+import services.job_queue as job_queue_mod
+from benchmarks.memoria_mongo import MemoriaDatabase
+from services.job_queue import CARRIL_BATCH, CARRIL_INTERACTIVO, ESTADO_COMPLETADO, ESTADO_FALLIDO, EvaluationJobQueue
+
+
+def test_reparto_justo_y_batch_con_configuracion_por_defecto():
+    # conftest.py fija VIGIA_WORKERS=0; aquí se usan los 3 workers por defecto de producción
+    queue = EvaluationJobQueue(MemoriaDatabase().EvaluacionJob, workers=3)
+    orden = []
+
+    async def handler(job):
+        orden.append((job["usuario"], job["carril"]))
+        await asyncio.sleep(0.005)
+
+    async def ejecutar():
+        # Una campaña interactiva grande de un usuario, luego una solicitud de otro y un lote
+        await queue.enqueue_many(
+            [{"SolicitudID": f"c{n}", "dimension": d, "usuario": "campaña"} for n in range(10) for d in ("a", "b", "c")],
+            carril=CARRIL_INTERACTIVO
+        )
+        await queue.enqueue_many(
+            [{"SolicitudID": "s1", "dimension": d, "usuario": "ana"} for d in ("a", "b", "c")], carril=CARRIL_INTERACTIVO
+        )
+        await queue.enqueue_many(
+            [{"SolicitudID": f"l{n}", "dimension": "a", "usuario": "luis"} for n in range(3)], carril=CARRIL_BATCH
+        )
+        profundidad = await queue.profundidad()
+        assert profundidad[CARRIL_INTERACTIVO]["en_espera"] == 33
+        assert profundidad[CARRIL_BATCH]["en_espera"] == 3
+
+        queue.start(handler)
+        async def esperar():
+            while len(orden) < 36 or queue.en_proceso:
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(esperar(), timeout=10)
+        await queue.stop()
+        return await queue.resumen()
+
+    resumen = asyncio.run(ejecutar())
+
+    interactivos = [usuario for usuario, carril in orden if carril == CARRIL_INTERACTIVO]
+    # Los tres jobs de ana se reparten con la campaña en lugar de esperar sus 30 jobs
+    assert [n for n, usuario in enumerate(interactivos) if usuario == "ana"] == [2, 4, 6]
+    # El batch avanza mientras la campaña interactiva sigue pendiente
+    assert [usuario for usuario, carril in orden[:3]].count("luis") == 1
+    assert resumen["jobs"] == {ESTADO_COMPLETADO: 36}
+    assert resumen["carriles"][CARRIL_BATCH]["en_espera"] == 0
+
+
+def test_fallo_definitivo_marca_la_dimension_y_cierra_la_solicitud(monkeypatch):
+    database = MemoriaDatabase()
+    monkeypatch.setattr(vigia, "db", database)
+    monkeypatch.setattr(job_queue_mod, "JOB_RETRY_DELAY", 0)
+    cerradas = []
+
+    async def liberar(doc, assistant):
+        cerradas.append(doc)
+
+    monkeypatch.setattr(vigia, "crear_assistant", lambda tipo: None)
+    monkeypatch.setattr(vigia, "liberar_recursos_solicitud", liberar)
+    queue = EvaluationJobQueue(database.EvaluacionJob, workers=1, max_attempts=2, poll_interval=0.01)
+    intentos = []
+
+    async def handler(job):
+        intentos.append(job["intentos"])
+        raise RuntimeError("Mongo no disponible")
+
+    async def ejecutar():
+        await database.Solicitud.insert_one({
+            "SolicitudID": "S1", "Anexos": [{"id": "file-1"}],
+            "Estado": {"ambiental": "pending", "social": "done", "economica": "failed"}
+        })
+        cola = vigia.event_bus.subscribe("S1")
+        await queue.enqueue("S1", "ambiental")
+        queue.start(handler, al_fallar=vigia.registrar_fallo_job)
+
+        async def esperar():
+            while not cerradas:
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(esperar(), timeout=10)
+        await queue.stop()
+        vigia.event_bus.unsubscribe("S1", cola)
+        return cola.get_nowait(), await database.Solicitud.find_one({"SolicitudID": "S1"}), await queue.resumen()
+
+    evento, solicitud, resumen = asyncio.run(ejecutar())
+    assert intentos == [1, 2]
+    assert solicitud["Estado"]["ambiental"] == "failed"
+    assert solicitud["RecursosLiberados"] is True
+    assert evento["dimension"] == "ambiental" and evento["estado"] == "failed"
+    assert resumen["jobs"] == {ESTADO_FALLIDO: 1}
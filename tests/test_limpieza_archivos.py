@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+import services.openai_assistant as oa
+from benchmarks.memoria_mongo import MemoriaDatabase
+from services.upload_cache import UploadCache, VARIANTE_ORIGINAL
+
+
+class _UploadCache:
+    def __init__(self, en_uso):
+        self.en_uso = set(en_uso)
+
+    async def reclamar_libres(self, file_ids):
+        return [file_id for file_id in file_ids if file_id not in self.en_uso]
+
+    async def pendientes_de_borrado(self, file_ids):
+        pass
+
+
+def _openai(archivos, page_size=2):
+    eliminados = []
+
+    def handler(request):
+        if request.method == "DELETE":
+            eliminados.append(request.url.path.rsplit("/", 1)[-1])
+            return httpx.Response(200, json={"deleted": True})
+        after = request.url.params.get("after")
+        inicio = next((i + 1 for i, a in enumerate(archivos) if a["id"] == after), 0)
+        pagina = archivos[inicio:inicio + page_size]
+        return httpx.Response(200, json={
+            "data": pagina, "has_more": inicio + page_size < len(archivos), "last_id": pagina[-1]["id"] if pagina else None
+        })
+
+    return handler, eliminados
+
+
+def test_depura_solo_archivos_sin_referencias(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    handler, eliminados = _openai([])
+
+    async def flujo():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client, upload_cache=_UploadCache(["file-b"]))
+            return await assistant.depureFiles(["file-a", "file-b", "file-c"])
+
+    assert asyncio.run(flujo()) == ["file-a", "file-c"]
+    assert sorted(eliminados) == ["file-a", "file-c"]
+
+
+def test_limpieza_solo_elimina_archivos_propios_liberados(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    monkeypatch.setattr(oa, "FILES_PAGE_SIZE", 2)
+    cache = UploadCache(MemoriaDatabase().ArchivoCache)
+    monkeypatch.setattr(oa, "RATE_LIMIT_MAX_RETRIES", 0)
+    eliminados, metodos = [], set()
+    fallan = {"file-4"}
+
+    def handler(request):
+        file_id = request.url.path.rsplit("/", 1)[-1]
+        metodos.add(request.method)
+        if file_id in fallan:
+            return httpx.Response(500)
+        eliminados.append(file_id)
+        return httpx.Response(200, json={"deleted": True})
+
+    async def flujo():
+        for n in range(1, 6):
+            await cache.registrar(f"h{n}", VARIANTE_ORIGINAL, f"file-{n}", "a.pdf", 10)
+        # file-3 sigue en uso; file-5 se liberó hace poco; el resto hace dos horas
+        await cache.liberar(["file-1", "file-2", "file-4", "file-5"])
+        await cache.collection.update_many(
+            {"file_id": {"$in": ["file-1", "file-2", "file-4"]}},
+            {"$set": {"liberado": datetime.utcnow() - timedelta(hours=2)}}
+        )
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client, upload_cache=cache)
+            primera = await assistant.depurar_archivos_huerfanos(ttl_seconds=3600)
+            # El borrado fallido queda registrado y se reintenta pasado el TTL
+            fallan.clear()
+            reintento = await assistant.depurar_archivos_huerfanos(ttl_seconds=0)
+        return primera, reintento
+
+    primera, reintento = asyncio.run(flujo())
+    # No se listan los archivos de la cuenta: solo se eliminan los liberados de la caché
+    assert metodos == {"DELETE"}
+    assert sorted(primera) == ["file-1", "file-2"]
+    assert sorted(reintento) == ["file-4", "file-5"]
+    assert "file-3" not in eliminados
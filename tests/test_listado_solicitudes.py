@@ -0,0 +1,149 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import routers.vigia as vigia
+from benchmarks.memoria_mongo import MemoriaDatabase
+from services.evaluation_store import EvaluationStore
+from main import app
+
+
+def _doc(n):
+    return {
+        "_id": ObjectId(),
+        "SolicitudID": f"S{n}",
+        "CodigoProyecto": "P1",
+        "ProveedorNombre": "Proveedor",
+        "ProveedorNIT": "900",
+        "FechaCreacion": datetime(2024, 1, 1) + timedelta(minutes=n),
+        "EstadoGeneral": "pendiente",
+        "UsuarioSolicitante": "ana",
+        "Estado": {"ambiental": "", "social": "", "economica": ""},
+    }
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, orden):
+        self.docs = sorted(self.docs, key=lambda d: (d["FechaCreacion"], d["_id"]), reverse=True)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length]
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Coleccion:
+    def __init__(self, docs):
+        self.docs = docs
+        self.llamadas = []
+
+    def find(self, filtro=None, proyeccion=None):
+        self.llamadas.append((filtro, proyeccion))
+        if proyeccion is None:
+            return _Cursor(list(self.docs))
+        return _Cursor([{k: v for k, v in d.items() if k == "_id" or k in proyeccion} for d in self.docs])
+
+
+class _DB:
+    def __init__(self, docs):
+        self.Solicitud = _Coleccion(docs)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = _DB([_doc(n) for n in range(5)])
+    monkeypatch.setattr(vigia, "db", db)
+    return db
+
+
+def test_cursor_ida_y_vuelta():
+    doc = _doc(1)
+    assert vigia.decodificar_cursor(vigia.codificar_cursor(doc)) == (doc["FechaCreacion"], doc["_id"])
+    with pytest.raises(HTTPException):
+        vigia.decodificar_cursor("no-es-un-cursor")
+
+
+def test_proyeccion_rechaza_campos_desconocidos():
+    assert "RespuestaSocial" in vigia.proyeccion_listado("RespuestaSocial")
+    assert "CuestionarioAmbiental" not in vigia.proyeccion_listado(None)
+    with pytest.raises(HTTPException):
+        vigia.proyeccion_listado("NoExiste")
+
+
+def test_listado_paginado(fake_db):
+    with TestClient(app) as client:
+        pagina = client.get("/vigia/solicitudes/pagina", params={"limite": 2, "estado": "pendiente"}).json()
+    assert [s["SolicitudID"] for s in pagina["items"]] == ["S4", "S3"]
+    filtro, proyeccion = fake_db.Solicitud.llamadas[0]
+    assert filtro == {"EstadoGeneral": "pendiente"}
+    assert "Cuestionario" not in proyeccion
+    fecha, oid = vigia.decodificar_cursor(pagina["siguiente_cursor"])
+    assert (fecha, oid) == (fake_db.Solicitud.docs[3]["FechaCreacion"], fake_db.Solicitud.docs[3]["_id"])
+
+
+def test_listado_conserva_la_lista_completa(fake_db):
+    with TestClient(app) as client:
+        solicitudes = client.get("/vigia/solicitudes").json()
+    assert isinstance(solicitudes, list)
+    assert [s["SolicitudID"] for s in solicitudes] == ["S0", "S1", "S2", "S3", "S4"]
+    assert solicitudes[0]["ProveedorNIT"] == "900"
+
+
+def test_exportacion_ndjson(fake_db):
+    with TestClient(app) as client:
+        respuesta = client.get("/vigia/solicitudes/export")
+    assert respuesta.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(l) for l in respuesta.text.splitlines()]
+    assert [l["SolicitudID"] for l in lineas] == ["S4", "S3", "S2", "S1", "S0"]
+
+
+def test_listado_y_actualizacion_con_evaluaciones_externas(monkeypatch):
+    database = MemoriaDatabase()
+    store = EvaluationStore(database.EvaluacionDetalle, max_inline_bytes=200)
+    monkeypatch.setattr(vigia, "db", database)
+    monkeypatch.setattr(vigia, "evaluation_store", store)
+    evaluacion = [{"assistant_response": "x" * 500}]
+
+    async def flujo():
+        doc = {**_doc(1), "RecursosLiberados": True}
+        campos, externa = await store.separar("S1", "social", {"EvaluacionSocial": evaluacion, "RespuestaSocial": "ok"})
+        await database.Solicitud.insert_one({**doc, **campos, "EvaluacionExterna": {"social": externa}})
+        listado = await vigia.list_solicitudes()
+
+        editada = listado[0].model_copy(update={"RespuestaSocial": "editada", "EvaluacionAmbiental": evaluacion})
+        await vigia.update_solicitud("S1", editada)
+        guardado = await database.Solicitud.find_one({"SolicitudID": "S1"})
+        return listado, guardado, await vigia.get_solicitud("S1")
+
+    listado, guardado, leida = asyncio.run(flujo())
+    assert listado[0].EvaluacionSocial == evaluacion
+    # Los campos fuera del modelo se conservan y las evaluaciones grandes siguen fuera del documento
+    assert guardado["RecursosLiberados"] is True
+    assert guardado["EvaluacionAmbiental"] is None and guardado["EvaluacionExterna"] == {
+        "ambiental": True, "social": True, "economica": False
+    }
+    assert leida.RespuestaSocial == "editada" and leida.EvaluacionAmbiental == evaluacion
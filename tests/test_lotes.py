@@ -0,0 +1,138 @@
+import asyncio
+import json
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+from fastapi import UploadFile
+from pymongo.errors import BulkWriteError
+
+import routers.vigia as vigia
+from benchmarks.memoria_mongo import MemoriaDatabase
+from services.lotes import leer_manifiesto, abrir_miembro, ManifiestoError
+
+
+def _zip(archivos):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for nombre, contenido in archivos.items():
+            zf.writestr(nombre, contenido)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def test_manifiesto_valida_entradas():
+    manifiesto = [
+        {"CodigoProyecto": "P1", "ProveedorNombre": "A", "ProveedorNIT": "1", "excel": "a/cuestionario.xlsx", "anexos": ["a/rut.pdf"]},
+        {"CodigoProyecto": "P1", "ProveedorNombre": "B", "ProveedorNIT": "2", "excel": "b/cuestionario.xlsx"},
+        {"CodigoProyecto": "P1", "ProveedorNombre": "C", "excel": "a/cuestionario.xlsx"},
+    ]
+    zf = _zip({
+        "manifest.json": json.dumps(manifiesto),
+        "a/cuestionario.xlsx": b"xlsx",
+        "a/rut.pdf": b"pdf",
+    })
+    validas, errores = leer_manifiesto(zf)
+    assert [e["ProveedorNombre"] for e in validas] == ["A"]
+    assert [e["indice"] for e in errores] == [1, 2]
+    assert "b/cuestionario.xlsx" in errores[0]["error"]
+    assert "ProveedorNIT" in errores[1]["error"]
+
+    anexo = abrir_miembro(zf, "a/rut.pdf")
+    assert anexo.filename == "rut.pdf"
+    assert anexo.file.read() == b"pdf"
+
+
+def test_zip_sin_manifiesto():
+    with pytest.raises(ManifiestoError):
+        leer_manifiesto(_zip({"otro.json": "[]"}))
+
+
+def _solicitud(nombre):
+    return vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre=nombre, ProveedorNIT="1", UsuarioSolicitante="ana",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="En progreso",
+        Anexos=[{"id": f"file-{nombre}", "filename": "rut.pdf"}]
+    )
+
+
+def test_lote_responde_antes_de_preparar_las_entradas(monkeypatch):
+    database = MemoriaDatabase()
+    monkeypatch.setattr(vigia, "db", database)
+    monkeypatch.setattr(vigia.job_queue, "collection", database.EvaluacionJob)
+    manifiesto = [
+        {"CodigoProyecto": "P1", "ProveedorNombre": n, "ProveedorNIT": "1", "excel": f"{n}.xlsx"} for n in ("A", "B")
+    ]
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("manifest.json", json.dumps(manifiesto))
+        zf.writestr("A.xlsx", b"xlsx")
+        zf.writestr("B.xlsx", b"xlsx")
+    buffer.seek(0)
+
+    async def flujo():
+        continuar = asyncio.Event()
+
+        async def extraer(excel):
+            await continuar.wait()
+            return []
+
+        async def preparar(cuestionario, anexos, **datos):
+            return _solicitud(datos["ProveedorNombre"]).model_copy(update={"LoteID": datos["LoteID"]})
+
+        monkeypatch.setattr(vigia, "extraer_cuestionario_json_str", extraer)
+        monkeypatch.setattr(vigia, "preparar_solicitud", preparar)
+        respuesta = await vigia.create_solicitudes_batch(UploadFile(file=buffer, filename="lote.zip"), "ana")
+        en_curso = await vigia.get_lote_progreso(respuesta.LoteID)
+        continuar.set()
+        await asyncio.gather(*vigia.tareas_lote)
+        return respuesta, en_curso, await vigia.get_lote_progreso(respuesta.LoteID)
+
+    respuesta, en_curso, final = asyncio.run(flujo())
+    assert respuesta.EstadoLote == vigia.LOTE_PREPARANDO and respuesta.creadas == []
+    assert en_curso.EstadoLote == vigia.LOTE_PREPARANDO and en_curso.total == 0
+    assert final.EstadoLote == vigia.LOTE_LISTO and final.total == 2
+
+
+def test_insert_fallido_libera_los_anexos_subidos(monkeypatch):
+    class _Solicitudes:
+        async def insert_many(self, docs, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "duplicate key"}]})
+
+    liberadas = []
+
+    async def liberar(doc, assistant):
+        liberadas.append(doc["SolicitudID"])
+
+    monkeypatch.setattr(vigia, "db", type("DB", (), {"Solicitud": _Solicitudes()})())
+    monkeypatch.setattr(vigia, "crear_assistant", lambda tipo: None)
+    monkeypatch.setattr(vigia, "liberar_recursos_solicitud", liberar)
+    preparadas = [({"indice": 0}, _solicitud("A")), ({"indice": 3}, _solicitud("B"))]
+    errores = []
+
+    guardadas = asyncio.run(vigia.insertar_solicitudes_lote(preparadas, errores))
+    assert guardadas == [preparadas[0][1]]
+    assert liberadas == [preparadas[1][1].SolicitudID]
+    assert [e["indice"] for e in errores] == [3]
+
+
+def test_zip_invalido_elimina_el_temporal(monkeypatch, tmp_path):
+    rutas = []
+
+    def copiar(origen):
+        ruta = tmp_path / f"lote-{len(rutas)}.zip"
+        origen.seek(0)
+        ruta.write_bytes(origen.read())
+        rutas.append(ruta)
+        return str(ruta)
+
+    monkeypatch.setattr(vigia, "copiar_a_temporal", copiar)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("otro.json", "[]")
+    for contenido in (BytesIO(b"no es un zip"), buffer):
+        with pytest.raises(vigia.HTTPException) as error:
+            asyncio.run(vigia.create_solicitudes_batch(UploadFile(file=contenido, filename="lote.zip"), "ana"))
+        assert error.value.status_code == 422
+    assert len(rutas) == 2 and not any(ruta.exists() for ruta in rutas)
@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+
+import services.openai_assistant as oa
+from main import app
+from services.metricas import Registro, medir, endpoint_openai, OPENAI_REQUEST_SEGUNDOS, OPENAI_REINTENTOS
+
+
+def test_exposicion_formato_prometheus():
+    registro = Registro()
+    contador = registro.contador("prueba_total", "Contador de prueba")
+    histograma = registro.histograma("prueba_seconds", "Histograma de prueba", buckets=(0.1, 1))
+    registro.gauge("prueba_gauge", "Gauge de prueba", lambda: 3)
+    contador.inc(tipo="a")
+    contador.inc(2, tipo="a")
+    histograma.observar(0.05, fase="x")
+    histograma.observar(0.5, fase="x")
+    histograma.observar(5, fase="x")
+
+    texto = registro.exponer()
+    assert "# TYPE prueba_total counter" in texto
+    assert 'prueba_total{tipo="a"} 3' in texto
+    assert 'prueba_seconds_bucket{fase="x",le="0.1"} 1' in texto
+    assert 'prueba_seconds_bucket{fase="x",le="1"} 2' in texto
+    assert 'prueba_seconds_bucket{fase="x",le="+Inf"} 3' in texto
+    assert 'prueba_seconds_count{fase="x"} 3' in texto
+    assert "prueba_gauge 3" in texto
+
+
+def test_medir_registra_errores():
+    registro = Registro()
+    histograma = registro.histograma("fase_seconds", "Fases")
+    with medir(histograma, fase="ok"):
+        pass
+    with pytest.raises(ValueError):
+        with medir(histograma, fase="falla"):
+            raise ValueError("x")
+    assert histograma.conteo(fase="ok", resultado="ok") == 1
+    assert histograma.conteo(fase="falla", resultado="error") == 1
+
+
+def test_endpoint_openai_sin_identificadores():
+    url = "https://api.openai.com/v1/threads/thread_abc123/runs/run_XYZ/submit_tool_outputs"
+    assert endpoint_openai(url) == "/threads/{id}/runs/{id}/submit_tool_outputs"
+    assert endpoint_openai("https://api.openai.com/v1/files?purpose=assistants") == "/files"
+
+
+def test_request_mide_endpoint_y_reintentos(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter(rpm=6000, tpm=1_000_000))
+    monkeypatch.setattr(oa, "RATE_LIMIT_BACKOFF_BASE", 0.001)
+    respuestas = iter([httpx.Response(429, headers={"retry-after-ms": "1"}), httpx.Response(200, json={"id": "thread_1"})])
+    antes_429 = OPENAI_REQUEST_SEGUNDOS.conteo(endpoint="/threads", metodo="POST", status="429")
+    antes_reintentos = OPENAI_REINTENTOS.valor(endpoint="/threads", motivo="429")
+
+    async def flujo():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(respuestas))) as client:
+            return await oa.OpenAIAssistant("sk-test", "asst_1", client=client).create_thread()
+
+    assert asyncio.run(flujo()) == "thread_1"
+    assert OPENAI_REQUEST_SEGUNDOS.conteo(endpoint="/threads", metodo="POST", status="429") == antes_429 + 1
+    assert OPENAI_REQUEST_SEGUNDOS.conteo(endpoint="/threads", metodo="POST", status="200") >= 1
+    assert OPENAI_REINTENTOS.valor(endpoint="/threads", motivo="429") == antes_reintentos + 1
+
+
+def test_endpoint_metrics():
+    async def consultar():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://vigia") as client:
+            return await client.get("/metrics")
+
+    respuesta = asyncio.run(consultar())
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE vigia_fase_seconds histogram" in respuesta.text
+    assert "vigia_jobs_en_proceso 0" in respuesta.text
@@ -0,0 +1,20 @@
+from services.mongo_indexes import resumir_explain
+
+
+def test_detecta_collscan():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "LIMIT", "inputStage": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+    }}, "executionStats": {"totalDocsExamined": 1000}}
+    fila = resumir_explain("listado", explain)
+    assert fila["collscan"] and fila["sort_en_memoria"]
+    assert fila["etapas"] == ["LIMIT", "SORT", "COLLSCAN"]
+    assert fila["docs_examinados"] == 1000
+
+
+def test_plan_con_indice():
+    explain = {"queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "solicitud_id_unico"}
+    }}}}
+    fila = resumir_explain("solicitud_por_id", explain)
+    assert not fila["collscan"]
+    assert fila["indices"] == ["solicitud_id_unico"]
@@ -0,0 +1,73 @@
+import asyncio
+import importlib
+
+import services.motor_evaluacion as motor_evaluacion
+from benchmarks.memoria_mongo import MemoriaDatabase
+from models import TipoAsistenteEnum
+from services.anexo_textos import AnexoTextStore
+from services.motor_evaluacion import MOTOR_ASSISTANTS, MOTOR_COMPLETIONS, elegir_motor
+
+FUNCION = {"tools": [{"type": "function", "function": {"name": "registrar_evaluacion"}}]}
+
+
+def test_enrutamiento_automatico(monkeypatch):
+    monkeypatch.setattr(motor_evaluacion, "MOTOR_EVALUACION", "auto")
+    monkeypatch.setattr(motor_evaluacion, "FAST_PATH_MAX_ANEXOS", 2)
+    monkeypatch.setattr(motor_evaluacion, "FAST_PATH_MAX_BYTES", 100)
+    texto = {"id": "file-1", "filename": "a.txt", "texto": "x" * 40}
+    social = TipoAsistenteEnum.social
+
+    assert elegir_motor(social, [], FUNCION) == MOTOR_COMPLETIONS
+    assert elegir_motor(social, [texto, texto], FUNCION) == MOTOR_COMPLETIONS
+    # Demasiados anexos, demasiado texto o un anexo sin texto (PDF) van por Assistants
+    assert elegir_motor(social, [texto] * 3, FUNCION) == MOTOR_ASSISTANTS
+    assert elegir_motor(social, [{**texto, "texto": "x" * 101}], FUNCION) == MOTOR_ASSISTANTS
+    assert elegir_motor(social, [texto, {"id": "file-2", "filename": "b.pdf"}], FUNCION) == MOTOR_ASSISTANTS
+    # Sin definición, o con conocimiento propio del asistente, auto conserva Assistants
+    assert elegir_motor(social, []) == MOTOR_ASSISTANTS
+    assert elegir_motor(social, [], {"tools": FUNCION["tools"] + [{"type": "file_search"}]}) == MOTOR_ASSISTANTS
+    assert elegir_motor(social, [], {**FUNCION, "tool_resources": {"code_interpreter": {"file_ids": ["file-9"]}}}) == MOTOR_ASSISTANTS
+    assert elegir_motor(social, [], {**FUNCION, "tool_resources": {"file_search": {"vector_store_ids": []}}}) == MOTOR_COMPLETIONS
+
+
+def test_motor_por_defecto_es_assistants(monkeypatch):
+    monkeypatch.delenv("VIGIA_MOTOR_EVALUACION", raising=False)
+    recargado = importlib.reload(motor_evaluacion)
+    try:
+        assert recargado.MOTOR_EVALUACION == MOTOR_ASSISTANTS
+        assert recargado.elegir_motor(TipoAsistenteEnum.social, [], FUNCION) == MOTOR_ASSISTANTS
+    finally:
+        importlib.reload(motor_evaluacion)
+
+
+def test_motor_por_dimension(monkeypatch):
+    monkeypatch.setattr(motor_evaluacion, "MOTOR_EVALUACION", "completions")
+    monkeypatch.setenv("VIGIA_MOTOR_EVALUACION_AMBIENTAL", "assistants")
+    pdf = {"id": "file-1", "filename": "a.pdf"}
+
+    assert elegir_motor(TipoAsistenteEnum.ambiental, []) == MOTOR_ASSISTANTS
+    assert elegir_motor(TipoAsistenteEnum.social, []) == MOTOR_COMPLETIONS
+    # Forzado a completions pero con anexos que no caben en el mensaje
+    assert elegir_motor(TipoAsistenteEnum.social, [pdf]) == MOTOR_ASSISTANTS
+
+
+def test_texto_de_anexos_fuera_de_la_solicitud():
+    textos = AnexoTextStore(MemoriaDatabase().AnexoTexto)
+    anexos = [{"id": "file-1", "filename": "a.txt", "sha256": "aa", "texto": "hola"}]
+    pdf = {"id": "file-2", "filename": "b.pdf", "sha256": "bb"}
+
+    async def flujo():
+        await textos.guardar(anexos)
+        guardados = [{k: v for k, v in a.items() if k != "texto"} for a in anexos]
+        return await textos.hidratar(guardados), await textos.hidratar(guardados + [pdf])
+
+    hidratados, con_pdf = asyncio.run(flujo())
+    assert hidratados == anexos
+    # Con un anexo que no es de texto no hay fast path y no se consulta
+    assert "texto" not in con_pdf[0]
+
+
+def test_motor_desconocido_usa_assistants(monkeypatch):
+    monkeypatch.setenv("VIGIA_MOTOR_EVALUACION_SOCIAL", "complitions")
+    assert motor_evaluacion.motor_configurado(TipoAsistenteEnum.social) == MOTOR_ASSISTANTS
+    assert elegir_motor(TipoAsistenteEnum.social, [], FUNCION) == MOTOR_ASSISTANTS
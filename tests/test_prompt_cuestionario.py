@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime
+
+import routers.vigia as vigia
+from models import TipoAsistenteEnum
+from services.prompt_cuestionario import (
+    MISMO_ANTERIOR, PresupuestoTokensExcedido, codificar_cuestionario, contar_tokens, verificar_presupuesto
+)
+
+SOPORTE = "Certificado de gestión ambiental vigente expedido por la autoridad competente"
+GRUPOS = [{
+    "dimension": "Ambiental",
+    "tipos": ["ambiental"],
+    "items": [
+        {"criterio": "Agua", "pregunta": "¿Mide el consumo?", "soporte": SOPORTE, "nota": None},
+        {"criterio": "Agua", "pregunta": "¿Trata los vertimientos? | Sí/No", "soporte": "Registro", "nota": float("nan")},
+        {"criterio": "Residuos", "pregunta": "¿Separa\nen la fuente?", "soporte": SOPORTE, "nota": None},
+    ],
+}]
+
+
+def test_tabla_con_encabezado_y_deduplicacion():
+    tabla = codificar_cuestionario(GRUPOS, formato="tabla")
+    lineas = tabla.splitlines()
+    assert lineas[1:3] == ["Textos:", f"[T1] {SOPORTE}"]
+    # Columnas vacías (nota) y el campo interno tipos no se envían
+    assert lineas[3] == "dimension|criterio|pregunta|soporte"
+    assert lineas[4] == "Ambiental|Agua|¿Mide el consumo?|[T1]"
+    assert lineas[5] == f"{MISMO_ANTERIOR}|{MISMO_ANTERIOR}|¿Trata los vertimientos? / Sí/No|Registro"
+    assert lineas[6] == f"{MISMO_ANTERIOR}|Residuos|¿Separa en la fuente?|[T1]"
+    assert contar_tokens(tabla) < contar_tokens(codificar_cuestionario(GRUPOS, formato="json"))
+
+
+def test_presupuesto():
+    assert verificar_presupuesto("uno dos tres", 0) == contar_tokens("uno dos tres")
+    try:
+        verificar_presupuesto("palabra " * 50, 10)
+    except PresupuestoTokensExcedido as e:
+        assert e.tokens > 10 and e.presupuesto == 10
+    else:
+        raise AssertionError("Debe exceder el presupuesto")
+
+
+def test_dimension_fuera_de_presupuesto_no_crea_runs(monkeypatch):
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900",
+        FechaCreacion=datetime.utcnow(), EstadoGeneral="pendiente", UsuarioSolicitante="ana", Cuestionario=GRUPOS
+    )
+    actualizaciones = []
+
+    class Coleccion:
+        async def find_one_and_update(self, filtro, update, **kwargs):
+            actualizaciones.append(update["$set"])
+            return None
+
+    class Assistant:
+        assistant_id = "asst_1"
+
+        async def run_assistant_flow(self, *args, **kwargs):
+            raise AssertionError("No debe crear runs por encima del presupuesto")
+
+    class DB:
+        Solicitud = Coleccion()
+
+    monkeypatch.setattr(vigia, "db", DB())
+    monkeypatch.setattr(vigia, "PROMPT_TOKEN_BUDGET", 20)
+    monkeypatch.setattr(vigia, "EVALUATION_CACHE_ENABLED", False)
+
+    asyncio.run(vigia.procesar_solicitud_con_assistant(solicitud, [], Assistant(), TipoAsistenteEnum.ambiental))
+
+    assert actualizaciones[0]["Estado.ambiental"] == "failed"
+    assert "presupuesto es 20" in actualizaciones[0]["RespuestaAmbiental"]
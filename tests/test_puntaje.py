@@ -0,0 +1,112 @@
+import json
+from io import BytesIO
+
+from openpyxl import Workbook
+
+from services.cuestionario_parser import parsear_cuestionario
+import services.puntaje as puntaje_mod
+from services.puntaje import campos_puntaje, puntuar_lote, puntuar_solicitud
+
+CUESTIONARIO = [
+    {
+        "dimension": "Ambiental", "tipos": ["ambiental"],
+        "items": [{"criterio": "A1", "pregunta_principal": "¿Tiene política ambiental?"},
+                  {"criterio": "A2", "pregunta_principal": "¿Mide su huella?"}],
+        "pesos": {"puntaje_respuesta": ["5", "Sí=3 / No=0"], "peso_criterio": ["0,2", "0.8"], "peso_dimension": ["30%", "30%"]},
+    },
+    {
+        "dimension": "Social", "tipos": ["social"],
+        "items": [{"criterio": "S1", "pregunta_principal": "¿Cumple SST?"}],
+        "pesos": {"puntaje_respuesta": ["5"], "peso_criterio": ["1"], "peso_dimension": ["40%"]},
+    },
+]
+
+
+def _evaluacion(argumentos):
+    return [{"required_action": {"submit_tool_outputs": {"tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "registrar_evaluacion", "arguments": json.dumps(argumentos)}}
+    ]}}, "assistant_response": "ok"}]
+
+
+def _solicitud():
+    return {
+        "Cuestionario": CUESTIONARIO,
+        # A1 se identifica por código y A2 por el texto de la pregunta
+        "EvaluacionAmbiental": _evaluacion({"criterios": [
+            {"criterio": "a1", "calificacion": 5}, {"pregunta": "¿Mide  su huella?", "calificacion": "1,5"}
+        ]}),
+        # Sin calificaciones por criterio: se usa el puntaje de la dimensión
+        "EvaluacionSocial": _evaluacion({"puntaje": 50, "observaciones": "..."}),
+        "EvaluacionEconomica": None,
+    }
+
+
+def test_puntaje_ponderado_por_criterio_y_dimension():
+    puntaje = puntuar_solicitud(_solicitud())
+    # Ambiental: (0.2*5 + 0.8*1.5) / (0.2*5 + 0.8*3) = 2.2 / 3.4
+    assert puntaje["PuntajeDimension"] == {"ambiental": 64.71, "social": 50.0, "economica": None}
+    assert puntaje["PuntajeConsolidado"] == round((2.2 / 3.4 * 100 * 30 + 50 * 40) / 70, 2)
+    assert puntaje["NivelGlobal"] == "medio"
+
+
+def test_lote_y_solicitud_sin_evaluaciones():
+    resultado = puntuar_lote([_solicitud()] * 500 + [{"Cuestionario": CUESTIONARIO}])
+    assert (resultado["PuntajeConsolidado"].iloc[:500] == resultado["PuntajeConsolidado"].iloc[0]).all()
+    # El cálculo por lote y el de una sola solicitud coinciden
+    assert campos_puntaje(resultado.iloc[0]) == puntuar_solicitud(_solicitud())
+    assert campos_puntaje(resultado.iloc[500]) == puntuar_solicitud({"Cuestionario": CUESTIONARIO})
+    vacia = resultado.iloc[500]
+    assert vacia.isna()["PuntajeConsolidado"] and vacia["NivelGlobal"] is None
+
+
+def test_campos_de_calificacion_configurables(monkeypatch):
+    monkeypatch.setattr(puntaje_mod, "CAMPOS_CLAVE", ("codigo",))
+    monkeypatch.setattr(puntaje_mod, "CAMPOS_CALIFICACION", ("valor",))
+    doc = {
+        "Cuestionario": CUESTIONARIO[1:],
+        "EvaluacionSocial": _evaluacion({"items": [{"codigo": "S1", "valor": 4, "calificacion": 0}]}),
+    }
+    assert puntuar_solicitud(doc)["PuntajeDimension"]["social"] == 80.0
+
+
+def test_parser_conserva_pesos_fuera_de_los_items():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Cuestionario"
+    for col, encabezado in enumerate(["Dimensión", "Criterio", "Puntaje respuesta", "Peso criterio", "Peso dimensión"], start=1):
+        ws.cell(row=4, column=col, value=encabezado)
+    for fila, valores in enumerate([["Ambiental", "A1", 5, 0.2, "30%"], ["Ambiental", "A2", 3, 0.8, "30%"]], start=5):
+        for col, valor in enumerate(valores, start=1):
+            ws.cell(row=fila, column=col, value=valor)
+    buffer = BytesIO()
+    wb.save(buffer)
+
+    grupos = parsear_cuestionario(BytesIO(buffer.getvalue()), pesos=True)
+    assert grupos[0]["items"] == [{"criterio": "A1"}, {"criterio": "A2"}]
+    assert grupos[0]["pesos"] == {"puntaje_respuesta": ["5", "3"], "peso_criterio": ["0.2", "0.8"], "peso_dimension": ["30%", "30%"]}
+
+
+def test_opciones_separadas_por_coma_y_pesos_cero():
+    assert puntaje_mod._numeros(["0,1,2,3", "0;1;2;3", "1,5 / 3,5", "0,25"], maximo=True).tolist() == [3.0, 3.0, 3.5, 0.25]
+    cuestionario = [
+        {
+            "dimension": "Ambiental", "tipos": ["ambiental"],
+            "items": [{"criterio": "A1"}, {"criterio": "A2"}],
+            # A2 tiene peso 0 en la hoja: no cuenta aunque el asistente lo califique
+            "pesos": {"puntaje_respuesta": ["0,1,2,3", "0,1,2,3"], "peso_criterio": ["1", "0"], "peso_dimension": ["1", "1"]},
+        },
+        {
+            "dimension": "Social", "tipos": ["social"],
+            "items": [{"criterio": "S1"}],
+            "pesos": {"puntaje_respuesta": ["5"], "peso_criterio": ["1"], "peso_dimension": ["0"]},
+        },
+    ]
+    doc = {
+        "Cuestionario": cuestionario,
+        "EvaluacionAmbiental": _evaluacion({"criterios": [{"criterio": "A1", "calificacion": 3}, {"criterio": "A2", "calificacion": 0}]}),
+        "EvaluacionSocial": _evaluacion({"criterios": [{"criterio": "S1", "calificacion": 0}]}),
+    }
+    puntaje = puntuar_solicitud(doc)
+    assert puntaje["PuntajeDimension"]["ambiental"] == 100.0
+    # Social (peso de dimensión 0) no entra en el consolidado
+    assert puntaje["PuntajeConsolidado"] == 100.0
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import httpx
+
+import services.openai_assistant as oa
+
+
+def test_segundos_reset():
+    assert oa._segundos_reset("20ms") == 0.02
+    assert oa._segundos_reset("6m0s") == 360
+    assert oa._segundos_reset("1h2m3.5s") == 3723.5
+    assert oa._segundos_reset("2") == 2
+    assert oa._segundos_reset(None) is None
+
+
+def test_reintenta_429_y_ajusta_cuota(monkeypatch):
+    limiter = oa.RateLimiter(rpm=600, tpm=100000)
+    monkeypatch.setattr(oa, "rate_limiter", limiter)
+    monkeypatch.setattr(oa, "RATE_LIMIT_BACKOFF_BASE", 0.001)
+    llamadas = []
+
+    def handler(request):
+        llamadas.append(request)
+        if len(llamadas) == 1:
+            return httpx.Response(429, headers={"retry-after-ms": "10"}, json={"error": "rate_limit"})
+        return httpx.Response(200, headers={
+            "x-ratelimit-limit-requests": "60",
+            "x-ratelimit-remaining-requests": "59",
+            "x-ratelimit-limit-tokens": "1000",
+            "x-ratelimit-remaining-tokens": "900",
+        }, json={"id": "thread_1"})
+
+    async def flujo():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client)
+            return await assistant.create_thread()
+
+    assert asyncio.run(flujo()) == "thread_1"
+    assert len(llamadas) == 2
+    estado = limiter.estado()
+    assert estado["respuestas_429"] == 1
+    assert estado["reintentos"] == 1
+    assert estado["requests"]["limite_por_minuto"] == 60
+    assert estado["tokens"]["disponibles"] < 901
+
+
+def test_no_reintenta_post_con_error_de_servidor(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    llamadas = []
+
+    def handler(request):
+        llamadas.append(request)
+        return httpx.Response(500, json={"error": "server"})
+
+    async def flujo():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client)
+            return await assistant._request("POST", "https://api.openai.com/v1/threads", json={})
+
+    assert asyncio.run(flujo()).status_code == 500
+    assert len(llamadas) == 1
+
+
+def test_peticion_grande_en_espera_no_bloquea_las_baratas():
+    # 600 tokens por minuto: 10 por segundo
+    limiter = oa.RateLimiter(rpm=600, tpm=600)
+
+    async def flujo():
+        await limiter.acquire(600)
+        grande = asyncio.create_task(limiter.acquire(600))
+        await asyncio.sleep(0)
+        # Un poll de un run solo espera su propio token, no los 60 s de la petición grande
+        inicio = time.monotonic()
+        await asyncio.wait_for(limiter.acquire(1), timeout=2)
+        transcurrido = time.monotonic() - inicio
+        terminada = grande.done()
+        grande.cancel()
+        return transcurrido, terminada
+
+    transcurrido, terminada = asyncio.run(flujo())
+    assert transcurrido < 1
+    assert not terminada
+
+
+def test_reservas_de_peticiones_en_orden_de_llegada():
+    bucket = oa.TokenBucket(60)
+    bucket.tokens = 0
+    # Una petición por segundo: cada reserva espera detrás de la anterior
+    esperas = [bucket.reservar(1) for _ in range(3)]
+    assert [round(e) for e in esperas] == [1, 2, 3]
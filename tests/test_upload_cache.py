@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime
+from io import BytesIO
+
+import httpx
+import pytest
+from fastapi import UploadFile
+
+import routers.vigia as vigia
+import services.openai_assistant as oa
+from benchmarks.memoria_mongo import MemoriaDatabase
+from models import TipoAsistenteEnum
+from services.upload_cache import UploadCache, VARIANTE_ORIGINAL
+
+
+def test_anexo_duplicado_libera_todas_sus_referencias():
+    cache = UploadCache(MemoriaDatabase().ArchivoCache)
+
+    async def flujo():
+        # El mismo contenido anexado dos veces en una solicitud y una vez en otra
+        file_id = await cache.registrar("aa", VARIANTE_ORIGINAL, "file-1", "a.pdf", 10)
+        await cache.buscar("aa", VARIANTE_ORIGINAL)
+        await cache.buscar("aa", VARIANTE_ORIGINAL)
+        await cache.liberar([file_id, file_id])
+        en_uso = await cache.reclamar_libres([file_id])
+        await cache.liberar([file_id])
+        return en_uso, await cache.reclamar_libres([file_id])
+
+    en_uso, libres = asyncio.run(flujo())
+    assert en_uso == []
+    assert libres == ["file-1"]
+
+
+class _Assistant:
+    assistant_id = "asst_1"
+
+    def __init__(self):
+        self.depuraciones = []
+
+    async def run_assistant_flow(self, *args, **kwargs):
+        return None
+
+    async def delete_vector_store(self, vector_store_id):
+        pass
+
+    async def depureFiles(self, file_ids):
+        self.depuraciones.append(list(file_ids))
+
+
+def _solicitud_con_anexo(database, cache, **campos):
+    solicitud = vigia.SolicitudModel(
+        CodigoProyecto="P1", ProveedorNombre="Proveedor", ProveedorNIT="900", EstadoGeneral="pendiente", FechaCreacion=datetime.utcnow(),
+        UsuarioSolicitante="ana", Anexos=[{"id": "file-1", "filename": "a.pdf"}], **campos
+    )
+
+    async def insertar():
+        await cache.registrar("aa", VARIANTE_ORIGINAL, "file-1", "a.pdf", 10)
+        await database.Solicitud.insert_one(solicitud.dict())
+
+    asyncio.run(insertar())
+    return solicitud
+
+
+def test_solicitud_fallida_o_borrada_libera_sus_anexos(monkeypatch):
+    database = MemoriaDatabase()
+    monkeypatch.setattr(vigia, "db", database)
+    monkeypatch.setattr(vigia.upload_cache, "collection", database.ArchivoCache)
+    monkeypatch.setattr(vigia.evaluation_store, "collection", database.EvaluacionDetalle)
+    monkeypatch.setattr(vigia, "EVALUATION_CACHE_ENABLED", False)
+    assistant = _Assistant()
+    monkeypatch.setattr(vigia, "crear_assistant", lambda tipo: assistant)
+
+    # La última dimensión falla en su último intento: la solicitud no se completará
+    fallida = _solicitud_con_anexo(
+        database, vigia.upload_cache, Estado={"ambiental": "done", "social": "done", "economica": ""}
+    )
+    with pytest.raises(vigia.EvaluacionFallida):
+        asyncio.run(vigia.procesar_solicitud_con_assistant(fallida, fallida.Anexos, assistant, TipoAsistenteEnum.economica))
+    assert assistant.depuraciones == [["file-1"]]
+    assert asyncio.run(vigia.upload_cache.reclamar_libres(["file-1"])) == ["file-1"]
+
+    # Borrarla después no libera de nuevo; borrar una pendiente sí libera
+    asyncio.run(vigia.delete_solicitud(fallida.SolicitudID))
+    pendiente = _solicitud_con_anexo(database, vigia.upload_cache)
+    asyncio.run(vigia.delete_solicitud(pendiente.SolicitudID))
+    assert assistant.depuraciones == [["file-1"], ["file-1"]]
+    assert asyncio.run(vigia.upload_cache.reclamar_libres(["file-1"])) == ["file-1"]
+
+
+def test_archivo_eliminado_en_openai_se_vuelve_a_subir(monkeypatch):
+    monkeypatch.setattr(oa, "rate_limiter", oa.RateLimiter())
+    cache = UploadCache(MemoriaDatabase().ArchivoCache)
+    vivos = set()
+    subidas = []
+
+    def handler(request):
+        if request.method == "POST" and request.url.path == "/v1/files":
+            file_id = f"file-{len(subidas) + 1}"
+            subidas.append(file_id)
+            vivos.add(file_id)
+            return httpx.Response(200, json={"id": file_id})
+        if request.method == "GET":
+            file_id = request.url.path.rsplit("/", 1)[-1]
+            return httpx.Response(200 if file_id in vivos else 404, json={"id": file_id})
+        if request.url.path == "/v1/vector_stores":
+            return httpx.Response(400, json={"error": {"message": "File file-2 is not a valid file"}})
+        return httpx.Response(500)
+
+    async def flujo():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assistant = oa.OpenAIAssistant("sk-test", "asst_1", client=client, upload_cache=cache)
+
+            def anexo():
+                return UploadFile(file=BytesIO(b"%PDF contenido"), filename="rut.pdf")
+
+            primera = await assistant.upload_file_from_formdata_v2(anexo(), "rut.pdf")
+            vivos.clear()  # eliminado en OpenAI fuera de la aplicación
+            segunda = await assistant.upload_file_from_formdata_v2(anexo(), "rut.pdf")
+            # Un id rechazado al crear el vector store también sale de la caché
+            with pytest.raises(httpx.HTTPStatusError):
+                await assistant.create_vector_store([segunda["id"]], name="s")
+            return primera, segunda, await cache.collection.find_one({})
+
+    primera, segunda, entrada = asyncio.run(flujo())
+    assert (primera["id"], segunda["id"]) == ("file-1", "file-2")
+    assert entrada is None